@@ -1,98 +1,29 @@
-from bs4 import BeautifulSoup
-import requests
-from urllib.parse import urlparse
-from openai import OpenAI
 import gradio as gr
 import time
-import json
 import os
-import uuid
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-import logging
+from crawler import DEFAULT_MAX_PAGES, crawl_site
+from scraper import scrape_multiple_urls
+from kb_store import combine_pages, split_combined_content
+from sessions import compact_history, history_with_summary
+from widget import embed_snippet
+from engine import bot_registry, chat_about_website, create_chatbot_endpoint, logger, start_background
 
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+# === Your Sarthi dashboard ===
+# The Gradio app for creating, testing and embedding bots. The bot API
+# doesn't need it: bot_server.py and bot_api.py serve bots from engine.py
+# alone, without loading Gradio.
 
-# === Gemini API Setup ===
-gemini_api_key = "gen_key"  
+# === Streaming settings ===
+UI_UPDATE_INTERVAL = 0.1  # Seconds between Gradio chat updates
 
-gemini_llm_model = OpenAI(
-    api_key=gemini_api_key,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-)
-
-# === Function to scrape website content ===
-def scrape_page(url):
-    try:
-        print(f"[INFO] Scraping: {url}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, "html.parser")
-        return soup.get_text(separator="\n", strip=True)
-    except Exception as e:
-        return f"[ERROR] Failed to fetch page content: {e}"
-
-# === Function to scrape multiple URLs ===
-def scrape_multiple_urls(urls):
-    combined_content = ""
-    for url in urls:
-        url = url.strip()
-        if url:  # Skip empty URLs
-            content = scrape_page(url)
-            if not content.startswith("[ERROR]"):
-                combined_content += f"\n--- Content from {url} ---\n"
-                combined_content += content
-                combined_content += "\n\n"
-    
-    if not combined_content:
-        return "[ERROR] Failed to fetch content from any of the provided URLs"
-    
-    return combined_content
-
-# === Function to talk to Gemini using streamed output ===
-def chat_about_website(page_text, prompt, custom_prompt, history):
-    if not page_text or "Failed" in page_text:
-        yield "[ERROR] Cannot respond due to scraping failure."
-        return
-
-    # Use custom prompt if provided, otherwise use default
-    if custom_prompt:
-        system_content = f"{custom_prompt}\n\nWebsite content:\n{page_text[:4000]}..."
-    else:
-        system_content = f"You are an AI assistant that answers questions based on this website's content:\n\n{page_text[:4000]}..."
-    
-    system_message = {
-        "role": "system",
-        "content": system_content
-    }
-    
-    # Convert history from Gradio format to API format
-    api_messages = []
-    if history:
-        for msg in history:
-            if isinstance(msg, dict) and "role" in msg and "content" in msg:
-                if msg["role"] in ["user", "assistant"]:  # Only include user and assistant messages
-                    api_messages.append({"role": msg["role"], "content": msg["content"]})
-    
-    user_message = {"role": "user", "content": prompt}
-    full_messages = [system_message] + api_messages + [user_message]
-
-    try:
-        response = gemini_llm_model.chat.completions.create(
-            messages=full_messages,
-            model="gemini-1.5-flash",
-            stream=True
-        )
-
-        output = ""
-        for chunk in response:
-            if chunk.choices and chunk.choices[0].delta:
-                token = chunk.choices[0].delta.content
-                output += token
-                yield output
-    except Exception as e:
-        yield f"[ERROR] Gemini API failed: {e}"
+# === My Chatbots tab settings ===
+CHATBOTS_PAGE_SIZE = 10
+CHATBOTS_SORTS = {
+    "Newest first": ("created_at", True),
+    "Oldest first": ("created_at", False),
+    "Name (A-Z)": ("name", False),
+    "Name (Z-A)": ("name", True),
+}
 
 # === Chatbot Interface for Testing ===
 def test_chat_interface(prompt, history, website_content, custom_prompt):
@@ -101,215 +32,47 @@ def test_chat_interface(prompt, history, website_content, custom_prompt):
     # Add the current user message to the history
     chat_history.append({"role": "user", "content": prompt})
     
-    # Get the response generator
-    response_generator = chat_about_website(website_content, prompt, custom_prompt, history)
-    
-    # For each update from the generator
-    for response in response_generator:
-        # Create or update the assistant message
-        if len(chat_history) > 0 and chat_history[-1].get("role") == "assistant":
-            # Update existing assistant message
-            chat_history[-1]["content"] = response
-        else:
-            # Add new assistant message
-            chat_history.append({"role": "assistant", "content": response})
-        
-        # Yield the entire conversation history for each update
-        yield chat_history
-
-# === Function to create chatbot endpoint ===
-def create_chatbot_endpoint(bot_name, bot_description, urls, custom_prompt):
-    # Generate a unique ID for this chatbot
-    bot_id = str(uuid.uuid4())[:8]
-    
-    # Create a directory to store chatbot data
-    if not os.path.exists("chatbots"):
-        os.makedirs("chatbots")
+    # Long test chats are compacted the same way as widget sessions
+    summary, recent = compact_history(history)
     
-    # Save the chatbot configuration
-    config = {
-        "id": bot_id,
-        "name": bot_name,
-        "description": bot_description,
-        "urls": urls,
-        "custom_prompt": custom_prompt,
-        "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
-    }
+    # Get the response generator (new tokens only)
+    response_generator = chat_about_website(website_content, prompt, custom_prompt,
+                                            history_with_summary(summary, recent), delta=True)
     
-    with open(f"chatbots/{bot_id}.json", "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2)
+    assistant_message = None
+    parts = []
+    last_update = 0.0
+    for token in response_generator:
+        if token.startswith("[ERROR]"):
+            parts = [token]
+        else:
+            parts.append(token)
+        
+        # Add the assistant message on the first token
+        if assistant_message is None:
+            assistant_message = {"role": "assistant", "content": ""}
+            chat_history.append(assistant_message)
+        
+        # Coalesce tokens so the frontend gets a few updates per second, not one per token
+        now = time.monotonic()
+        if now - last_update >= UI_UPDATE_INTERVAL:
+            last_update = now
+            assistant_message["content"] = "".join(parts)
+            yield chat_history
     
-    # Return the bot ID for embedding
-    return bot_id
+    if assistant_message is not None:
+        assistant_message["content"] = "".join(parts)
+    yield chat_history
 
 # === Function to create HTML embed code ===
 def create_embed_code(bot_name, bot_id, base_url):
     # Change this line to use the Flask server port
     api_url = base_url.replace(":7864", ":7865")
     
-    embed_code = f"""
-<!-- {bot_name} Chatbot Widget -->
-<div id="chatbot-container" style="position: fixed; bottom: 20px; right: 20px; z-index: 1000;">
-    <!-- Chat Button -->
-    <div id="chat-button" style="background-color: #4a76fd; color: white; border-radius: 50%; width: 60px; height: 60px; 
-                                 display: flex; justify-content: center; align-items: center; cursor: pointer; box-shadow: 0 4px 8px rgba(0,0,0,0.2);">
-        <svg xmlns="http://www.w3.org/2000/svg" width="30" height="30" fill="currentColor" viewBox="0 0 16 16">
-            <path d="M8 15c4.418 0 8-3.134 8-7s-3.582-7-8-7-8 3.134-8 7c0 1.76.743 3.37 1.97 4.6-.097 1.016-.417 2.13-.771 2.966-.079.186.074.394.273.362 2.256-.37 3.597-.938 4.18-1.234A9.06 9.06 0 0 0 8 15z"/>
-        </svg>
-    </div>
-    
-    <!-- Chat Window (hidden by default) -->
-    <div id="chat-window" style="display: none; position: absolute; bottom: 80px; right: 0; width: 350px; height: 450px; 
-                                 background-color: white; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.2); 
-                                 overflow: hidden; flex-direction: column;">
-        <!-- Header -->
-        <div style="background-color: #4a76fd; color: white; padding: 15px; display: flex; justify-content: space-between; align-items: center;">
-            <div>{bot_name}</div>
-            <div id="close-chat" style="cursor: pointer;">✖</div>
-        </div>
-        
-        <!-- Messages Area -->
-        <div id="chat-messages" style="flex-grow: 1; overflow-y: auto; padding: 15px; display: flex; flex-direction: column;"></div>
-        
-        <!-- Input Area -->
-        <div style="padding: 15px; border-top: 1px solid #e0e0e0; display: flex;">
-            <input id="chat-input" type="text" placeholder="Type your message..." 
-                   style="flex-grow: 1; padding: 10px; border: 1px solid #e0e0e0; border-radius: 20px; margin-right: 10px;">
-            <button id="send-button" style="background-color: #4a76fd; color: white; border: none; border-radius: 50%; width: 40px; height: 40px; cursor: pointer;">
-                <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" viewBox="0 0 16 16">
-                    <path d="M15.854.146a.5.5 0 0 1 .11.54l-5.819 14.547a.75.75 0 0 1-1.329.124l-3.178-4.995L.643 7.184a.75.75 0 0 1 .124-1.33L15.314.037a.5.5 0 0 1 .54.11v-.001z"/>
-                </svg>
-            </button>
-        </div>
-    </div>
-</div>
-
-<script>
-    // Chatbot functionality
-    (function() {{
-        // Elements
-        const chatButton = document.getElementById('chat-button');
-        const chatWindow = document.getElementById('chat-window');
-        const closeChat = document.getElementById('close-chat');
-        const chatMessages = document.getElementById('chat-messages');
-        const chatInput = document.getElementById('chat-input');
-        const sendButton = document.getElementById('send-button');
-        
-        // Bot configuration
-        const botId = '{bot_id}';
-        const botEndpoint = '{api_url}/bot/{bot_id}';  // Use the Flask server URL
-        const botName = '{bot_name}';
-        
-        // Chat history
-        let messageHistory = [];
-        
-        // Toggle chat window
-        chatButton.addEventListener('click', () => {{
-            chatWindow.style.display = 'flex';
-            chatButton.style.display = 'none';
-        }});
-        
-        closeChat.addEventListener('click', () => {{
-            chatWindow.style.display = 'none';
-            chatButton.style.display = 'flex';
-        }});
-        
-        // Add a message to the chat
-        function addMessage(content, isUser) {{
-            const messageDiv = document.createElement('div');
-            messageDiv.style.alignSelf = isUser ? 'flex-end' : 'flex-start';
-            messageDiv.style.maxWidth = '70%';
-            messageDiv.style.marginBottom = '10px';
-            
-            const bubble = document.createElement('div');
-            bubble.style.padding = '10px 15px';
-            bubble.style.borderRadius = '18px';
-            bubble.style.backgroundColor = isUser ? '#dcf8c6' : '#f1f0f0';
-            bubble.style.boxShadow = '0 1px 2px rgba(0,0,0,0.1)';
-            bubble.textContent = content;
-            
-            messageDiv.appendChild(bubble);
-            chatMessages.appendChild(messageDiv);
-            chatMessages.scrollTop = chatMessages.scrollHeight;
-            
-            // Add to history
-            if (isUser) {{
-                messageHistory.push({{role: "user", content: content}});
-            }} else {{
-                messageHistory.push({{role: "assistant", content: content}});
-            }}
-        }}
-        
-        // Send message
-        function sendMessage() {{
-            const message = chatInput.value.trim();
-            if (!message) return;
-            
-            // Add user message
-            addMessage(message, true);
-            chatInput.value = '';
-            
-            // Show typing indicator
-            const typingDiv = document.createElement('div');
-            typingDiv.style.alignSelf = 'flex-start';
-            typingDiv.style.maxWidth = '70%';
-            typingDiv.style.marginBottom = '10px';
-            typingDiv.id = 'typing-indicator';
-            
-            const typingBubble = document.createElement('div');
-            typingBubble.style.padding = '10px 15px';
-            typingBubble.style.borderRadius = '18px';
-            typingBubble.style.backgroundColor = '#f1f0f0';
-            typingBubble.style.boxShadow = '0 1px 2px rgba(0,0,0,0.1)';
-            typingBubble.textContent = 'Typing...';
-            
-            typingDiv.appendChild(typingBubble);
-            chatMessages.appendChild(typingDiv);
-            chatMessages.scrollTop = chatMessages.scrollHeight;
-            
-            // In a real implementation, you would call your API here
-            fetch(botEndpoint, {{
-                method: 'POST',
-                headers: {{
-                    'Content-Type': 'application/json',
-                }},
-                body: JSON.stringify({{
-                    message: message,
-                    history: messageHistory
-                }})
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                // Remove typing indicator
-                chatMessages.removeChild(document.getElementById('typing-indicator'));
-                
-                // Add bot response
-                addMessage(data.response, false);
-            }})
-            .catch(error => {{
-                // Remove typing indicator
-                chatMessages.removeChild(document.getElementById('typing-indicator'));
-                
-                // Add error message
-                addMessage("Sorry, there was an error connecting to the server. Please try again later.", false);
-                console.error('Error:', error);
-            }});
-        }}
-        
-        // Event listeners
-        sendButton.addEventListener('click', sendMessage);
-        chatInput.addEventListener('keypress', (e) => {{
-            if (e.key === 'Enter') sendMessage();
-        }});
-        
-        // Add initial message
-        setTimeout(() => {{
-            addMessage(`Hello! I'm your {bot_name} assistant. How can I help you today?`, false);
-        }}, 500);
-    }})();
-</script>
-"""
-    return embed_code
+    # A one-line script tag: the widget (static/widget.js) is served by the
+    # bot API with long-lived caching, so fixes reach every page without
+    # customers changing their embed code
+    return embed_snippet(bot_id, api_url, bot_name)
 
 # === Gradio Interface ===
 with gr.Blocks(title="Your Sarthi") as demo:
@@ -338,25 +101,50 @@ with gr.Blocks(title="Your Sarthi") as demo:
                     lines=5
                 )
         
+        with gr.Row():
+            crawl_mode = gr.Checkbox(label="Crawl the whole site starting from these URLs", value=False)
+            crawl_max_pages = gr.Slider(label="Max pages to crawl", minimum=5, maximum=500, step=5, value=DEFAULT_MAX_PAGES)
+        
         scrape_btn = gr.Button("Scrape Websites & Build Knowledge Base")
         scrape_status = gr.Markdown("") 
         website_content = gr.State()
         
         # Function to scrape websites and build knowledge base
-        def build_knowledge_base(urls_text):
+        def build_knowledge_base(urls_text, crawl=False, max_pages=DEFAULT_MAX_PAGES):
             urls = [url.strip() for url in urls_text.split("\n") if url.strip()]
             if not urls:
-                return "Please enter at least one valid URL", None
+                yield "Please enter at least one valid URL", None
+                return
             
-            content = scrape_multiple_urls(urls)
-            if content.startswith("[ERROR]"):
-                return f"Failed to build knowledge base: {content}", None
+            if not crawl:
+                content = scrape_multiple_urls(urls)
+                if content.startswith("[ERROR]"):
+                    yield f"Failed to build knowledge base: {content}", None
+                    return
+                
+                yield f"✅ Successfully scraped {len(urls)} website(s). Knowledge base built with {len(content)} characters.", content
+                return
             
-            return f"✅ Successfully scraped {len(urls)} website(s). Knowledge base built with {len(content)} characters.", content
+            # Crawl mode: stream progress into the status Markdown
+            yield f"🔎 Crawling from {len(urls)} seed URL(s)...", None
+            for event in crawl_site(urls, max_pages=int(max_pages)):
+                if not event["done"]:
+                    if event.get("error"):
+                        continue
+                    yield (f"🔎 Crawled {event['fetched']} page(s), {event['queued']} queued, "
+                           f"{event['bytes'] // 1024} KB so far. Last: {event['url']}"), None
+                    continue
+                
+                if not event["pages"]:
+                    yield "Failed to build knowledge base: no pages could be crawled", None
+                    return
+                content = combine_pages(event["pages"])
+                yield (f"✅ Crawled {len(event['pages'])} page(s) in {event['elapsed']:.1f}s. "
+                       f"Knowledge base built with {len(content)} characters."), content
         
         scrape_btn.click(
             fn=build_knowledge_base,
-            inputs=[urls_input],
+            inputs=[urls_input, crawl_mode, crawl_max_pages],
             outputs=[scrape_status, website_content]
         )
         
@@ -382,16 +170,18 @@ with gr.Blocks(title="Your Sarthi") as demo:
         
         gr.Markdown("## Get Embed Code")
         
+        build_faq = gr.Checkbox(label="Precompute answers to common visitor questions (uses extra LLM calls)", value=False)
         create_btn = gr.Button("Buy Now Your Sarthi")
         create_status = gr.Markdown("")
         
         # Instead of using a Group as output, use a Checkbox to control visibility
         embed_code_visibility = gr.Checkbox(visible=False, label="")  # Hidden checkbox to control visibility
-        embed_code_output = gr.Code(label="Embed Code", language="html", lines=20, visible=False)
+        embed_code_output = gr.Code(label="Embed Code", language="html", lines=3, visible=False)
         chatbot_url = gr.Markdown(visible=False)
 
         # Modified function to return values for actual components
-        def create_chatbot_handler(bot_name, bot_description, urls_text, custom_prompt, website_content):
+        def create_chatbot_handler(bot_name, bot_description, urls_text, custom_prompt, website_content, crawl=False,
+                                   faq=False):
             if not bot_name:
                 return "Please enter a name for your chatbot", False, "", False
             
@@ -404,7 +194,13 @@ with gr.Blocks(title="Your Sarthi") as demo:
             
             try:
                 # Create chatbot endpoint
-                bot_id = create_chatbot_endpoint(bot_name, bot_description, urls, custom_prompt)
+                crawl_seeds = None
+                if crawl:
+                    # The bot serves every crawled page, the typed URLs are kept as seeds
+                    crawl_seeds = urls
+                    urls = [url for url, _ in split_combined_content(website_content)]
+                bot_id = create_chatbot_endpoint(bot_name, bot_description, urls, custom_prompt, website_content, crawl_seeds,
+                                                 build_faq=faq)
                 
                 # Get the base URL of the current Gradio instance
                 server_port = demo.server_port if hasattr(demo, 'server_port') else 7864  # Changed from 7860
@@ -415,8 +211,9 @@ with gr.Blocks(title="Your Sarthi") as demo:
                 
                 chatbot_direct_url = f"{base_url}/bot/{bot_id}"
                 
+                faq_note = "\n\nAnswers to common questions are being prepared in the background." if faq else ""
                 return (
-                    f"✅ Chatbot created successfully! ID: {bot_id}\n\nEmbed the code below on your website:",
+                    f"✅ Chatbot created successfully! ID: {bot_id}{faq_note}\n\nEmbed the code below on your website:",
                     True,  # Set checkbox to True to show components
                     embed_code,  # The actual code content 
                     f"Direct URL: [{chatbot_direct_url}]({chatbot_direct_url})"
@@ -427,58 +224,78 @@ with gr.Blocks(title="Your Sarthi") as demo:
         # Connect the button to update component visibility directly
         create_btn.click(
             fn=create_chatbot_handler,
-            inputs=[bot_name, bot_description, urls_input, custom_prompt, website_content],
+            inputs=[bot_name, bot_description, urls_input, custom_prompt, website_content, crawl_mode, build_faq],
             outputs=[create_status, embed_code_visibility, embed_code_output, chatbot_url]
         )
     
     with gr.Tab("My Chatbots"):
         gr.Markdown("## Your Chatbots")
         
-        refresh_btn = gr.Button("Refresh Chatbot List")
+        with gr.Row():
+            chatbots_search = gr.Textbox(label="Search", placeholder="Name or description")
+            chatbots_sort = gr.Dropdown(label="Sort", choices=list(CHATBOTS_SORTS), value="Newest first")
+            chatbots_page = gr.Number(label="Page", value=1, precision=0, minimum=1)
+            refresh_btn = gr.Button("Refresh Chatbot List")
         chatbots_list = gr.Dataframe(
             headers=["ID", "Name", "Description", "Created At", "URL"],
             datatype=["str", "str", "str", "str", "str"],
-            row_count=10
+            row_count=CHATBOTS_PAGE_SIZE
         )
-        
-        # Function to refresh chatbot list
-        def refresh_chatbots():
-            if not os.path.exists("chatbots"):
-                return []
+        chatbots_summary = gr.Markdown("")
+        
+        # Function to refresh chatbot list (one page of search results at a time)
+        def refresh_chatbots(page=1, query="", sort_label="Newest first"):
+            page = max(1, int(page or 1))
+            sort, descending = CHATBOTS_SORTS.get(sort_label, CHATBOTS_SORTS["Newest first"])
+            configs, total = bot_registry.list(
+                offset=(page - 1) * CHATBOTS_PAGE_SIZE, limit=CHATBOTS_PAGE_SIZE,
+                query=query, sort=sort, descending=descending,
+            )
             
             chatbots = []
             server_port = demo.server_port if hasattr(demo, 'server_port') else 7860
             base_url = f"http://127.0.0.1:{server_port}"
             
-            for filename in os.listdir("chatbots"):
-                if filename.endswith(".json"):
-                    with open(os.path.join("chatbots", filename), "r", encoding="utf-8") as f:
-                        config = json.load(f)
-                        bot_id = config.get("id")
-                        # Make the ID a clickable link for easy copying
-                        bot_id_link = f"<a href='#' onclick='navigator.clipboard.writeText(\"{bot_id}\"); return false;'>{bot_id}</a>"
-                        bot_url = f"{base_url}/bot/{bot_id}"
-                        chatbots.append([
-                            bot_id_link,  # Changed to HTML link
-                            config.get("name"),
-                            config.get("description"),
-                            config.get("created_at"),
-                            bot_url
-                        ])
+            for config in configs:
+                bot_id = config.get("id")
+                # Make the ID a clickable link for easy copying
+                bot_id_link = f"<a href='#' onclick='navigator.clipboard.writeText(\"{bot_id}\"); return false;'>{bot_id}</a>"
+                bot_url = f"{base_url}/bot/{bot_id}"
+                chatbots.append([
+                    bot_id_link,  # Changed to HTML link
+                    config.get("name"),
+                    config.get("description"),
+                    config.get("created_at"),
+                    bot_url
+                ])
             
-            return chatbots
+            pages = max(1, -(-total // CHATBOTS_PAGE_SIZE))
+            return chatbots, f"Page {page} of {pages} ({total} chatbots)"
         
+        chatbots_query = [chatbots_page, chatbots_search, chatbots_sort]
         refresh_btn.click(
             fn=refresh_chatbots,
-            inputs=[],
-            outputs=[chatbots_list]
+            inputs=chatbots_query,
+            outputs=[chatbots_list, chatbots_summary]
         )
+        chatbots_page.change(
+            fn=refresh_chatbots,
+            inputs=chatbots_query,
+            outputs=[chatbots_list, chatbots_summary]
+        )
+        # A new search or sort starts again from the first page
+        for control in (chatbots_search, chatbots_sort):
+            control.change(
+                fn=lambda query, sort_label: (1, *refresh_chatbots(1, query, sort_label)),
+                inputs=[chatbots_search, chatbots_sort],
+                outputs=[chatbots_page, chatbots_list, chatbots_summary]
+            )
         
         # Load chatbots on tab open
         demo.load(
             fn=refresh_chatbots,
             inputs=[],
-            outputs=[chatbots_list]
+            outputs=[chatbots_list, chatbots_summary]
         )
 
 # Create necessary directories
@@ -493,105 +310,20 @@ if not os.path.exists("default_icon.png"):
     except:
         pass
 
-# === Function to handle bot API requests ===
-def bot_handler(request, bot_id: str):
-    logger.debug(f"BOT HANDLER CALLED: bot_id={bot_id}, method={request.method}")
-    try:
-        # Print debug information
-        print(f"[DEBUG] Received request for bot: {bot_id}")
-        print(f"[DEBUG] Request method: {request.method}")
-        
-        # Load bot configuration
-        config_path = os.path.join("chatbots", f"{bot_id}.json")
-        
-        if not os.path.exists(config_path):
-            print(f"[ERROR] Bot file not found: {config_path}")
-            return {"error": "Bot not found"}
-        
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = json.load(f)
-            print(f"[DEBUG] Loaded config for bot: {config.get('name')}")
-        
-        # Get request data
-        if request.method == "GET":
-            print(f"[DEBUG] Handling GET request for bot: {bot_id}")
-            return {"id": bot_id, "name": config.get("name"), "description": config.get("description")}
-        
-        # Handle chat request
-        if request.method == "POST":
-            try:
-                # Parse request body
-                request_json = request.json()
-                message = request_json.get("message", "")
-                history = request_json.get("history", [])
-                
-                print(f"[DEBUG] Handling POST request. Message: {message[:30]}...")
-                
-                # Get website content from the config
-                urls = config.get("urls", [])
-                custom_prompt = config.get("custom_prompt", "")
-                
-                # Scrape website content
-                print(f"[DEBUG] Scraping URLs: {urls}")
-                website_content = scrape_multiple_urls(urls)
-                
-                # Process with Gemini
-                print(f"[DEBUG] Processing with Gemini")
-                response = ""
-                for chunk in chat_about_website(website_content, message, custom_prompt, history):
-                    response = chunk
-                
-                print(f"[DEBUG] Got response: {response[:30]}...")
-                return {"response": response}
-            except Exception as e:
-                print(f"[ERROR] Error processing POST request: {str(e)}")
-                return {"error": f"Error processing request: {str(e)}"}
-        
-        return {"error": "Method not allowed"}
-    
-    except Exception as e:
-        print(f"[ERROR] Bot handler error: {str(e)}")
-        return {"error": str(e)}
-
-# Alternative approach using mount
-
 if __name__ == "__main__":
     print("[INFO] Starting Your Sarthi...")
-    logger.debug("Registering routes...")
-    
-    from fastapi import FastAPI
-    api_app = FastAPI()
-    
-    @api_app.get("/test")
-    async def test_route():
-        return {"status": "API is working!"}
     
-    @api_app.get("/simplebot/{bot_id}")
-    async def simple_bot(bot_id: str):
-        return {"message": f"Bot {bot_id} exists!"}
-    
-    @api_app.get("/bot/{bot_id}")
-    async def get_bot(bot_id: str, request: Request):
-        logger.debug(f"GET request received for bot: {bot_id}")
-        return bot_handler(request, bot_id)
-        
-    @api_app.post("/bot/{bot_id}")
-    async def post_bot(bot_id: str, request: Request):
-        logger.debug(f"POST request received for bot: {bot_id}")
-        return bot_handler(request, bot_id)
-    
-    # Add CORS middleware
-    api_app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-    )
+    # The bot API routes come from bot_api.py (imported here so that
+    # importing this module doesn't load FastAPI's app and routes)
+    from bot_api import app as api_app
     
     # Mount our API app to the Gradio app
     demo.app.mount("/", api_app)
     
+    # The mounted API's startup hook doesn't run under Gradio: start the
+    # knowledge base refresher and the metrics flusher here
+    start_background()
+    
     # Launch Gradio
     logger.debug("Launching Gradio app...")
     demo.launch(debug=True, server_port=7864)
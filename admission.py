@@ -0,0 +1,215 @@
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from telemetry import describe, get_logger, inc
+
+logger = get_logger("admission")
+describe("sarthi_admission_rejected_total", "counter", "Bot requests turned away before any work was done")
+
+# === Admission settings ===
+# Per-bot defaults; a bot's config may override them with
+# "quota": {"rate": ..., "burst": ..., "weight": ..., "max_in_flight": ...}
+# A rate of 0 means no rate limit.
+BOT_RATE = float(os.environ.get("SARTHI_BOT_RATE", "5"))  # Messages per second, sustained
+BOT_BURST = float(os.environ.get("SARTHI_BOT_BURST", "30"))  # Messages allowed at once after a quiet spell
+BOT_WEIGHT = 1.0  # Share of the LLM slots while several bots are queued
+MAX_IN_FLIGHT_PER_BOT = int(os.environ.get("SARTHI_BOT_MAX_IN_FLIGHT", "32"))  # Replies being worked on
+MAX_TRACKED_BOTS = 10000  # Buckets kept in memory; a full bucket can be dropped and recreated
+
+
+def bot_quota(config):
+    quota = config.get("quota") or {}
+    return {
+        "rate": float(quota.get("rate", BOT_RATE)),
+        "burst": float(quota.get("burst", BOT_BURST)),
+        "weight": float(quota.get("weight", BOT_WEIGHT)),
+        "max_in_flight": int(quota.get("max_in_flight", MAX_IN_FLIGHT_PER_BOT)),
+    }
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        # Returns 0 if a token was taken, else the seconds until one is available
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+# === A streamed reply's events, holding its admission ===
+# Releases exactly once: when the stream ends or fails, when the server
+# closes it, or when it is dropped without ever being read (the client went
+# away before the response started). Works as a sync or an async iterator,
+# like the events it wraps.
+class AdmittedStream:
+    def __init__(self, controller, bot_id, events):
+        self._controller = controller
+        self._bot_id = bot_id
+        self._events = events
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._controller.release(self._bot_id)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._events)
+        except BaseException:
+            self._release()
+            raise
+
+    def close(self):
+        try:
+            if hasattr(self._events, "close"):
+                self._events.close()
+        finally:
+            self._release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._events.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    async def aclose(self):
+        try:
+            if hasattr(self._events, "aclose"):
+                await self._events.aclose()
+        finally:
+            self._release()
+
+    def __del__(self):
+        self._release()
+
+
+# === Admission control in front of /bot/<bot_id> ===
+# Decides before any scraping or LLM work whether a message is taken:
+#   429 when the bot is over its own quota (token bucket), already has
+#       max_in_flight replies being worked on, or has too many LLM calls
+#       queued, so one busy customer site can't take every worker's slots
+#   503 when the LLM gateway is saturated overall or its circuit is open
+# Both carry Retry-After. Replies that are admitted then share the LLM
+# slots through the gateway's weighted fair queue. Limits are per worker
+# process: servers with several workers divide them (see share()).
+class AdmissionController:
+    def __init__(self, gateway=None, max_tracked=MAX_TRACKED_BOTS):
+        self.gateway = gateway
+        self.max_tracked = max_tracked
+        self.workers = 1
+        self._buckets = OrderedDict()  # bot_id -> TokenBucket, least recently used first
+        self._in_flight = Counter()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = Counter()
+
+    def share(self, workers):
+        # Each of `workers` processes enforces its part of every bot's quota
+        self.workers = max(int(workers), 1)
+
+    def _bucket(self, bot_id, rate, burst, now):
+        bucket = self._buckets.get(bot_id)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+            self._buckets[bot_id] = bucket
+            self._evict(now, keep=bot_id)
+        else:
+            self._buckets.move_to_end(bot_id)
+            bucket.rate, bucket.burst = rate, burst
+        return bucket
+
+    def _evict(self, now, keep=None):
+        # Only bots that are idle and back to a full bucket are forgotten;
+        # busy ones are skipped, in at most one pass from the least recently used
+        excess = len(self._buckets) - self.max_tracked
+        evictable = []
+        for bot_id, bucket in self._buckets.items():
+            if len(evictable) >= excess:
+                break
+            bucket.refill(now)
+            if bot_id != keep and bucket.tokens >= bucket.burst and not self._in_flight[bot_id]:
+                evictable.append(bot_id)
+        for bot_id in evictable:
+            del self._buckets[bot_id]
+
+    def _reject(self, bot_id, status, reason, message, retry_after):
+        self.rejected[reason] += 1
+        inc("sarthi_admission_rejected_total", reason=reason)
+        logger.debug("Rejected message for bot %s: %s", bot_id, reason)
+        return {"status": status, "error": message, "retry_after": retry_after_header(retry_after)}
+
+    def admit(self, bot_id, config):
+        # Returns None when the message is taken (call release() once the
+        # reply is done), else a rejection {"status", "error", "retry_after"}
+        quota = bot_quota(config)
+        now = time.monotonic()
+        with self._lock:
+            max_in_flight = max(quota["max_in_flight"] // self.workers, 1)
+            if self._in_flight[bot_id] >= max_in_flight:
+                return self._reject(bot_id, 429, "bot_concurrency",
+                                    "Too many conversations with this bot at once, please retry shortly", 1)
+            bucket = None
+            if quota["rate"] > 0:
+                bucket = self._bucket(bot_id, quota["rate"] / self.workers,
+                                      max(quota["burst"] / self.workers, 1), now)
+                wait = bucket.take(now)
+                if wait:
+                    return self._reject(bot_id, 429, "bot_rate", "Too many messages for this bot, please slow down",
+                                        wait)
+            overloaded = self.gateway.overloaded(bot_id) if self.gateway is not None else None
+            if overloaded:
+                reason, retry_after = overloaded
+                if reason == "tenant_busy":
+                    return self._reject(bot_id, 429, reason, "Too many questions for this bot right now", retry_after)
+                if bucket is not None:
+                    bucket.tokens += 1  # Not this bot's fault: give the token back
+                return self._reject(bot_id, 503, reason, "Server is busy, please try again shortly", retry_after)
+            self._in_flight[bot_id] += 1
+            self.admitted += 1
+        return None
+
+    def release(self, bot_id):
+        with self._lock:
+            self._in_flight[bot_id] -= 1
+            if self._in_flight[bot_id] <= 0:
+                del self._in_flight[bot_id]
+
+    def guarded(self, bot_id, events):
+        # A streamed reply holds its admission until the stream is done
+        return AdmittedStream(self, bot_id, events)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "in_flight": sum(self._in_flight.values()),
+                "tracked_bots": len(self._buckets),
+            }
@@ -0,0 +1,245 @@
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from retrieval import tokenize
+from telemetry import get_logger
+
+logger = get_logger("answer_cache")
+
+# === Answer cache settings ===
+MAX_ENTRIES = 5000  # Across all bots
+MAX_ENTRIES_PER_BOT = 200  # Bounds the near-duplicate scan
+DEFAULT_TTL = 60 * 60
+SIMILARITY_THRESHOLD = 0.9  # Cosine similarity for near-duplicate questions
+MAX_HISTORY_MESSAGES = 2  # Only cache answers for fresh or very short chats
+
+def normalize_question(question):
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+def _cosine(a, b):
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    if not dot:
+        return 0.0
+    norm_a = math.sqrt(sum(count * count for count in a.values()))
+    norm_b = math.sqrt(sum(count * count for count in b.values()))
+    return dot / (norm_a * norm_b)
+
+
+# === Per-bot answer cache ===
+# Answers are keyed on (bot_id, knowledge base version, normalized question),
+# so any change to the bot's content makes its old answers unreachable. A
+# question that is not an exact match can still hit when its term vector is
+# close enough to a cached question of the same bot.
+class AnswerCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_entries_per_bot=MAX_ENTRIES_PER_BOT, ttl=DEFAULT_TTL,
+                 similarity_threshold=SIMILARITY_THRESHOLD, max_history=MAX_HISTORY_MESSAGES):
+        self.max_entries = max_entries
+        self.max_entries_per_bot = max_entries_per_bot
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.max_history = max_history
+        self._entries = OrderedDict()  # (bot_id, version, question) -> entry
+        self._per_bot = {}  # (bot_id, version) -> OrderedDict of questions
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def cacheable(self, history):
+        return len(history or []) <= self.max_history
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        bot_key = key[:2]
+        questions = self._per_bot.get(bot_key)
+        if questions is not None:
+            questions.pop(key[2], None)
+            if not questions:
+                del self._per_bot[bot_key]
+
+    def _expired(self, entry, now):
+        return now - entry["created_at"] > self.ttl
+
+    def get(self, bot_id, version, question, history=None):
+        if not self.cacheable(history):
+            return None
+        normalized = normalize_question(question)
+        key = (bot_id, version, normalized)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["answer"]
+
+            # Near-duplicate match within the same bot and knowledge base version
+            terms = Counter(tokenize(normalized))
+            best_key, best_score = None, 0.0
+            for other in list(self._per_bot.get(key[:2], ())):
+                other_key = (bot_id, version, other)
+                other_entry = self._entries[other_key]
+                if self._expired(other_entry, now):
+                    self._drop(other_key)
+                    continue
+                score = _cosine(terms, other_entry["terms"])
+                if score > best_score:
+                    best_key, best_score = other_key, score
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self.near_hits += 1
+                return self._entries[best_key]["answer"]
+
+            self.misses += 1
+            return None
+
+    def put(self, bot_id, version, question, answer, history=None):
+        if not answer or answer.startswith("[ERROR]") or not self.cacheable(history):
+            return
+        normalized = normalize_question(question)
+        key = (bot_id, version, normalized)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = {
+                "answer": answer,
+                "terms": Counter(tokenize(normalized)),
+                "created_at": time.time(),
+            }
+            questions = self._per_bot.setdefault(key[:2], OrderedDict())
+            questions[normalized] = True
+            while len(questions) > self.max_entries_per_bot:
+                oldest = next(iter(questions))
+                self._drop((bot_id, version, oldest))
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, bot_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == bot_id]:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+            }
+
+
+# === Answer cache shared by the worker processes of one host ===
+# Same keys and matching rules, but the answers live in the shared SQLite
+# database, so an answer produced by one worker is served by all of them
+# and the LLM is asked once per host rather than once per worker.
+ANSWERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    bot_id TEXT NOT NULL,
+    version TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (bot_id, version, question)
+);
+CREATE INDEX IF NOT EXISTS answers_by_age ON answers (created_at);
+"""
+PRUNE_EVERY = 100  # Puts between trims of the whole table
+
+class SharedAnswerCache(AnswerCache):
+    def __init__(self, shared, **kwargs):
+        super().__init__(**kwargs)
+        self.shared = shared
+        shared.add_schema(ANSWERS_SCHEMA)
+        self._puts = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, bot_id, version, question, history=None):
+        if not self.cacheable(history):
+            return None
+        normalized = normalize_question(question)
+        oldest = time.time() - self.ttl
+        try:
+            conn = self.shared.connect()
+            row = conn.execute(
+                "SELECT answer FROM answers WHERE bot_id = ? AND version = ? AND question = ? AND created_at > ?",
+                (bot_id, version, normalized, oldest),
+            ).fetchone()
+            if row is not None:
+                self._count("hits")
+                return row[0]
+
+            # Near-duplicate match within the same bot and knowledge base version
+            rows = conn.execute(
+                "SELECT question, answer FROM answers WHERE bot_id = ? AND version = ? AND created_at > ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (bot_id, version, oldest, self.max_entries_per_bot),
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Answer cache lookup failed: %s", e)
+            rows = []
+        terms = Counter(tokenize(normalized))
+        best_answer, best_score = None, 0.0
+        for other, answer in rows:
+            score = _cosine(terms, Counter(tokenize(other)))
+            if score > best_score:
+                best_answer, best_score = answer, score
+        if best_answer is not None and best_score >= self.similarity_threshold:
+            self._count("near_hits")
+            return best_answer
+
+        self._count("misses")
+        return None
+
+    def put(self, bot_id, version, question, answer, history=None):
+        if not answer or answer.startswith("[ERROR]") or not self.cacheable(history):
+            return
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY == 0
+        try:
+            with self.shared.transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO answers (bot_id, version, question, answer, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (bot_id, version, normalized, answer, now),
+                )
+                conn.execute(
+                    "DELETE FROM answers WHERE bot_id = ? AND version = ? AND question NOT IN ("
+                    "SELECT question FROM answers WHERE bot_id = ? AND version = ? "
+                    "ORDER BY created_at DESC LIMIT ?)",
+                    (bot_id, version, bot_id, version, self.max_entries_per_bot),
+                )
+                if prune:
+                    conn.execute("DELETE FROM answers WHERE created_at <= ?", (now - self.ttl,))
+                    conn.execute(
+                        "DELETE FROM answers WHERE rowid IN ("
+                        "SELECT rowid FROM answers ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    )
+        except sqlite3.Error as e:
+            logger.error("Failed to cache answer for bot %s: %s", bot_id, e)
+
+    def invalidate(self, bot_id):
+        self.shared.connect().execute("DELETE FROM answers WHERE bot_id = ?", (bot_id,))
+
+    def stats(self):
+        entries = self.shared.connect().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        with self._lock:
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+            }
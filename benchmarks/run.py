@@ -0,0 +1,372 @@
+import argparse
+import http.client
+import json
+import os
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from stubs import WORDS, start_llm, start_site
+
+# === Benchmark driver ===
+# Starts the stub website and stub LLM, launches a bot server against them
+# in a scratch directory, and drives /bot/<bot_id> at a fixed concurrency.
+# Reports throughput, latency and time-to-first-token percentiles and the
+# server's resident memory. See benchmarks/README.md.
+
+BOT_ID = "benchbot"
+SERVER_START_TIMEOUT = 120  # Importing gradio alone can take a while
+
+SERVERS = {
+    # bot_server.py, without its debug reloader; workers are pre-forked
+    "flask": lambda port, workers: [
+        sys.executable, "-c",
+        "import sys, bot_server; bot_server.serve('127.0.0.1', int(sys.argv[1]), int(sys.argv[2]))",
+        str(port), str(workers),
+    ],
+    # The async FastAPI app of bot_api.py
+    "fastapi": lambda port, workers: [
+        sys.executable, "-c",
+        "import sys, bot_api; bot_api.serve('127.0.0.1', int(sys.argv[1]), int(sys.argv[2]))",
+        str(port), str(workers),
+    ],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, pct):
+    # Nearest-rank percentile; None for an empty list
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(values) + 0.5)))
+    return values[min(rank, len(values)) - 1]
+
+def summarize(values):
+    return {f"p{pct}": percentile(values, pct) for pct in (50, 95, 99)}
+
+def questions(count, distinct):
+    # distinct=0 makes every question unique, so the answer cache never hits
+    for i in range(count):
+        n = i % distinct if distinct else i
+        yield f"What do you offer for {WORDS[n % len(WORDS)]} and {WORDS[(n * 7 + 3) % len(WORDS)]}? ({n})"
+
+
+# === Server process and its memory ===
+def process_memory_kb(pid):
+    # Proportional set size when the kernel reports it: pages shared by
+    # pre-forked workers (or mapped from the shared SQLite store) are split
+    # between them instead of being counted once per worker. VmRSS otherwise.
+    for path, field in ((f"/proc/{pid}/smaps_rollup", "Pss:"), (f"/proc/{pid}/status", "VmRSS:")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field):
+                        return int(line.split()[1])
+        except OSError:
+            continue
+    return 0
+
+def process_tree_rss_mb(pid):
+    # Memory of a process and all its descendants (server workers);
+    # Linux only, None elsewhere
+    if not os.path.isdir("/proc"):
+        return None
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    tree = {pid}
+    changed = True
+    while changed:
+        changed = False
+        for child, parent in parents.items():
+            if parent in tree and child not in tree:
+                tree.add(child)
+                changed = True
+    total_kb = 0
+    for member in tree:
+        total_kb += process_memory_kb(member)
+    return total_kb / 1024
+
+class RssSampler:
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = process_tree_rss_mb(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def write_bot_config(workdir, urls):
+    os.makedirs(os.path.join(workdir, "chatbots"), exist_ok=True)
+    config = {
+        "id": BOT_ID,
+        "name": "Benchmark bot",
+        "description": "Answers questions about the stub website",
+        "urls": urls,
+        "custom_prompt": "You are a helpful assistant for this website. Answer briefly.",
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        # The load comes from one bot here, so its per-bot quota is lifted
+        "quota": {"rate": 0, "max_in_flight": 100000},
+    }
+    with open(os.path.join(workdir, "chatbots", f"{BOT_ID}.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+def start_server(kind, port, workers, workdir, llm_url, log):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env["SARTHI_LLM_BASE_URL"] = llm_url
+    # Lets every server worker contribute to /metrics
+    env["SARTHI_METRICS_DIR"] = os.path.join(workdir, "metrics")
+    process = subprocess.Popen(
+        SERVERS[kind](port, workers), cwd=workdir, env=env,
+        stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with code {process.returncode}, see {log.name}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/test")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.25)
+    stop_server(process)
+    raise RuntimeError(f"{kind} server did not start within {SERVER_START_TIMEOUT}s, see {log.name}")
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+# === One bot request ===
+def send_request(port, mode, message, timeout):
+    # Returns {"ok", "latency", "ttft", "error"}; ttft is the first streamed
+    # token for mode=stream and the full reply for mode=post
+    path = f"/bot/{BOT_ID}/stream" if mode == "stream" else f"/bot/{BOT_ID}"
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("POST", path, body=json.dumps({"message": message}),
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            response.read()
+            return {"ok": False, "latency": time.perf_counter() - started, "ttft": None,
+                    "error": f"HTTP {response.status}"}
+        if mode == "post":
+            data = json.loads(response.read() or b"{}")
+            latency = time.perf_counter() - started
+            error = data.get("error") or (data.get("response", "").startswith("[ERROR]") and data["response"])
+            return {"ok": not error, "latency": latency, "ttft": latency, "error": error or None}
+
+        ttft = None
+        event = None
+        while True:
+            line = response.readline()
+            if not line:
+                return {"ok": False, "latency": time.perf_counter() - started, "ttft": ttft,
+                        "error": "stream ended without a done event"}
+            line = line.decode("utf-8").rstrip("\r\n")
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[5:])
+                if ttft is None and "delta" in data:
+                    ttft = time.perf_counter() - started
+                if event == "error":
+                    return {"ok": False, "latency": time.perf_counter() - started, "ttft": ttft,
+                            "error": data.get("error")}
+                if event == "done":
+                    return {"ok": True, "latency": time.perf_counter() - started, "ttft": ttft, "error": None}
+            elif not line:
+                event = None
+    except Exception as e:
+        return {"ok": False, "latency": time.perf_counter() - started, "ttft": None, "error": str(e)}
+    finally:
+        conn.close()
+
+def run_load(port, mode, total, concurrency, distinct, timeout):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(
+            lambda message: send_request(port, mode, message, timeout), questions(total, distinct)
+        ))
+    return results, time.perf_counter() - started
+
+
+# === Benchmarks ===
+def bench_server(args, site_urls, llm):
+    workdir = tempfile.mkdtemp(prefix="sarthi-bench-")
+    write_bot_config(workdir, site_urls)
+    port = free_port()
+    log = open(os.path.join(workdir, "server.log"), "w")
+    process = start_server(args.target, port, args.workers, workdir, llm["url"], log)
+    try:
+        rss_idle = process_tree_rss_mb(process.pid)
+        # The first request scrapes and indexes the stub site
+        for message in questions(args.warmup, 0):
+            send_request(port, args.mode, f"Warm up: {message}", args.timeout)
+        llm_calls_before = llm["server"].calls
+
+        sampler = RssSampler(process.pid)
+        sampler.start()
+        results, elapsed = run_load(port, args.mode, args.requests, args.concurrency, args.distinct, args.timeout)
+        sampler.stop()
+    finally:
+        stop_server(process)
+        log.close()
+
+    ok = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    report = {
+        "target": args.target,
+        "mode": args.mode,
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "errors": len(results) - len(ok),
+        "error_kinds": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency_s": summarize([r["latency"] for r in ok]),
+        "ttft_s": summarize([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "rss_idle_mb": rss_idle,
+        "rss_peak_mb": sampler.peak,
+        "llm_calls": llm["server"].calls - llm_calls_before,
+    }
+    if args.keep_workdir:
+        report["workdir"] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def bench_scrape(args, site_urls):
+    # In-process: times scrape_multiple_urls over the stub site
+    from scraper import scrape_multiple_urls
+
+    latencies = []
+    chars = 0
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        call_started = time.perf_counter()
+        content = scrape_multiple_urls(site_urls)
+        latencies.append(time.perf_counter() - call_started)
+        chars += len(content)
+    elapsed = time.perf_counter() - started
+    return {
+        "target": "scrape",
+        "requests": args.requests,
+        "pages_per_call": len(site_urls),
+        "elapsed_s": elapsed,
+        "pages_per_s": args.requests * len(site_urls) / elapsed if elapsed else 0.0,
+        "latency_s": summarize(latencies),
+        "chars_per_call": chars / max(args.requests, 1),
+        "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def print_report(report):
+    def fmt(stats):
+        return "  ".join(f"{key} {value * 1000:.0f}ms" if value is not None else f"{key} -"
+                         for key, value in stats.items())
+
+    print(f"[RESULT] target={report['target']} requests={report['requests']} elapsed={report['elapsed_s']:.2f}s")
+    if report["target"] == "scrape":
+        print(f"  pages/s     {report['pages_per_s']:.1f} ({report['pages_per_call']} pages per call)")
+        print(f"  latency     {fmt(report['latency_s'])}")
+        print(f"  text        {report['chars_per_call']:.0f} chars per call")
+        print(f"  rss         peak {report['rss_peak_mb']:.0f} MB")
+        return
+    print(f"  mode        {report['mode']}, concurrency {report['concurrency']}")
+    print(f"  throughput  {report['throughput_rps']:.1f} req/s, {report['errors']} error(s)")
+    for kind, count in report["error_kinds"].items():
+        print(f"    {count} x {kind}")
+    print(f"  latency     {fmt(report['latency_s'])}")
+    print(f"  ttft        {fmt(report['ttft_s'])}")
+    rss_idle = f"{report['rss_idle_mb']:.0f} MB" if report["rss_idle_mb"] is not None else "-"
+    rss_peak = f"{report['rss_peak_mb']:.0f} MB" if report["rss_peak_mb"] is not None else "-"
+    print(f"  rss         idle {rss_idle}, peak {rss_peak}")
+    print(f"  llm calls   {report['llm_calls']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the bot API against stub sites and a stub LLM")
+    parser.add_argument("--target", choices=["flask", "fastapi", "scrape"], default="fastapi")
+    parser.add_argument("--mode", choices=["stream", "post"], default="stream")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="number of distinct questions; 0 makes every question unique")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--pages", type=int, default=5, help="stub site pages in the bot's knowledge base")
+    parser.add_argument("--page-bytes", type=int, default=20000)
+    parser.add_argument("--site-latency", type=float, default=0.05)
+    parser.add_argument("--llm-tokens", type=int, default=60)
+    parser.add_argument("--llm-ttft", type=float, default=0.3)
+    parser.add_argument("--llm-token-delay", type=float, default=0.01)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep the server's scratch directory and log")
+    args = parser.parse_args()
+
+    site, site_url = start_site(pages=args.pages, page_bytes=args.page_bytes, latency=args.site_latency)
+    site_urls = [f"{site_url}/site/{n}.html" for n in range(args.pages)]
+    if args.target == "scrape":
+        report = bench_scrape(args, site_urls)
+    else:
+        llm_server, llm_url = start_llm(tokens=args.llm_tokens, ttft=args.llm_ttft,
+                                        token_delay=args.llm_token_delay, error_rate=args.llm_error_rate)
+        report = bench_server(args, site_urls, {"server": llm_server, "url": llm_url})
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,175 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# === Stub servers for benchmarks ===
+# A website with N generated pages and an OpenAI-compatible chat endpoint
+# that streams a canned answer. Both run in a background thread of the
+# benchmark driver, or standalone: `python benchmarks/stubs.py site --port 8001`.
+
+WORDS = """
+admission alumni appointment booking campus career clinic course delivery department doctor
+enquiry event faculty fee hostel insurance library menu office order payment pharmacy placement
+pricing product refund registration return scholarship schedule service shipping support timing
+treatment tuition warranty workshop
+""".split()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # Clients hanging up mid-response are expected under load
+
+
+# === Stub website ===
+def make_page(number, size_bytes, seed=0):
+    # Deterministic HTML with real-looking boilerplate around the content
+    rng = random.Random(seed * 100003 + number)
+    head = (
+        f"<html><head><title>Page {number}</title></head><body>"
+        "<nav><a href='/site/0.html'>Home</a> | <a href='/site/1.html'>About</a></nav>"
+        "<div class='cookie-banner'>We use cookies to improve your experience.</div>"
+        f"<main><h1>Page {number}</h1>"
+    )
+    tail = "</main><footer>Copyright Stub Site</footer></body></html>"
+    paragraphs = []
+    size = len(head) + len(tail)
+    while size < size_bytes:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+        paragraph = f"<p>{sentence.capitalize()}.</p>"
+        paragraphs.append(paragraph)
+        size += len(paragraph)
+    return (head + "".join(paragraphs) + tail).encode("utf-8")
+
+
+def start_site(port=0, pages=10, page_bytes=20000, latency=0.0, host="127.0.0.1"):
+    # Serves /site/<n>.html; returns (server, base_url)
+    cache = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            name = self.path.rsplit("/", 1)[-1]
+            if not (self.path.startswith("/site/") and name.endswith(".html") and name[:-5].isdigit()):
+                self.send_error(404)
+                return
+            number = int(name[:-5])
+            if number >= pages:
+                self.send_error(404)
+                return
+            if latency:
+                time.sleep(latency)
+            body = cache.get(number)
+            if body is None:
+                body = cache.setdefault(number, make_page(number, page_bytes))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = _QuietServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="stub-site", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+# === Stub OpenAI-compatible LLM ===
+def start_llm(port=0, tokens=60, ttft=0.3, token_delay=0.01, error_rate=0.0, host="127.0.0.1"):
+    # Serves POST /v1/chat/completions; returns (server, base_url). The
+    # number of calls received is kept in server.calls.
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, data):
+            raw = data.encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(raw), raw))
+            self.wfile.flush()
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with lock:
+                server.calls += 1
+            if error_rate and random.random() < error_rate:
+                self._send_json(429, {"error": {"message": "rate limited"}}, {"Retry-After": "0.2"})
+                return
+
+            words = [random.choice(WORDS) for _ in range(tokens)]
+            created = int(time.time())
+            model = request.get("model", "stub")
+            time.sleep(ttft)
+            if not request.get("stream"):
+                self._send_json(200, {
+                    "id": "stub", "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": " ".join(words)}}],
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, word in enumerate(words):
+                if i and token_delay:
+                    time.sleep(token_delay)
+                chunk = {
+                    "id": "stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                }
+                self._chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    server = _QuietServer((host, port), Handler)
+    server.calls = 0
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub website or stub LLM server")
+    parser.add_argument("kind", choices=["site", "llm"])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--page-bytes", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.kind == "site":
+        server, url = start_site(args.port, args.pages, args.page_bytes, args.latency)
+    else:
+        server, url = start_llm(args.port, args.tokens, args.ttft, args.token_delay, args.error_rate)
+    print(f"[INFO] Stub {args.kind} listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,222 @@
+import asyncio
+import os
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+from engine import (
+    BUSY_RETRY_AFTER, SSE_HEADERS, abot_reply, acquire_chat_slot, admission, astream_bot_reply, busy_retry_after,
+    close_turn, kb_store, llm_gateway, load_bot_config, open_conversation, provision_bot, release_chat_slot,
+    start_background,
+)
+from prefork import run_prefork
+from provisioning import (
+    MAX_BATCH_BOTS, NDJSON_CONTENT_TYPE, is_authorized, ndjson_lines, parse_batch_request, provision_batch,
+)
+from telemetry import (
+    METRICS_CONTENT_TYPE, Trace, atraced_events, get_logger, render_metrics,
+)
+from widget import bot_metadata_response, widget_assets, widget_response
+
+# === Async production server for the bot API ===
+# Serves the same /bot/<bot_id> routes as bot_server.py, but every request is
+# handled on the event loop: cold pages are fetched with httpx, Gemini is
+# called through the async LLM gateway, and in-flight chats are bounded per
+# worker. Run it with several workers, e.g. `python bot_api.py`: the workers
+# are forked from one process that has already imported the app, and share
+# pages and cached answers through the SQLite store.
+
+logger = get_logger("api")
+
+API_HOST = os.environ.get("SARTHI_API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("SARTHI_API_PORT", "7865"))
+API_WORKERS = int(os.environ.get("SARTHI_API_WORKERS", str(os.cpu_count() or 1)))
+
+app = FastAPI(title="Your Sarthi Bot API")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Retry-After"],  # Read by the widget to back off when the server sheds load
+)
+
+
+# === Prometheus text for GET /metrics ===
+def metrics_response():
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+# === Async FastAPI handlers for POST /bot/<bot_id> ===
+def rejection_response(rejection):
+    # 429 or 503 from the admission controller, before any work was done
+    return JSONResponse({"error": rejection["error"]}, status_code=rejection["status"],
+                        headers={"Retry-After": rejection["retry_after"]})
+
+async def handle_post_bot(bot_id, request):
+    trace = Trace("bot_post", bot_id=bot_id)
+    status = "error"
+    try:
+        config = await asyncio.to_thread(load_bot_config, bot_id)
+        if config is None:
+            status = "not_found"
+            return JSONResponse({"error": "Bot not found"}, status_code=404)
+        rejection = admission.admit(bot_id, config)
+        if rejection:
+            status = "rejected"
+            return rejection_response(rejection)
+        try:
+            request_json = await request.json()
+            
+            if not await acquire_chat_slot():
+                status = "busy"
+                return JSONResponse({"error": "Server is busy, please try again shortly"}, status_code=503,
+                                    headers={"Retry-After": BUSY_RETRY_AFTER})
+            try:
+                message = request_json.get("message", "")
+                session_id, history = await asyncio.to_thread(open_conversation, bot_id, request_json)
+                response = await abot_reply(bot_id, config, message, history)
+                await asyncio.to_thread(close_turn, session_id, message, response)
+                retry_after = busy_retry_after(response)
+                if retry_after:
+                    # Turned away by the LLM gateway: same answer as admission gives
+                    status = "busy"
+                    return JSONResponse({"error": response}, status_code=503, headers={"Retry-After": retry_after})
+                status = "error" if response.startswith("[ERROR]") else "ok"
+                return {"response": response, "session_id": session_id}
+            except Exception as e:
+                logger.exception("Error processing POST request: %s", e)
+                return JSONResponse({"error": f"Error processing request: {str(e)}"}, status_code=500)
+            finally:
+                release_chat_slot()
+        finally:
+            admission.release(bot_id)
+    finally:
+        trace.finish(status)
+
+async def handle_post_bot_stream(bot_id, request):
+    trace = Trace("bot_stream", bot_id=bot_id)
+    try:
+        config = await asyncio.to_thread(load_bot_config, bot_id)
+        if config is None:
+            trace.finish("not_found")
+            return JSONResponse({"error": "Bot not found"}, status_code=404)
+        rejection = admission.admit(bot_id, config)
+        if rejection:
+            trace.finish("rejected")
+            return rejection_response(rejection)
+        try:
+            request_json = await request.json()
+            session_id, history = await asyncio.to_thread(open_conversation, bot_id, request_json)
+        except Exception:
+            admission.release(bot_id)
+            raise
+    except Exception:
+        trace.finish("error")
+        raise
+    # The trace and the admission end with the stream, not when the response starts
+    events = astream_bot_reply(bot_id, config, request_json.get("message", ""), history, session_id)
+    return StreamingResponse(
+        admission.guarded(bot_id, atraced_events(trace, events)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+# === Async FastAPI handler for POST /bots/batch ===
+# Takes a JSONL, CSV or JSON manifest and streams one NDJSON progress event
+# per line; needs "Authorization: Bearer $SARTHI_ADMIN_TOKEN".
+async def handle_batch_provision(request):
+    if not is_authorized(request.headers.get("authorization")):
+        return JSONResponse({"error": "Batch provisioning needs a valid admin token"}, status_code=403)
+    body = (await request.body()).decode("utf-8-sig")
+    try:
+        specs, concurrency = parse_batch_request(
+            body, request.headers.get("content-type"),
+            request.query_params.get("format"), request.query_params.get("concurrency"),
+        )
+    except ValueError as e:
+        return JSONResponse({"error": f"Could not read manifest: {e}"}, status_code=400)
+    if len(specs) > MAX_BATCH_BOTS:
+        return JSONResponse({"error": f"At most {MAX_BATCH_BOTS} bots per request"}, status_code=413)
+    # A sync generator: Starlette runs it in a thread, away from the event loop
+    return StreamingResponse(ndjson_lines(provision_batch(specs, provision_bot, concurrency)),
+                             media_type=NDJSON_CONTENT_TYPE)
+
+
+@app.on_event("startup")
+async def start_background_work():
+    # Doesn't run when the app is mounted into Gradio; MySarthi.py calls it there
+    start_background()
+
+
+@app.get("/test")
+async def test_route():
+    return {"status": "API is working!"}
+
+
+@app.get("/simplebot/{bot_id}")
+async def simple_bot(bot_id: str):
+    return {"message": f"Bot {bot_id} exists!"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return metrics_response()
+
+
+@app.get("/widget/{filename}")
+async def widget_file(filename: str, request: Request):
+    # The embed loader and the content-hashed widget bundle, see widget.py
+    result = widget_response(filename, request.headers)
+    if result is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    code, body, headers = result
+    return Response(body, status_code=code, headers=headers)
+
+
+@app.get("/bot/{bot_id}")
+async def get_bot(bot_id: str, request: Request):
+    config = await asyncio.to_thread(load_bot_config, bot_id)
+    if config is None:
+        return JSONResponse({"error": "Bot not found"}, status_code=404)
+    code, body, headers = bot_metadata_response(bot_id, config, request.headers)
+    return Response(body, status_code=code, headers=headers)
+
+
+@app.post("/bot/{bot_id}")
+async def post_bot(bot_id: str, request: Request):
+    return await handle_post_bot(bot_id, request)
+
+
+@app.post("/bot/{bot_id}/stream")
+async def post_bot_stream(bot_id: str, request: Request):
+    return await handle_post_bot_stream(bot_id, request)
+
+
+@app.post("/bots/batch")
+async def post_bots_batch(request: Request):
+    # Bulk creation from a JSONL/CSV manifest, see provisioning.py
+    return await handle_batch_provision(request)
+
+
+def serve_worker(sock):
+    config = uvicorn.Config(app, timeout_keep_alive=30, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(host=API_HOST, port=API_PORT, workers=API_WORKERS):
+    # Each worker only needs its share of the in-memory page budget
+    if kb_store.shared is not None:
+        kb_store.max_bytes //= max(workers, 1)
+    admission.share(workers)
+    llm_gateway.preload()
+    widget_assets()
+    run_prefork(serve_worker, host, port, workers)
+
+
+if __name__ == "__main__":
+    print(f"[INFO] Starting async Bot API Server with {API_WORKERS} worker(s)...")
+    serve()
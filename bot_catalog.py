@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import threading
+
+from bot_registry import is_config_file
+from telemetry import get_logger
+
+logger = get_logger("catalog")
+
+# === Bot catalog settings ===
+SORT_COLUMNS = {"created_at": "created_at", "name": "name COLLATE NOCASE"}
+MAX_PAGE_SIZE = 100
+MIN_SEARCH_TERM = 3  # Shorter terms can't use the trigram index and are matched with LIKE
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bots (
+    bot_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT '',
+    config TEXT NOT NULL,
+    refreshed_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS bots_by_created ON bots (created_at, bot_id);
+CREATE INDEX IF NOT EXISTS bots_by_name ON bots (name COLLATE NOCASE, bot_id);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# When the knowledge base refresher last revisited each bot; catalogs
+# created before the column existed get it on first open
+REFRESH_INDEX = "CREATE INDEX IF NOT EXISTS bots_by_refreshed ON bots (refreshed_at, bot_id)"
+
+# Full-text index over names and descriptions, kept in sync by triggers.
+# Needs SQLite built with FTS5 (3.34+ for trigrams); search falls back to
+# LIKE scans without it.
+SEARCH_SCHEMA = (
+    "CREATE VIRTUAL TABLE bots_search USING fts5("
+    "name, description, content='bots', content_rowid='rowid', tokenize='trigram')",
+    """CREATE TRIGGER bots_search_insert AFTER INSERT ON bots BEGIN
+        INSERT INTO bots_search (rowid, name, description) VALUES (new.rowid, new.name, new.description);
+    END""",
+    """CREATE TRIGGER bots_search_delete AFTER DELETE ON bots BEGIN
+        INSERT INTO bots_search (bots_search, rowid, name, description)
+        VALUES ('delete', old.rowid, old.name, old.description);
+    END""",
+    """CREATE TRIGGER bots_search_update AFTER UPDATE ON bots BEGIN
+        INSERT INTO bots_search (bots_search, rowid, name, description)
+        VALUES ('delete', old.rowid, old.name, old.description);
+        INSERT INTO bots_search (rowid, name, description) VALUES (new.rowid, new.name, new.description);
+    END""",
+    "INSERT INTO bots_search (bots_search) VALUES ('rebuild')",
+)
+
+def _row(config):
+    return (
+        config["id"],
+        config.get("name") or "",
+        config.get("description") or "",
+        config.get("created_at") or "",
+        json.dumps(config),
+    )
+
+def _like_pattern(term):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+# === Bot catalog in the shared SQLite store ===
+# Drop-in replacement for BotRegistry: the same get/put/all/count/list calls,
+# backed by an indexed table instead of one JSON file per bot. Creates are a
+# single INSERT, so a bot is either fully there or not at all, and every
+# worker process sees it immediately. Existing chatbots/<id>.json files are
+# imported the first time the catalog is opened.
+class BotCatalog:
+    def __init__(self, shared, directory="chatbots"):
+        self.shared = shared
+        self.directory = directory
+        shared.add_schema(CATALOG_SCHEMA)
+        self._search = False  # Whether the FTS index exists
+        self._ready_pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = self.shared.connect()
+        if self._ready_pid != os.getpid():
+            with self._lock:
+                if self._ready_pid != os.getpid():
+                    self._search = self._ensure_search_index()
+                    self._ensure_refresh_column()
+                    self._migrate_json_configs()
+                    self._ready_pid = os.getpid()
+        return conn
+
+    def _ensure_search_index(self):
+        conn = self.shared.connect()
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'bots_search'").fetchone():
+            return True
+        try:
+            with self.shared.transaction() as conn:
+                if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'bots_search'").fetchone():
+                    for statement in SEARCH_SCHEMA:
+                        conn.execute(statement)
+            return True
+        except sqlite3.OperationalError as e:
+            logger.info("Bot search uses LIKE scans, full-text index unavailable: %s", e)
+            return False
+
+    def _ensure_refresh_column(self):
+        with self.shared.transaction() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(bots)")]
+            if "refreshed_at" not in columns:
+                conn.execute("ALTER TABLE bots ADD COLUMN refreshed_at REAL NOT NULL DEFAULT 0")
+            conn.execute(REFRESH_INDEX)
+
+    def _migrate_json_configs(self):
+        conn = self.shared.connect()
+        if conn.execute("SELECT 1 FROM catalog_meta WHERE key = 'json_imported'").fetchone():
+            return 0
+        configs = []
+        if os.path.isdir(self.directory):
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not is_config_file(entry.name):
+                        continue
+                    try:
+                        with open(entry.path, "r", encoding="utf-8") as f:
+                            config = json.load(f)
+                    except (OSError, ValueError) as e:
+                        logger.error("Failed to import bot config %s: %s", entry.path, e)
+                        continue
+                    config.setdefault("id", entry.name[:-len(".json")])
+                    configs.append(config)
+        with self.shared.transaction() as conn:
+            # Another worker may have imported them while the files were read
+            if conn.execute("SELECT 1 FROM catalog_meta WHERE key = 'json_imported'").fetchone():
+                return 0
+            conn.executemany(
+                "INSERT OR IGNORE INTO bots (bot_id, name, description, created_at, config) VALUES (?, ?, ?, ?, ?)",
+                [_row(config) for config in configs],
+            )
+            conn.execute("INSERT INTO catalog_meta (key, value) VALUES ('json_imported', ?)", (str(len(configs)),))
+        if configs:
+            logger.info("Imported %d bot config(s) from %s into the catalog", len(configs), self.directory)
+        return len(configs)
+
+    # --- Public API ---
+    def get(self, bot_id):
+        row = self._connect().execute("SELECT config FROM bots WHERE bot_id = ?", (bot_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def create(self, config):
+        # Returns False if the bot_id is already taken
+        try:
+            self._connect().execute(
+                "INSERT INTO bots (bot_id, name, description, created_at, config) VALUES (?, ?, ?, ?, ?)",
+                _row(config),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def put(self, config):
+        self._connect().execute(
+            "INSERT INTO bots (bot_id, name, description, created_at, config) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (bot_id) DO UPDATE SET name = excluded.name, description = excluded.description, "
+            "created_at = excluded.created_at, config = excluded.config",
+            _row(config),
+        )
+
+    def delete(self, bot_id):
+        return self._connect().execute("DELETE FROM bots WHERE bot_id = ?", (bot_id,)).rowcount > 0
+
+    def all(self):
+        rows = self._connect().execute("SELECT config FROM bots ORDER BY created_at, bot_id").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM bots").fetchone()[0]
+
+    def due_for_refresh(self, before, limit):
+        # Ids of up to limit bots last refreshed before the given time, the
+        # longest waiting first; configs are loaded by the caller as needed
+        rows = self._connect().execute(
+            "SELECT bot_id FROM bots WHERE refreshed_at < ? ORDER BY refreshed_at, bot_id LIMIT ?",
+            (before, limit),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_refreshed(self, bot_id, when):
+        self._connect().execute("UPDATE bots SET refreshed_at = ? WHERE bot_id = ?", (when, bot_id))
+
+    def list(self, offset=0, limit=10, query="", sort="created_at", descending=True):
+        # Returns (configs, total) for one page of bots whose name or
+        # description contains every word of query
+        conn = self._connect()
+        where, params = [], []
+        for term in (query or "").split():
+            if self._search and len(term) >= MIN_SEARCH_TERM:
+                where.append("rowid IN (SELECT rowid FROM bots_search WHERE bots_search MATCH ?)")
+                params.append('"' + term.replace('"', '""') + '"')
+            else:
+                where.append("(name LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\')")
+                params += [_like_pattern(term)] * 2
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        total = conn.execute(f"SELECT COUNT(*) FROM bots{clause}", params).fetchone()[0]
+
+        direction = "DESC" if descending else "ASC"
+        order = f"{SORT_COLUMNS.get(sort, SORT_COLUMNS['created_at'])} {direction}, bot_id {direction}"
+        limit = max(0, min(int(limit), MAX_PAGE_SIZE))
+        rows = conn.execute(
+            f"SELECT config FROM bots{clause} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit, max(0, int(offset))],
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows], total
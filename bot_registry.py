@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+
+from telemetry import get_logger
+
+logger = get_logger("registry")
+
+# === Bot config registry settings ===
+POLL_INTERVAL = 2.0  # Seconds between checks of the chatbots directory
+
+def is_config_file(filename):
+    # chatbots/<id>.json only; skips <id>.content.json, <id>.index.json etc.
+    return filename.endswith(".json") and filename.count(".") == 1
+
+
+# === In-memory registry of bot configurations ===
+# Loads every chatbots/<id>.json once and serves lookups from a dict. The
+# directory is re-scanned at most every POLL_INTERVAL seconds to pick up
+# files written or removed by other processes; writes made through put()
+# are visible immediately.
+class BotRegistry:
+    def __init__(self, directory="chatbots", poll_interval=POLL_INTERVAL):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._bots = {}  # bot_id -> config
+        self._mtimes = {}  # bot_id -> mtime of its config file
+        self._sorted_ids = None  # Newest first, rebuilt lazily after changes
+        self._refreshed = {}  # bot_id -> when the refresher last revisited it (this process only)
+        self._last_poll = 0.0
+        self._lock = threading.RLock()
+
+    def _path(self, bot_id):
+        return os.path.join(self.directory, f"{bot_id}.json")
+
+    def _read(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to read bot config %s: %s", path, e)
+            return None
+
+    # --- Change detection (mtime polling) ---
+    def _maybe_refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return
+        with self._lock:
+            if not force and now - self._last_poll < self.poll_interval:
+                return
+            self._last_poll = now
+            if not os.path.isdir(self.directory):
+                return
+
+            seen = set()
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not is_config_file(entry.name):
+                        continue
+                    bot_id = entry.name[:-len(".json")]
+                    seen.add(bot_id)
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    if self._mtimes.get(bot_id) != mtime:
+                        config = self._read(entry.path)
+                        if config is not None:
+                            self._bots[bot_id] = config
+                            self._mtimes[bot_id] = mtime
+                            self._sorted_ids = None
+
+            for bot_id in list(self._bots):
+                if bot_id not in seen:
+                    self._bots.pop(bot_id, None)
+                    self._mtimes.pop(bot_id, None)
+                    self._refreshed.pop(bot_id, None)
+                    self._sorted_ids = None
+
+    # --- Public API ---
+    def get(self, bot_id):
+        self._maybe_refresh()
+        config = self._bots.get(bot_id)
+        if config is not None:
+            return config
+
+        # A bot created by another process since the last poll
+        path = self._path(bot_id)
+        if not os.path.exists(path):
+            return None
+        config = self._read(path)
+        if config is not None:
+            with self._lock:
+                self._bots[bot_id] = config
+                self._mtimes[bot_id] = os.path.getmtime(path)
+                self._sorted_ids = None
+        return config
+
+    def create(self, config):
+        # Returns False if the bot_id is already taken; the file appears
+        # complete or not at all
+        bot_id = config["id"]
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(bot_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        with self._lock:
+            self._bots[bot_id] = config
+            self._mtimes[bot_id] = os.path.getmtime(path)
+            self._sorted_ids = None
+        return True
+
+    def put(self, config):
+        bot_id = config["id"]
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(bot_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bots[bot_id] = config
+            self._mtimes[bot_id] = os.path.getmtime(path)
+            self._sorted_ids = None
+
+    def delete(self, bot_id):
+        try:
+            os.remove(self._path(bot_id))
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            self._bots.pop(bot_id, None)
+            self._mtimes.pop(bot_id, None)
+            self._refreshed.pop(bot_id, None)
+            self._sorted_ids = None
+        return True
+
+    def invalidate(self, bot_id=None):
+        with self._lock:
+            if bot_id is None:
+                self._bots.clear()
+                self._mtimes.clear()
+            else:
+                self._bots.pop(bot_id, None)
+                self._mtimes.pop(bot_id, None)
+            self._sorted_ids = None
+        self._maybe_refresh(force=True)
+
+    def all(self):
+        self._maybe_refresh()
+        with self._lock:
+            return list(self._bots.values())
+
+    def count(self):
+        self._maybe_refresh()
+        return len(self._bots)
+
+    def due_for_refresh(self, before, limit):
+        # Same contract as BotCatalog.due_for_refresh; the ids are already in memory
+        self._maybe_refresh()
+        with self._lock:
+            due = [bot_id for bot_id in self._bots if self._refreshed.get(bot_id, 0) < before]
+        due.sort(key=lambda bot_id: (self._refreshed.get(bot_id, 0), bot_id))
+        return due[:limit]
+
+    def mark_refreshed(self, bot_id, when):
+        with self._lock:
+            self._refreshed[bot_id] = when
+
+    def list(self, offset=0, limit=10, query="", sort="created_at", descending=True):
+        # Returns (configs, total), newest bots first by default; query
+        # keeps bots whose name or description contains every word
+        self._maybe_refresh()
+        with self._lock:
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted(
+                    self._bots,
+                    key=lambda bot_id: (self._bots[bot_id].get("created_at") or "", bot_id),
+                    reverse=True,
+                )
+            ids = self._sorted_ids
+            terms = (query or "").lower().split()
+            if terms:
+                ids = [
+                    bot_id for bot_id in ids
+                    if all(term in f"{self._bots[bot_id].get('name') or ''}\n"
+                                   f"{self._bots[bot_id].get('description') or ''}".lower() for term in terms)
+                ]
+            if sort == "name":
+                ids = sorted(ids, key=lambda bot_id: ((self._bots[bot_id].get("name") or "").lower(), bot_id),
+                             reverse=descending)
+            elif not descending:
+                ids = ids[::-1]
+            page_ids = ids[offset:offset + limit]
+            return [self._bots[bot_id] for bot_id in page_ids], len(ids)
@@ -1,17 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import json
+from werkzeug.serving import make_server
 import os
-import logging
-from MySarthi import scrape_multiple_urls, chat_about_website
+from engine import (
+    SSE_HEADERS, admission, kb_store, bot_reply_deltas, busy_retry_after, close_turn, complete_reply, llm_gateway,
+    load_bot_config, open_conversation, provision_bot, start_background, stream_bot_reply,
+)
+from prefork import run_prefork
+from provisioning import (
+    MAX_BATCH_BOTS, NDJSON_CONTENT_TYPE, is_authorized, ndjson_lines, parse_batch_request, provision_batch,
+)
+from telemetry import (
+    METRICS_CONTENT_TYPE, Trace, get_logger, render_metrics, stage, traced_events,
+)
+from widget import bot_metadata_response, widget_assets, widget_response
 
 
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+# Level and sampling come from SARTHI_LOG_LEVEL and SARTHI_LOG_SAMPLE_RATE
+logger = get_logger("server")
 
 
 app = Flask(__name__)
-CORS(app)  
+CORS(app, expose_headers=["Retry-After"])  # Read by the widget to back off when the server sheds load
 
 
 @app.route('/test', methods=['GET'])
@@ -24,70 +34,165 @@ def simple_bot(bot_id):
     return jsonify({"message": f"Bot {bot_id} exists!"})
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
+def rejection_response(rejection):
+    # 429 or 503 from the admission controller, before any work was done
+    return jsonify({"error": rejection["error"]}), rejection["status"], {"Retry-After": rejection["retry_after"]}
+
+
+@app.route('/widget/<filename>', methods=['GET'])
+def widget_file(filename):
+    # The embed loader and the content-hashed widget bundle, see widget.py
+    result = widget_response(filename, request.headers)
+    if result is None:
+        return jsonify({"error": "Not found"}), 404
+    code, body, headers = result
+    return Response(body, status=code, headers=headers)
+
+
 @app.route('/bot/<bot_id>', methods=['GET', 'POST'])
 def bot_handler(bot_id):
-    logger.debug(f"BOT HANDLER CALLED: bot_id={bot_id}, method={request.method}")
+    logger.debug("Bot handler called: bot_id=%s, method=%s", bot_id, request.method)
+    # Stage timings of this request are collected on the trace
+    trace = Trace(f"bot_{request.method.lower()}", bot_id=bot_id)
+    status = "error"
     try:
         
-        print(f"[DEBUG] Received request for bot: {bot_id}")
-        print(f"[DEBUG] Request method: {request.method}")
-        
-        
-        config_path = os.path.join("chatbots", f"{bot_id}.json")
-        
-        if not os.path.exists(config_path):
-            print(f"[ERROR] Bot file not found: {config_path}")
+        config = load_bot_config(bot_id)
+        if config is None:
+            status = "not_found"
             return jsonify({"error": "Bot not found"}), 404
-        
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = json.load(f)
-            print(f"[DEBUG] Loaded config for bot: {config.get('name')}")
+        logger.debug("Loaded config for bot: %s", config.get("name"))
         
         
         if request.method == "GET":
-            print(f"[DEBUG] Handling GET request for bot: {bot_id}")
-            return jsonify({
-                "id": bot_id, 
-                "name": config.get("name"), 
-                "description": config.get("description")
-            })
+            status = "ok"
+            code, body, headers = bot_metadata_response(bot_id, config, request.headers)
+            return Response(body, status=code, headers=headers)
         
         
         if request.method == "POST":
+            rejection = admission.admit(bot_id, config)
+            if rejection:
+                status = "rejected"
+                return rejection_response(rejection)
             try:
                 
                 request_json = request.get_json()
                 message = request_json.get("message", "")
-                history = request_json.get("history", [])
+                session_id, history = open_conversation(bot_id, request_json)
                 
-                print(f"[DEBUG] Handling POST request. Message: {message[:30]}...")
+                logger.debug("Handling POST request. Message: %.30s...", message)
                 
                 
-                urls = config.get("urls", [])
-                custom_prompt = config.get("custom_prompt", "")
+                with stage("kb_load"):
+                    index = kb_store.get_index(bot_id, config.get("urls", []))
                 
                 
-                print(f"[DEBUG] Scraping URLs: {urls}")
-                website_content = scrape_multiple_urls(urls)
+                response = complete_reply(bot_reply_deltas(bot_id, config, message, history, index=index))
                 
+                close_turn(session_id, message, response)
                 
-                print(f"[DEBUG] Processing with Gemini")
-                response = ""
-                for chunk in chat_about_website(website_content, message, custom_prompt, history):
-                    response = chunk
-                
-                print(f"[DEBUG] Got response: {response[:30]}...")
-                return jsonify({"response": response})
+                logger.debug("Got response: %.30s...", response)
+                retry_after = busy_retry_after(response)
+                if retry_after:
+                    # Turned away by the LLM gateway: same answer as admission gives
+                    status = "busy"
+                    return jsonify({"error": response}), 503, {"Retry-After": retry_after}
+                status = "error" if response.startswith("[ERROR]") else "ok"
+                return jsonify({"response": response, "session_id": session_id})
             except Exception as e:
-                print(f"[ERROR] Error processing POST request: {str(e)}")
+                logger.exception("Error processing POST request: %s", e)
                 return jsonify({"error": f"Error processing request: {str(e)}"}), 500
+            finally:
+                admission.release(bot_id)
         
         return jsonify({"error": "Method not allowed"}), 405
     
     except Exception as e:
-        print(f"[ERROR] Bot handler error: {str(e)}")
+        logger.exception("Bot handler error: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        trace.finish(status)
+
+@app.route('/bot/<bot_id>/stream', methods=['POST'])
+def bot_stream_handler(bot_id):
+    logger.debug("Bot stream handler called: bot_id=%s", bot_id)
+    trace = Trace("bot_stream", bot_id=bot_id)
+    config = load_bot_config(bot_id)
+    if config is None:
+        trace.finish("not_found")
+        return jsonify({"error": "Bot not found"}), 404
+    
+    rejection = admission.admit(bot_id, config)
+    if rejection:
+        trace.finish("rejected")
+        return rejection_response(rejection)
+    try:
+        request_json = request.get_json() or {}
+        session_id, history = open_conversation(bot_id, request_json)
+    except Exception:
+        admission.release(bot_id)
+        trace.finish("error")
+        raise
+    # The trace and the admission end with the stream, not when the response starts
+    return Response(
+        stream_with_context(admission.guarded(bot_id, traced_events(trace, stream_bot_reply(
+            bot_id, config, request_json.get("message", ""), history, session_id
+        )))),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+@app.route('/bots/batch', methods=['POST'])
+def bots_batch_handler():
+    # Bulk creation from a JSONL/CSV manifest, see provisioning.py
+    if not is_authorized(request.headers.get("Authorization")):
+        return jsonify({"error": "Batch provisioning needs a valid admin token"}), 403
+    try:
+        specs, concurrency = parse_batch_request(
+            request.get_data().decode("utf-8-sig"), request.content_type,
+            request.args.get("format"), request.args.get("concurrency"),
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Could not read manifest: {e}"}), 400
+    if len(specs) > MAX_BATCH_BOTS:
+        return jsonify({"error": f"At most {MAX_BATCH_BOTS} bots per request"}), 413
+    return Response(ndjson_lines(provision_batch(specs, provision_bot, concurrency)),
+                    mimetype=NDJSON_CONTENT_TYPE)
+
+# === Several worker processes (SARTHI_WORKERS > 1) ===
+SERVER_WORKERS = int(os.environ.get("SARTHI_WORKERS", "1"))
+
+def serve_worker(sock):
+    # One worker: a threaded WSGI server accepting on the shared socket
+    start_background()
+    host, port = sock.getsockname()[:2]
+    make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+
+def serve(host, port, workers=SERVER_WORKERS):
+    # Pages and answers are in the shared store, so each worker only needs
+    # its share of the in-memory page budget
+    if kb_store.shared is not None:
+        kb_store.max_bytes //= max(workers, 1)
+    admission.share(workers)
+    llm_gateway.preload()
+    widget_assets()
+    run_prefork(serve_worker, host, port, workers)
+
+# SARTHI_DEBUG=1 runs Flask's reloader and debugger instead, on localhost
+# only: the debugger executes code sent to it
+DEBUG = os.environ.get("SARTHI_DEBUG", "0") == "1"
 
 if __name__ == '__main__':
-    print("[INFO] Starting Bot API Server...")
-    app.run(host='0.0.0.0', port=7865, debug=True)
\ No newline at end of file
+    if DEBUG:
+        print("[INFO] Starting Bot API Server in debug mode on 127.0.0.1:7865...")
+        start_background()
+        app.run(host='127.0.0.1', port=7865, debug=True)
+    else:
+        print(f"[INFO] Starting Bot API Server with {SERVER_WORKERS} worker(s)...")
+        serve('0.0.0.0', 7865)
\ No newline at end of file
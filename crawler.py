@@ -0,0 +1,194 @@
+import hashlib
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
+
+from scraper import DEFAULT_TIMEOUT, PER_HOST_LIMIT, USER_AGENT, _host_slot, fetch_page, get_session
+from telemetry import get_logger
+
+logger = get_logger("crawler")
+
+# === Crawler settings ===
+DEFAULT_MAX_PAGES = 100
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_WORKERS = 8
+DEFAULT_CRAWL_DEADLINE = 300
+MAX_SITEMAP_FILES = 10
+
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js",
+    ".zip", ".gz", ".tar", ".mp3", ".mp4", ".avi", ".mov", ".woff", ".woff2", ".ttf",
+    ".xml", ".json", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
+)
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+# === URL helpers ===
+def normalize_url(url):
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    port = parsed.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = re.sub(r"/{2,}", "/", parsed.path or "/")
+    if len(path) > 1 and path.endswith("/"):
+        path = path[:-1]
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    ))
+    return urlunparse((scheme, host, path, "", query, ""))
+
+def _site_host(url):
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def is_same_site(url, hosts):
+    return urlparse(url).scheme in ("http", "https") and _site_host(url) in hosts
+
+def _is_crawlable(url):
+    return not urlparse(url).path.lower().endswith(SKIPPED_EXTENSIONS)
+
+def _content_hash(text):
+    # Collapse whitespace and case so trivially different copies hash the same
+    return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+# === robots.txt and sitemap.xml ===
+def load_robots(root_url, timeout=DEFAULT_TIMEOUT):
+    robots_url = urljoin(root_url, "/robots.txt")
+    parser = RobotFileParser(robots_url)
+    try:
+        response = get_session().get(robots_url, timeout=timeout)
+        if response.status_code >= 400:
+            parser.parse([])  # No robots.txt means everything is allowed
+        else:
+            parser.parse(response.text.splitlines())
+    except Exception as e:
+        logger.info("Could not read %s: %s", robots_url, e)
+        parser.parse([])
+    return parser
+
+def load_sitemap_urls(root_url, robots=None, timeout=DEFAULT_TIMEOUT, limit=DEFAULT_MAX_PAGES):
+    pending = deque((robots.site_maps() if robots else None) or [urljoin(root_url, "/sitemap.xml")])
+    seen_sitemaps = set()
+    urls = []
+    while pending and len(seen_sitemaps) < MAX_SITEMAP_FILES and len(urls) < limit:
+        sitemap_url = pending.popleft()
+        if sitemap_url in seen_sitemaps:
+            continue
+        seen_sitemaps.add(sitemap_url)
+        try:
+            response = get_session().get(sitemap_url, timeout=timeout)
+            if response.status_code >= 400:
+                continue
+            root = ET.fromstring(response.content)
+        except Exception as e:
+            logger.info("Could not read sitemap %s: %s", sitemap_url, e)
+            continue
+        is_index = root.tag.endswith("sitemapindex")
+        for loc in root.iter():
+            if loc.tag.endswith("loc") and loc.text:
+                if is_index:
+                    pending.append(loc.text.strip())
+                else:
+                    urls.append(loc.text.strip())
+    return urls[:limit]
+
+# === Site crawler ===
+# Generator that crawls from the seed URLs and yields progress events. The
+# final event has done=True and carries the crawled pages as (url, text)
+# pairs in discovery order.
+def crawl_site(seeds, max_pages=DEFAULT_MAX_PAGES, max_bytes=DEFAULT_MAX_BYTES,
+               workers=DEFAULT_WORKERS, per_host=PER_HOST_LIMIT, timeout=DEFAULT_TIMEOUT,
+               deadline=DEFAULT_CRAWL_DEADLINE, use_sitemap=True):
+    seeds = [normalize_url(seed) for seed in seeds if seed.strip()]
+    hosts = {_site_host(seed) for seed in seeds}
+    robots = {}
+
+    def allowed(url):
+        origin = f"{urlparse(url).scheme}://{urlparse(url).netloc}"
+        if origin not in robots:
+            robots[origin] = load_robots(origin, timeout=timeout)
+        return robots[origin].can_fetch(USER_AGENT, url)
+
+    frontier = deque()
+    seen_urls = set()
+    order = {}
+
+    def enqueue(url):
+        url = normalize_url(url)
+        if url in seen_urls or not is_same_site(url, hosts) or not _is_crawlable(url):
+            return
+        seen_urls.add(url)
+        if allowed(url):
+            order[url] = len(order)
+            frontier.append(url)
+
+    for seed in seeds:
+        enqueue(seed)
+    if use_sitemap:
+        for seed in seeds:
+            origin = f"{urlparse(seed).scheme}://{urlparse(seed).netloc}"
+            for url in load_sitemap_urls(origin, robots.get(origin), timeout=timeout, limit=max_pages):
+                enqueue(url)
+
+    pages = {}
+    seen_hashes = set()
+    total_bytes = 0
+    started = time.monotonic()
+
+    def fetch(url):
+        with _host_slot(url, per_host):
+            return fetch_page(url, timeout=timeout, with_links=True)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    in_flight = {}
+    try:
+        while frontier or in_flight:
+            over_budget = len(pages) >= max_pages or total_bytes >= max_bytes
+            out_of_time = time.monotonic() - started > deadline
+            while frontier and not over_budget and not out_of_time and len(in_flight) + len(pages) < max_pages and len(in_flight) < workers:
+                url = frontier.popleft()
+                in_flight[executor.submit(fetch, url)] = url
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, timeout=max(0.1, deadline - (time.monotonic() - started)), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                url = in_flight.pop(future)
+                result = future.result()
+                if result.get("text") is None:
+                    yield {"done": False, "url": url, "error": result.get("error"),
+                           "fetched": len(pages), "queued": len(frontier), "bytes": total_bytes}
+                    continue
+
+                # Pages that declare a different canonical URL are folded into it
+                canonical = result.get("canonical")
+                if canonical and is_same_site(canonical, hosts):
+                    canonical = normalize_url(canonical)
+                    if canonical != url and canonical in pages:
+                        continue
+                    seen_urls.add(canonical)
+
+                for link in result.get("links", []):
+                    enqueue(link)
+
+                digest = _content_hash(result["text"])
+                if digest in seen_hashes or total_bytes >= max_bytes or len(pages) >= max_pages:
+                    continue
+                seen_hashes.add(digest)
+                pages[url] = result["text"]
+                total_bytes += result.get("bytes", len(result["text"]))
+                yield {"done": False, "url": url, "fetched": len(pages), "queued": len(frontier), "bytes": total_bytes}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    ordered = sorted(pages.items(), key=lambda item: order.get(item[0], len(order)))
+    yield {"done": True, "pages": ordered, "bytes": total_bytes,
+           "elapsed": time.monotonic() - started}
@@ -0,0 +1,546 @@
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+
+from admission import AdmissionController, bot_quota
+from answer_cache import AnswerCache, SharedAnswerCache
+from bot_catalog import BotCatalog
+from bot_registry import BotRegistry
+from crawler import DEFAULT_MAX_PAGES, crawl_site
+from faq import FaqBuilder, faq_answer, faq_is_stale
+from kb_store import KnowledgeBaseStore, combine_pages, split_combined_content
+from llm_gateway import LLMGateway, LLMUnavailableError
+from prompt_budget import count_tokens, plan_prompt, system_prefix
+from refresher import KnowledgeBaseRefresher
+from retrieval import index_for_pages, text_hash
+from scraper import async_fetch_many, fetch_many, fetch_page
+from sessions import SessionStore, SharedSessionStore, compact_history, history_with_summary
+from shared_store import SharedStore
+from telemetry import get_logger, record_stage, register_gauge, stage, start_metrics_flusher
+
+# === Your Sarthi engine ===
+# Scraping, knowledge bases, retrieval, the Gemini gateway and bot replies,
+# without any web framework or UI. The bot servers (bot_server.py,
+# bot_api.py) and the provisioning CLI import only this module, so their
+# workers start fast and stay small; the Gradio dashboard in MySarthi.py is
+# an optional layer on top. Nothing here touches the network or the disk
+# at import time: clients, connections and directories are created on first use.
+
+# Level and sampling come from SARTHI_LOG_LEVEL and SARTHI_LOG_SAMPLE_RATE
+logger = get_logger("engine")
+
+# === Gemini API Setup ===
+gemini_api_key = "gen_key"  
+
+# Point SARTHI_LLM_BASE_URL at any OpenAI-compatible server, e.g. a local stub
+gemini_base_url = os.environ.get("SARTHI_LLM_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai/")
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# All Gemini calls go through the gateway: bounded concurrency, retries with
+# backoff, a circuit breaker, and one upstream call per identical prompt
+llm_gateway = LLMGateway(
+    api_key=gemini_api_key,
+    base_url=gemini_base_url,
+    model=GEMINI_MODEL,
+    max_concurrent=int(os.environ.get("SARTHI_LLM_MAX_CONCURRENT", "32")),
+)
+
+# === Per-bot quotas and load shedding in front of /bot/<bot_id> ===
+admission = AdmissionController(llm_gateway)
+
+# === SQLite store shared by all worker processes on the host ===
+# Holds the scraped pages, bot configs, cached answers and chat sessions,
+# which workers read from the database instead of each keeping a copy, and
+# the built retrieval indexes, which a worker loads into its own memory
+# (its share of SARTHI_KB_MEMORY_BYTES) rather than rebuilding them.
+# SARTHI_SHARED_STORE=0 keeps everything per process (pages in
+# chatbots/*.content.json) as before
+SHARED_STORE_ENABLED = os.environ.get("SARTHI_SHARED_STORE", "1") != "0"
+shared_store = SharedStore() if SHARED_STORE_ENABLED else None
+
+# === Knowledge base cache shared by the Gradio app and the bot API ===
+kb_store = KnowledgeBaseStore("chatbots", fetch=fetch_page, fetch_many=fetch_many, shared=shared_store)
+
+# === Cached answers for repeated visitor questions ===
+answer_cache = SharedAnswerCache(shared_store) if shared_store else AnswerCache()
+
+# === Server-side conversation sessions for the embed widget ===
+# In the shared store, so a follow-up may land on any worker
+session_store = SharedSessionStore(shared_store) if shared_store else SessionStore()
+
+# === Bot configurations ===
+# An indexed catalog in the shared store (existing chatbots/<id>.json files
+# are imported on first use), or the JSON files served from memory
+bot_registry = BotCatalog(shared_store, "chatbots") if shared_store else BotRegistry("chatbots")
+
+# === Background refresh of every bot's pages (started by the servers) ===
+kb_refresher = KnowledgeBaseRefresher(kb_store, bot_registry)
+
+def start_background():
+    # Called once by every serving process, however it is served. Only one
+    # process per host gets the refresher's lock; each one publishes its
+    # metrics for /metrics when SARTHI_METRICS_DIR is set
+    kb_refresher.start()
+    start_metrics_flusher()
+
+# === Gauges read when /metrics is scraped ===
+register_gauge("sarthi_bots", "Bots in the registry", bot_registry.count, merge="max")
+register_gauge("sarthi_sessions", "Open chat sessions", session_store.count,
+               merge="max" if shared_store else "sum")
+register_gauge("sarthi_answer_cache_entries", "Cached answers", lambda: answer_cache.stats()["entries"],
+               merge="max" if shared_store else "sum")
+register_gauge("sarthi_answer_cache_hits_total", "Exact answer cache hits",
+               lambda: answer_cache.stats()["hits"], kind="counter")
+register_gauge("sarthi_answer_cache_near_hits_total", "Near-duplicate answer cache hits",
+               lambda: answer_cache.stats()["near_hits"], kind="counter")
+register_gauge("sarthi_answer_cache_misses_total", "Answer cache misses",
+               lambda: answer_cache.stats()["misses"], kind="counter")
+register_gauge("sarthi_llm_pending_calls", "LLM calls in flight or queued", lambda: llm_gateway.stats()["pending"])
+register_gauge("sarthi_llm_queued_calls", "LLM calls waiting for an upstream slot",
+               lambda: llm_gateway.stats()["queued"])
+register_gauge("sarthi_admission_in_flight", "Bot replies admitted and not finished",
+               lambda: admission.stats()["in_flight"])
+register_gauge("sarthi_llm_circuit_open", "1 while the LLM circuit breaker is open",
+               lambda: llm_gateway.stats()["circuit"] == "open")
+if kb_store.pages is not None:
+    register_gauge("sarthi_page_store_texts", "Distinct page texts stored for all bots",
+                   lambda: kb_store.pages.stats()["texts"], merge="max")
+    register_gauge("sarthi_page_store_bytes", "Compressed size of the stored page texts",
+                   lambda: kb_store.pages.stats()["stored_bytes"], merge="max")
+    register_gauge("sarthi_page_cache_bytes", "Page texts held decompressed in memory",
+                   lambda: kb_store.pages.stats()["cached_bytes"])
+
+# === Streaming settings ===
+ACCUMULATED_YIELD_INTERVAL = 0.05  # Seconds between accumulated updates
+
+# === Replies the gateway turned away before calling Gemini ===
+# Queue timeouts, an open circuit or too many calls for one bot come back
+# as this [ERROR] text; the servers answer it like admission does, with 503
+# and Retry-After (or retry_after on the stream's error event).
+BUSY_ERROR = "[ERROR] The assistant is busy, retry after {seconds}s: {reason}"
+BUSY_ERROR_RE = re.compile(r"^\[ERROR\] The assistant is busy, retry after (\d+)s")
+
+def busy_error(error):
+    seconds = max(1, int(round(error.retry_after or int(BUSY_RETRY_AFTER))))
+    return BUSY_ERROR.format(seconds=seconds, reason=error)
+
+def busy_retry_after(response):
+    # The Retry-After seconds (as a string) of a busy reply, else None
+    match = BUSY_ERROR_RE.match(response or "")
+    return match.group(1) if match else None
+
+def error_event(token):
+    data = {"error": token}
+    retry_after = busy_retry_after(token)
+    if retry_after:
+        data["retry_after"] = int(retry_after)
+    return sse_event(data, "error")
+
+# === Function to build the Gemini messages for a question ===
+# Returns (messages, error); exactly one of them is None.
+def build_chat_messages(page_text, prompt, custom_prompt, history, index=None):
+    # Bots pass their prebuilt retrieval index; the test chat indexes page_text once
+    if index is None:
+        if not page_text or "Failed" in page_text:
+            return None, "[ERROR] Cannot respond due to scraping failure."
+        index = index_for_pages(split_combined_content(page_text) or [("", page_text)])
+    if not index.chunk_count:
+        return None, "[ERROR] Cannot respond due to scraping failure."
+
+    # Convert history from Gradio format to API format
+    summary = ""
+    api_messages = []
+    if history:
+        for msg in history:
+            if isinstance(msg, dict) and "role" in msg and "content" in msg:
+                if msg["role"] in ["user", "assistant"]:  # Only include user and assistant messages
+                    api_messages.append({"role": msg["role"], "content": msg["content"]})
+                elif msg["role"] == "system":  # Conversation summary built by the server
+                    summary = msg["content"]
+
+    # Fit instructions, context, history and question into the token budget;
+    # the cached prefix is the same on every request for this bot
+    prefix, prefix_tokens = system_prefix(custom_prompt)
+    plan = plan_prompt(prefix_tokens, prompt, summary, api_messages)
+
+    # Only the chunks relevant to this question go into the prompt
+    context = combine_pages(index.select_pages(prompt, budget_tokens=plan["context_tokens"],
+                                               count_tokens=count_tokens))
+    system_content = prefix + context
+    if plan["summary"]:
+        system_content += f"\n\n{plan['summary']}"
+
+    system_message = {"role": "system", "content": system_content}
+    user_message = {"role": "user", "content": plan["question"]}
+    return [system_message] + plan["messages"] + [user_message], None
+
+# === Function to talk to Gemini using streamed output ===
+# With delta=True only the new tokens are yielded. Otherwise the accumulated
+# answer is yielded, coalesced to at most one update per min_interval, plus a
+# final update with the complete answer.
+def chat_about_website(page_text, prompt, custom_prompt, history, index=None, delta=False,
+                       min_interval=ACCUMULATED_YIELD_INTERVAL, tenant=None, weight=1.0):
+    with stage("prompt_build"):
+        full_messages, error = build_chat_messages(page_text, prompt, custom_prompt, history, index)
+    if error:
+        yield error
+        return
+
+    try:
+        parts = []
+        last_yield = 0.0
+        pending = False
+        llm_started = time.perf_counter()
+        first_token = True
+        for token in llm_gateway.stream(full_messages, tenant, weight):
+            if first_token:
+                first_token = False
+                record_stage("llm_ttft", time.perf_counter() - llm_started)
+            if delta:
+                yield token
+                continue
+            parts.append(token)
+            pending = True
+            now = time.monotonic()
+            if now - last_yield >= min_interval:
+                last_yield = now
+                pending = False
+                yield "".join(parts)
+        if pending:
+            yield "".join(parts)
+        record_stage("llm_total", time.perf_counter() - llm_started)
+    except LLMUnavailableError as e:
+        yield busy_error(e)
+    except Exception as e:
+        yield f"[ERROR] Gemini API failed: {e}"
+
+# === Async variant for the async bot API (always yields deltas) ===
+async def achat_about_website(page_text, prompt, custom_prompt, history, index=None, tenant=None, weight=1.0):
+    with stage("prompt_build"):
+        full_messages, error = build_chat_messages(page_text, prompt, custom_prompt, history, index)
+    if error:
+        yield error
+        return
+
+    stream = llm_gateway.astream(full_messages, tenant, weight)
+    llm_started = time.perf_counter()
+    first_token = True
+    try:
+        async for token in stream:
+            if first_token:
+                first_token = False
+                record_stage("llm_ttft", time.perf_counter() - llm_started)
+            yield token
+        record_stage("llm_total", time.perf_counter() - llm_started)
+    except LLMUnavailableError as e:
+        yield busy_error(e)
+    except Exception as e:
+        yield f"[ERROR] Gemini API failed: {e}"
+    finally:
+        # Lets the gateway cancel the upstream call if nobody else is waiting on it
+        await stream.aclose()
+
+# === Function to collect a full reply from delta mode ===
+def complete_reply(deltas):
+    parts = []
+    for token in deltas:
+        if token.startswith("[ERROR]"):
+            return token
+        parts.append(token)
+    return "".join(parts)
+
+# === Function to create chatbot endpoint ===
+def create_chatbot_endpoint(bot_name, bot_description, urls, custom_prompt, website_content=None, crawl_seeds=None,
+                            bot_id=None, build_faq=False, faq_rebuild=False):
+    # Generate a unique ID for this chatbot, unless the caller picked one
+    if bot_id is None:
+        bot_id = str(uuid.uuid4())[:8]
+        while bot_registry.get(bot_id) is not None:
+            bot_id = str(uuid.uuid4())[:8]
+    
+    # Create a directory to store chatbot data
+    if not os.path.exists("chatbots"):
+        os.makedirs("chatbots")
+    
+    # Save the chatbot configuration
+    config = {
+        "id": bot_id,
+        "name": bot_name,
+        "description": bot_description,
+        "urls": urls,
+        "custom_prompt": custom_prompt,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    if crawl_seeds:
+        config["crawl_seeds"] = crawl_seeds
+    if faq_rebuild:
+        config["faq_rebuild"] = True  # Rebuild the FAQ whenever it goes stale (costs LLM calls)
+    
+    # Add the bot in one atomic step, visible to every worker right away; the
+    # id is reserved before any page is written, so a taken id never touches
+    # the existing bot's knowledge base
+    if not bot_registry.create(config):
+        raise RuntimeError(f"Bot id {bot_id} is already taken")
+    
+    # Store the already scraped text so the bot never serves a cold scrape
+    if website_content and not website_content.startswith("[ERROR]"):
+        try:
+            kb_store.put_content(bot_id, website_content)
+        except Exception:
+            # Don't leave a bot behind without its pages
+            bot_registry.delete(bot_id)
+            kb_store.invalidate(bot_id)
+            raise
+    
+    # Answers to the likely questions are prepared in the background
+    if build_faq:
+        faq_builder.schedule(bot_id)
+    
+    # Return the bot ID for embedding
+    return bot_id
+
+# === Function to provision one bot of a batch manifest ===
+# Scrapes (or crawls) the bot's site, stores the pages and retrieval index
+# and creates the bot, so its first visitor is served from the cache. With
+# "faq" set the bot's FAQ is built before it is reported ("faq_rebuild" also
+# rebuilds it whenever the site changes), and warm questions are answered
+# once up front to fill the answer cache.
+def provision_bot(spec):
+    if spec.get("id") and bot_registry.get(spec["id"]) is not None:
+        return {"status": "exists", "bot_id": spec["id"]}
+
+    failed_urls = []
+    crawl_seeds = None
+    if spec.get("crawl"):
+        pages = []
+        for event in crawl_site(spec["urls"], max_pages=spec.get("max_pages") or DEFAULT_MAX_PAGES):
+            if event["done"]:
+                pages = event["pages"]
+        crawl_seeds = spec["urls"]
+    else:
+        # Pages another bot fetched recently come from the page store
+        known = kb_store.known_pages(spec["urls"])
+        results = fetch_many([url for url in spec["urls"] if url not in known])
+        fetched = {result["url"]: result["text"] for result in results if result.get("text") is not None}
+        pages = [(url, known.get(url, fetched.get(url))) for url in spec["urls"] if url in known or url in fetched]
+        failed_urls = [{"url": result["url"], "error": result.get("error")}
+                       for result in results if result.get("text") is None]
+    if not pages:
+        return {"status": "failed", "error": "Failed to fetch content from any of the provided URLs",
+                "failed_urls": failed_urls}
+
+    # Only pages that were fetched are kept, so no visitor waits on a retry
+    # of a broken URL; re-run the manifest entry to add them later
+    bot_id = create_chatbot_endpoint(
+        spec["name"], spec.get("description", ""), [url for url, _ in pages], spec.get("custom_prompt", ""),
+        combine_pages(pages), crawl_seeds, bot_id=spec.get("id"), faq_rebuild=spec.get("faq_rebuild", False),
+    )
+    result = {"status": "created", "bot_id": bot_id, "pages": len(pages), "failed_urls": failed_urls}
+
+    if spec.get("faq"):
+        result["faq"] = faq_builder.build(bot_id)
+    if spec.get("warm_questions"):
+        config = bot_registry.get(bot_id)
+        warmed = 0
+        for question in spec["warm_questions"]:
+            if not complete_reply(bot_reply_deltas(bot_id, config, question, [])).startswith("[ERROR]"):
+                warmed += 1
+        result["warmed"] = warmed
+    return result
+
+# === Function to load a bot configuration ===
+def load_bot_config(bot_id):
+    with stage("config_load"):
+        config = bot_registry.get(bot_id)
+    if config is None:
+        logger.info("Bot not found: %s", bot_id)
+    return config
+
+# === Function to answer a bot visitor, using the answer cache ===
+def answer_cache_version(index, config):
+    # Answers depend on both the knowledge base and the bot's instructions
+    return f"{index.version}:{text_hash(config.get('custom_prompt') or '')[:8]}"
+
+# === Precomputed answers to each bot's likely questions (see faq.py) ===
+faq_builder = FaqBuilder(llm_gateway, kb_store, bot_registry, answer_cache_version, shared=shared_store)
+
+def cached_answer(bot_id, config, version, message, history):
+    # The bot's FAQ first, then answers given to earlier visitors. A stale
+    # FAQ (the knowledge base or instructions changed since it was built) is
+    # never served, and only rebuilt for bots that asked for it.
+    answer = faq_answer(config, version, message, history)
+    if answer is None:
+        if config.get("faq_rebuild") and faq_is_stale(config, version):
+            faq_builder.schedule(bot_id)
+        answer = answer_cache.get(bot_id, version, message, history)
+    return answer
+
+def bot_reply_deltas(bot_id, config, message, history, index=None):
+    if index is None:
+        with stage("kb_load"):
+            index = kb_store.get_index(bot_id, config.get("urls", []))
+    version = answer_cache_version(index, config)
+    with stage("cache_lookup"):
+        cached = cached_answer(bot_id, config, version, message, history)
+    if cached is not None:
+        yield cached
+        return
+    
+    parts = []
+    for token in chat_about_website(None, message, config.get("custom_prompt", ""), history, index=index, delta=True,
+                                    tenant=bot_id, weight=bot_quota(config)["weight"]):
+        if token.startswith("[ERROR]"):
+            yield token
+            return
+        parts.append(token)
+        yield token
+    answer_cache.put(bot_id, version, message, "".join(parts), history)
+
+# === Function to resolve the conversation a message belongs to ===
+# Returns (session_id, history). Widgets send a session_id and only the new
+# message; older embeds that still ship the whole transcript get it
+# compacted statelessly and no session.
+def open_conversation(bot_id, request_json):
+    client_history = request_json.get("history")
+    if client_history and not request_json.get("session_id"):
+        summary, recent = compact_history(client_history)
+        return None, history_with_summary(summary, recent)
+    session_id = session_store.open(bot_id, request_json.get("session_id"))
+    return session_id, session_store.history(session_id)
+
+def close_turn(session_id, message, response):
+    if session_id and not response.startswith("[ERROR]"):
+        session_store.record_turn(session_id, message, response)
+
+# === Function to stream a bot reply as Server-Sent Events ===
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def stream_bot_reply(bot_id, config, message, history, session_id=None):
+    try:
+        if session_id:
+            yield sse_event({"session_id": session_id}, "session")
+        parts = []
+        for token in bot_reply_deltas(bot_id, config, message, history):
+            if token.startswith("[ERROR]"):
+                yield error_event(token)
+                return
+            parts.append(token)
+            yield sse_event({"delta": token})
+        response = "".join(parts)
+        close_turn(session_id, message, response)
+        yield sse_event({"response": response, "session_id": session_id}, "done")
+    except Exception as e:
+        logger.exception("Error streaming reply for bot %s: %s", bot_id, e)
+        yield sse_event({"error": f"Error processing request: {str(e)}"}, "error")
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# === Async bot replies with bounded concurrency and timeouts ===
+MAX_CONCURRENT_CHATS = int(os.environ.get("SARTHI_MAX_CONCURRENT_CHATS", "200"))
+CHAT_QUEUE_TIMEOUT = 5  # Seconds a request may wait for a free chat slot
+CHAT_TIMEOUT = 60  # Seconds allowed for a whole reply
+BUSY_RETRY_AFTER = "5"
+
+_chat_slots = {}  # One semaphore per event loop (i.e. per worker)
+
+def _chat_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _chat_slots.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHATS)
+        _chat_slots[loop] = semaphore
+    return semaphore
+
+async def acquire_chat_slot():
+    try:
+        await asyncio.wait_for(_chat_semaphore().acquire(), CHAT_QUEUE_TIMEOUT)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+def release_chat_slot():
+    _chat_semaphore().release()
+
+async def aget_bot_index(bot_id, config):
+    urls = config.get("urls", [])
+    # Cold pages are fetched with the async client instead of blocking a thread;
+    # the store's SQLite and file reads run in worker threads off the event loop
+    missing = await asyncio.to_thread(kb_store.missing_urls, bot_id, urls)
+    if missing:
+        results = await async_fetch_many(missing)
+        await asyncio.to_thread(kb_store.store_results, bot_id, results)
+    return await asyncio.to_thread(kb_store.get_index, bot_id, urls)
+
+async def astream_bot_deltas(bot_id, config, message, history, timeout=CHAT_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    with stage("kb_load"):
+        index = await aget_bot_index(bot_id, config)
+    version = answer_cache_version(index, config)
+    with stage("cache_lookup"):
+        cached = await asyncio.to_thread(cached_answer, bot_id, config, version, message, history)
+    if cached is not None:
+        yield cached
+        return
+    
+    stream = achat_about_website(None, message, config.get("custom_prompt", ""), history, index=index,
+                                 tenant=bot_id, weight=bot_quota(config)["weight"])
+    parts = []
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                token = await asyncio.wait_for(stream.__anext__(), remaining)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                yield f"[ERROR] Gemini API timed out after {timeout}s"
+                return
+            if token.startswith("[ERROR]"):
+                yield token
+                return
+            parts.append(token)
+            yield token
+    finally:
+        await stream.aclose()
+    await asyncio.to_thread(answer_cache.put, bot_id, version, message, "".join(parts), history)
+
+async def abot_reply(bot_id, config, message, history):
+    parts = []
+    async for token in astream_bot_deltas(bot_id, config, message, history):
+        if token.startswith("[ERROR]"):
+            return token
+        parts.append(token)
+    return "".join(parts)
+
+async def astream_bot_reply(bot_id, config, message, history, session_id=None):
+    # The slot is taken inside the generator so it is always released
+    if not await acquire_chat_slot():
+        yield sse_event({"error": "Server is busy, please try again shortly", "retry_after": int(BUSY_RETRY_AFTER)},
+                        "error")
+        return
+    try:
+        if session_id:
+            yield sse_event({"session_id": session_id}, "session")
+        parts = []
+        async for token in astream_bot_deltas(bot_id, config, message, history):
+            if token.startswith("[ERROR]"):
+                yield error_event(token)
+                return
+            parts.append(token)
+            yield sse_event({"delta": token})
+        response = "".join(parts)
+        await asyncio.to_thread(close_turn, session_id, message, response)
+        yield sse_event({"response": response, "session_id": session_id}, "done")
+    except Exception as e:
+        logger.exception("Error streaming reply for bot %s: %s", bot_id, e)
+        yield sse_event({"error": f"Error processing request: {str(e)}"}, "error")
+    finally:
+        release_chat_slot()
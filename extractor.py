@@ -0,0 +1,274 @@
+import os
+import re
+from urllib.parse import urljoin
+
+from telemetry import get_logger, stage
+
+# Parsers are optional; the fastest one installed is used
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+try:
+    import cssselect  # noqa: F401  lxml needs it for CSS selectors
+    _has_cssselect = True
+except ImportError:
+    _has_cssselect = False
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+logger = get_logger("extractor")
+
+# === Extractor settings ===
+EXTRACTOR = os.environ.get("SARTHI_EXTRACTOR", "auto")  # auto, selectolax, lxml, bs4 or legacy
+MIN_MAIN_CHARS = 200  # A main/article element shorter than this is probably not the content
+MIN_TEXT_RATIO = 0.15  # Less than this share of the page's text left after stripping falls back to legacy
+
+# Elements without readable text, always removed
+NON_TEXT_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "object"]
+# Elements that rarely hold page content; removed unless they contain it
+BOILERPLATE_TAGS = ["nav", "footer", "aside", "form", "button", "select", "dialog"]
+BOILERPLATE_TAG_SET = frozenset(BOILERPLATE_TAGS)
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog", "alert"}
+# Matched against whole class/id tokens, e.g. "cookie-banner" or "site_footer"
+BOILERPLATE_PATTERN = re.compile(
+    r"(?:^|[\s_-])(?:cookies?|consent|gdpr|banner|navbar|menu|breadcrumbs?|sidebar|footer|"
+    r"share|social|newsletter|subscribe|popup|modal|advert|ads|promo|skip)(?:$|[\s_-])",
+    re.IGNORECASE,
+)
+KEEP_TAGS = {"html", "body", "main", "article"}  # Their class lists often mention sidebars or menus
+MAIN_SELECTORS = ["main", "article", "[role=main]", "#content", "#main", ".content", ".entry-content", ".post"]
+
+
+def _is_boilerplate(tag, attributes):
+    if tag in BOILERPLATE_TAG_SET:
+        return True
+    if tag in KEEP_TAGS or not attributes:
+        return False
+    if (attributes.get("role") or "").lower() in BOILERPLATE_ROLES:
+        return True
+    if attributes.get("aria-hidden") == "true":
+        return True
+    marker = f"{attributes.get('class') or ''} {attributes.get('id') or ''}"
+    return bool(BOILERPLATE_PATTERN.search(marker))
+
+def _protected(main_nodes, key, parent):
+    # Keys of the main content candidates and all their ancestors
+    keys = set()
+    for node in main_nodes:
+        while node is not None and key(node) not in keys:
+            keys.add(key(node))
+            node = parent(node)
+    return keys
+
+def _removable(nodes, protected, key, parent):
+    # The outermost of nodes that contain none of the main content; nodes
+    # inside another removed node go with it
+    candidates = {key(node) for node in nodes if key(node) not in protected}
+    removable = []
+    for node in nodes:
+        if key(node) not in candidates:
+            continue
+        ancestor = parent(node)
+        while ancestor is not None and key(ancestor) not in candidates:
+            ancestor = parent(ancestor)
+        if ancestor is None:
+            removable.append(node)
+    return removable
+
+def clean_lines(text):
+    # Collapses runs of whitespace and drops separator-only lines ("|", "»")
+    # and a line repeated right after itself; the same line further down
+    # (table cells, prices) is kept
+    lines = []
+    previous = None
+    for line in text.split("\n"):
+        line = " ".join(line.split())
+        if not any(ch.isalnum() for ch in line):
+            continue
+        key = line.lower()
+        if key == previous:
+            continue
+        previous = key
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# === Extractor backends ===
+# Each backend takes the raw HTML (bytes or str) and returns
+# (text, links, canonical, page_chars); links and canonical are only filled
+# in when with_links is set, and page_chars is the length of the page's
+# whole text before boilerplate was stripped. Boilerplate that contains a
+# main content candidate (MAIN_SELECTORS) is never stripped.
+def _selectolax_extract(content, base_url, with_links):
+    tree = LexborHTMLParser(content)
+    links, canonical = [], None
+    if with_links:
+        links = [urljoin(base_url, node.attributes["href"]) for node in tree.css("a[href]")]
+        node = tree.css_first("link[rel=canonical][href]")
+        canonical = urljoin(base_url, node.attributes["href"]) if node is not None else None
+
+    root = tree.body or tree.root
+    if root is None:
+        return "", links, canonical, 0
+    tree.strip_tags(NON_TEXT_TAGS)
+    page_chars = len(root.text(separator="\n", strip=True))
+    key, parent = (lambda node: node.mem_id), (lambda node: node.parent)
+    protected = _protected([node for selector in MAIN_SELECTORS for node in tree.css(selector)], key, parent)
+    boilerplate = [node for node in root.traverse() if _is_boilerplate(node.tag, node.attributes)]
+    for node in _removable(boilerplate, protected, key, parent):
+        node.decompose()
+
+    text = ""
+    for selector in MAIN_SELECTORS:
+        node = tree.css_first(selector)
+        if node is not None:
+            text = node.text(separator="\n", strip=True)
+            if len(text) >= MIN_MAIN_CHARS:
+                break
+    else:
+        text = root.text(separator="\n", strip=True)
+    return text, links, canonical, page_chars
+
+def _lxml_main_nodes(doc):
+    if _has_cssselect:
+        return [el for selector in MAIN_SELECTORS for el in doc.cssselect(selector)]
+    return doc.xpath("//main | //article | //*[@role='main']")
+
+def _lxml_extract(content, base_url, with_links):
+    doc = lxml.html.fromstring(content, base_url=base_url)
+    links, canonical = [], None
+    if with_links:
+        links = [urljoin(base_url, href) for href in doc.xpath("//a/@href")]
+        hrefs = doc.xpath("//link[@rel='canonical']/@href")
+        canonical = urljoin(base_url, hrefs[0]) if hrefs else None
+
+    etree.strip_elements(doc, etree.Comment, *NON_TEXT_TAGS, with_tail=False)
+    body = doc.find("body")
+    root = body if body is not None else doc
+    page_chars = len("\n".join(part.strip() for part in root.itertext() if part.strip()))
+    key, parent = (lambda el: el), (lambda el: el.getparent())
+    protected = _protected(_lxml_main_nodes(doc), key, parent)
+    boilerplate = [el for el in doc.iter() if isinstance(el.tag, str) and _is_boilerplate(el.tag, el.attrib)]
+    for el in _removable(boilerplate, protected, key, parent):
+        if el.getparent() is not None:
+            el.drop_tree()
+
+    text = ""
+    for selector in MAIN_SELECTORS:
+        found = doc.cssselect(selector) if _has_cssselect else []
+        if found:
+            text = "\n".join(part.strip() for part in found[0].itertext() if part.strip())
+            if len(text) >= MIN_MAIN_CHARS:
+                break
+    else:
+        text = "\n".join(part.strip() for part in root.itertext() if part.strip())
+    return text, links, canonical, page_chars
+
+def _bs4_attributes(node):
+    # bs4 returns multi-valued attributes such as class as lists
+    return {key: " ".join(value) if isinstance(value, list) else value for key, value in node.attrs.items()}
+
+def _bs4_extract(content, base_url, with_links):
+    soup = BeautifulSoup(content, "html.parser")
+    links, canonical = [], None
+    if with_links:
+        links = [urljoin(base_url, a["href"]) for a in soup.find_all("a", href=True)]
+        node = soup.find("link", rel="canonical", href=True)
+        canonical = urljoin(base_url, node["href"]) if node else None
+
+    for node in soup.find_all(NON_TEXT_TAGS):
+        node.decompose()
+    page_chars = len(soup.get_text(separator="\n", strip=True))
+    key, parent = id, (lambda node: node.parent)
+    protected = _protected([node for selector in MAIN_SELECTORS for node in soup.select(selector)], key, parent)
+    boilerplate = [node for node in soup.find_all(True) if _is_boilerplate(node.name, _bs4_attributes(node))]
+    for node in _removable(boilerplate, protected, key, parent):
+        node.decompose()
+
+    text = ""
+    for selector in MAIN_SELECTORS:
+        node = soup.select_one(selector)
+        if node is not None:
+            text = node.get_text(separator="\n", strip=True)
+            if len(text) >= MIN_MAIN_CHARS:
+                break
+    else:
+        text = soup.get_text(separator="\n", strip=True)
+    return text, links, canonical, page_chars
+
+def _legacy_extract(content, base_url, with_links):
+    # The original behaviour: every piece of text on the page, nothing stripped
+    soup = BeautifulSoup(content, "html.parser")
+    links, canonical = [], None
+    if with_links:
+        links = [urljoin(base_url, a["href"]) for a in soup.find_all("a", href=True)]
+        node = soup.find("link", rel="canonical", href=True)
+        canonical = urljoin(base_url, node["href"]) if node else None
+    text = soup.get_text(separator="\n", strip=True)
+    return text, links, canonical, len(text)
+
+
+EXTRACTORS = {}  # name -> backend function, in order of preference
+if LexborHTMLParser is not None:
+    EXTRACTORS["selectolax"] = _selectolax_extract
+if lxml is not None:
+    EXTRACTORS["lxml"] = _lxml_extract
+if BeautifulSoup is not None:
+    EXTRACTORS["bs4"] = _bs4_extract
+    EXTRACTORS["legacy"] = _legacy_extract
+
+def register_extractor(name, backend):
+    EXTRACTORS[name] = backend
+
+def get_extractor(name=None):
+    name = name or EXTRACTOR
+    if name != "auto":
+        if name not in EXTRACTORS:
+            raise ValueError(f"Unknown or unavailable HTML extractor: {name}")
+        return name, EXTRACTORS[name]
+    if not EXTRACTORS:
+        raise ImportError("No HTML parser installed; install selectolax, lxml or beautifulsoup4")
+    name = next(iter(EXTRACTORS))
+    return name, EXTRACTORS[name]
+
+
+# === Function to turn HTML into prompt-ready text ===
+def extract(content, base_url="", with_links=False, extractor=None):
+    name, backend = get_extractor(extractor)
+    can_fall_back = name != "legacy" and "legacy" in EXTRACTORS
+    with stage("extract"):
+        try:
+            text, links, canonical, page_chars = backend(content, base_url, with_links)
+        except Exception as e:
+            if not can_fall_back:
+                raise
+            logger.error("%s extractor failed for %s, falling back: %s", name, base_url or "page", e)
+            text, page_chars = "", 0
+        mostly_stripped = bool(page_chars) and len(text) < MIN_TEXT_RATIO * page_chars
+        text = clean_lines(text)
+
+        if (not text or mostly_stripped) and can_fall_back:
+            # A parse failure, or most of the page looked like boilerplate;
+            # better the whole page than losing its content
+            text, links, canonical, _ = _legacy_extract(content, base_url, with_links)
+            text = clean_lines(text)
+
+    result = {"text": text}
+    if with_links:
+        result["links"] = links
+        result["canonical"] = canonical
+    return result
+
+def extract_text(content):
+    return extract(content)["text"]
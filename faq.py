@@ -0,0 +1,227 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter
+
+from answer_cache import MAX_HISTORY_MESSAGES, SIMILARITY_THRESHOLD, _cosine, normalize_question
+from kb_store import combine_pages
+from prompt_budget import count_tokens, system_prefix
+from retrieval import tokenize
+from telemetry import describe, get_logger, inc
+
+logger = get_logger("faq")
+describe("sarthi_faq_hits_total", "counter", "Bot messages answered from the precomputed FAQ")
+describe("sarthi_faq_builds_total", "counter", "FAQ builds by result")
+
+# === FAQ settings ===
+FAQ_QUESTIONS = int(os.environ.get("SARTHI_FAQ_QUESTIONS", "12"))  # Questions generated per bot
+FAQ_BATCH_SIZE = 4  # Questions answered per LLM call
+FAQ_CALL_INTERVAL = float(os.environ.get("SARTHI_FAQ_CALL_INTERVAL", "2"))  # Seconds between builder LLM calls
+FAQ_WEIGHT = 0.25  # Share of the LLM slots next to a bot's live visitors (weight 1)
+FAQ_CONTEXT_TOKENS = 2500  # Website content sent per generation call
+FAQ_RETRY_SECONDS = 10 * 60  # A stale or failed FAQ is rebuilt at most this often
+FAQ_LEASE_SECONDS = 15 * 60  # One process per host builds a bot's FAQ at a time
+
+QUESTIONS_PROMPT = (
+    "List the {count} questions a visitor of this website is most likely to ask, one per line, "
+    "most common first. Write only the questions, without numbering or answers."
+)
+ANSWERS_PROMPT = (
+    "Answer each of these visitor questions from the website content, as you would in the chat. "
+    "Reply with only a JSON array of strings: one answer per question, in the same order.\n\n{questions}"
+)
+LIST_MARKER_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)]|Q\d*[:.])\s*")
+
+
+# === Matching visitor messages against a bot's FAQ ===
+# A bot's FAQ is stored in its config as
+#   "faq": {"version": <answer cache version>, "built_at": ..., "questions": [{"question", "answer"}]}
+# and is only used while the version matches the bot's current knowledge
+# base and instructions. Matching follows the answer cache: the normalized
+# question, else the closest question above the similarity threshold.
+def faq_is_stale(config, version):
+    faq = config.get("faq")
+    return bool(faq) and faq.get("version") != version
+
+def faq_answer(config, version, message, history=None):
+    faq = config.get("faq")
+    if not faq or faq.get("version") != version or len(history or []) > MAX_HISTORY_MESSAGES:
+        return None
+    normalized = normalize_question(message)
+    terms = Counter(tokenize(normalized))
+    best_answer, best_score = None, 0.0
+    for entry in faq.get("questions", []):
+        question = normalize_question(entry["question"])
+        if question == normalized:
+            inc("sarthi_faq_hits_total", match="exact")
+            return entry["answer"]
+        score = _cosine(terms, Counter(tokenize(question)))
+        if score > best_score:
+            best_answer, best_score = entry["answer"], score
+    if best_answer is not None and best_score >= SIMILARITY_THRESHOLD:
+        inc("sarthi_faq_hits_total", match="near")
+        return best_answer
+    return None
+
+
+# === Parsing the model's replies ===
+def parse_questions(text, count):
+    questions = []
+    seen = set()
+    for line in text.splitlines():
+        question = LIST_MARKER_RE.sub("", line).strip().strip('"').strip()
+        normalized = normalize_question(question)
+        if len(normalized) < 5 or normalized in seen:
+            continue
+        seen.add(normalized)
+        questions.append(question)
+        if len(questions) == count:
+            break
+    return questions
+
+def parse_answers(text, count):
+    # Returns the list of answers, or None unless there is one per question
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        answers = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(answers, list) or len(answers) != count:
+        return None
+    if not all(isinstance(answer, str) and answer.strip() for answer in answers):
+        return None
+    return [answer.strip() for answer in answers]
+
+
+# === Background FAQ builder ===
+# Generates a bot's likely visitor questions from its knowledge base with
+# one LLM call, then answers them FAQ_BATCH_SIZE at a time, and stores the
+# result with the bot. Calls are spaced FAQ_CALL_INTERVAL apart across all
+# bots of the process and go through the gateway at FAQ_WEIGHT, so a build
+# never crowds out live visitors. Builds run on one background thread;
+# schedule() is cheap to call from the request path.
+class FaqBuilder:
+    def __init__(self, gateway, kb_store, registry, version_for, shared=None, questions=FAQ_QUESTIONS,
+                 batch_size=FAQ_BATCH_SIZE, call_interval=FAQ_CALL_INTERVAL):
+        self.gateway = gateway
+        self.kb_store = kb_store
+        self.registry = registry
+        self.version_for = version_for  # (index, config) -> version the FAQ is valid for
+        self.shared = shared
+        self.questions = questions
+        self.batch_size = batch_size
+        self.call_interval = call_interval
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._attempted = {}  # bot_id -> time of the last scheduled build
+        self._lock = threading.Lock()
+        self._pace_lock = threading.Lock()
+        self._next_call = 0.0
+        self._thread = None
+
+    def schedule(self, bot_id):
+        # Queues a background build; False if one is queued or ran recently
+        if self.questions <= 0:
+            return False
+        now = time.time()
+        with self._lock:
+            if bot_id in self._pending or now - self._attempted.get(bot_id, 0) < FAQ_RETRY_SECONDS:
+                return False
+            self._pending.add(bot_id)
+            self._attempted[bot_id] = now
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="faq-builder", daemon=True)
+                self._thread.start()
+        self._queue.put(bot_id)
+        return True
+
+    def _run(self):
+        while True:
+            bot_id = self._queue.get()
+            try:
+                self.build(bot_id)
+            except Exception as e:
+                logger.exception("FAQ build failed for bot %s: %s", bot_id, e)
+            finally:
+                with self._lock:
+                    self._pending.discard(bot_id)
+
+    def _complete(self, bot_id, messages):
+        # One paced LLM call; raises on upstream errors
+        with self._pace_lock:
+            wait = self._next_call - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._next_call = time.monotonic() + self.call_interval
+        return "".join(self.gateway.stream(messages, f"faq:{bot_id}", FAQ_WEIGHT))
+
+    def _messages(self, config, index, query, instruction):
+        context = combine_pages(index.select_pages(query, budget_tokens=FAQ_CONTEXT_TOKENS, count_tokens=count_tokens))
+        prefix, _ = system_prefix(config.get("custom_prompt", ""))
+        return [{"role": "system", "content": prefix + context}, {"role": "user", "content": instruction}]
+
+    def build(self, bot_id):
+        # Returns the number of questions answered (0 if nothing was stored)
+        lease = f"faq:{bot_id}"
+        if self.shared is not None and not self.shared.try_lease(lease, FAQ_LEASE_SECONDS):
+            return 0
+        try:
+            return self._build(bot_id)
+        finally:
+            if self.shared is not None:
+                self.shared.release_lease(lease)
+
+    def _build(self, bot_id):
+        config = self.registry.get(bot_id)
+        if config is None:
+            return 0
+        index = self.kb_store.get_index(bot_id, config.get("urls", []))
+        if not index.chunk_count:
+            inc("sarthi_faq_builds_total", result="empty")
+            return 0
+        version = self.version_for(index, config)
+        started = time.perf_counter()
+
+        overview = " ".join(filter(None, [config.get("name"), config.get("description")]))
+        try:
+            reply = self._complete(bot_id, self._messages(config, index, overview,
+                                                          QUESTIONS_PROMPT.format(count=self.questions)))
+        except Exception as e:
+            logger.warning("FAQ questions failed for bot %s: %s", bot_id, e)
+            inc("sarthi_faq_builds_total", result="failed")
+            return 0
+        questions = parse_questions(reply, self.questions)
+
+        entries = []
+        for start in range(0, len(questions), self.batch_size):
+            batch = questions[start:start + self.batch_size]
+            instruction = ANSWERS_PROMPT.format(questions=json.dumps(batch, ensure_ascii=False))
+            try:
+                answers = parse_answers(self._complete(bot_id, self._messages(config, index, " ".join(batch),
+                                                                              instruction)), len(batch))
+            except Exception as e:
+                logger.warning("FAQ answers failed for bot %s: %s", bot_id, e)
+                answers = None
+            if answers is None:
+                logger.warning("Skipped %d FAQ question(s) of bot %s: no usable answers", len(batch), bot_id)
+                continue
+            entries.extend({"question": question, "answer": answer} for question, answer in zip(batch, answers))
+        if not entries:
+            inc("sarthi_faq_builds_total", result="failed")
+            return 0
+
+        # Re-read the config so edits made during the build are kept
+        config = self.registry.get(bot_id)
+        if config is None:
+            return 0
+        config["faq"] = {"version": version, "built_at": time.time(), "questions": entries}
+        self.registry.put(config)
+        inc("sarthi_faq_builds_total", result="built")
+        logger.info("Built FAQ for bot %s: %d question(s) in %.1fs", bot_id, len(entries),
+                    time.perf_counter() - started)
+        return len(entries)
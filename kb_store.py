@@ -0,0 +1,583 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from page_store import PageStore, compress, decompress
+from retrieval import BM25Index, index_version, text_hash
+from telemetry import get_logger
+
+logger = get_logger("kb_store")
+
+# === Knowledge base cache settings ===
+DEFAULT_TTL = 6 * 60 * 60  # Revalidate cached pages every 6 hours
+DEFAULT_MAX_BYTES = int(os.environ.get("SARTHI_KB_MEMORY_BYTES", str(64 * 1024 * 1024)))  # In-memory budget across all bots
+REFRESH_LEASE_SECONDS = 5 * 60  # One worker per host revalidates a bot at a time
+PAGE_REFERENCE_BYTES = 2048  # Rough memory per shared page a bot refers to (its entry and index terms)
+
+CONTENT_HEADER = "\n--- Content from {url} ---\n"
+CONTENT_HEADER_RE = re.compile(r"\n--- Content from (.+?) ---\n")
+
+# === Helpers for the combined knowledge base format ===
+def combine_pages(pages):
+    # pages is a list of (url, text) pairs, kept in input order
+    parts = []
+    for url, text in pages:
+        parts.append(CONTENT_HEADER.format(url=url))
+        parts.append(text)
+        parts.append("\n\n")
+    return "".join(parts)
+
+def split_combined_content(content):
+    # Inverse of combine_pages, returns a list of (url, text) pairs
+    if not content:
+        return []
+    pieces = CONTENT_HEADER_RE.split(content)
+    pages = []
+    for i in range(1, len(pieces) - 1, 2):
+        text = pieces[i + 1]
+        if text.endswith("\n\n"):
+            text = text[:-2]
+        pages.append((pieces[i].strip(), text))
+    return pages
+
+# === Tables used when the store is backed by the shared SQLite database ===
+KB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kb_bots (
+    bot_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS kb_bot_pages (
+    bot_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    page_url TEXT NOT NULL,
+    PRIMARY KEY (bot_id, url)
+);
+CREATE INDEX IF NOT EXISTS kb_bot_pages_by_page ON kb_bot_pages (page_url);
+CREATE TABLE IF NOT EXISTS kb_pages (
+    bot_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    text TEXT,
+    hash TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL,
+    PRIMARY KEY (bot_id, url)
+);
+CREATE TABLE IF NOT EXISTS kb_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# kb_pages holds each bot's own copy of its pages as written before the page
+# store; a bot's rows are moved into the page store the first time it is read.
+# Migrations run once per database, in order, and are recorded in kb_meta:
+#   2: drops the first kb_indexes table (chunk texts as JSON, one per bot)
+#   3: creates kb_indexes again, keyed by the index's fingerprint and
+#      holding compressed chunks with their term counts, so a worker loads
+#      the index another worker built instead of re-chunking and tokenizing
+KB_SCHEMA_VERSION = 3
+KB_MIGRATIONS = {
+    2: ["DROP TABLE IF EXISTS kb_indexes"],
+    3: ["""CREATE TABLE IF NOT EXISTS kb_indexes (
+        bot_id TEXT PRIMARY KEY,
+        version TEXT NOT NULL,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL
+    )"""],
+}
+LEGACY_PAGE_FIELDS = ("text", "hash", "etag", "last_modified", "fetched_at")
+SHARED_PAGE_FIELDS = ("hash", "etag", "last_modified", "fetched_at", "size")
+
+
+# === Per-bot knowledge base store ===
+# Keeps the scraped text of each bot keyed by bot_id and URL. Entries live in a
+# size-bounded LRU in memory and are persisted to chatbots/<bot_id>.content.json,
+# or to the shared SQLite database when one is given. Stale pages are
+# revalidated in the background with ETag/Last-Modified, so the request path
+# only ever reads cached text.
+#
+# With a shared store, every worker process on the host reads the same rows:
+# each save bumps the bot's revision, and a worker whose in-memory copy is of
+# an older revision reloads it on the next lookup. Page texts then live in the
+# content-addressed page store (see page_store.py) rather than with the bot:
+# a bot holds references (hash and validators), every page is fetched and
+# stored once however many bots list it, and the texts are read through the
+# page store's LRU.
+class KnowledgeBaseStore:
+    def __init__(self, directory="chatbots", fetch=None, fetch_many=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES,
+                 shared=None):
+        self.directory = directory
+        self.fetch = fetch
+        self.fetch_many = fetch_many
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.pages = None
+        if shared is not None:
+            shared.add_schema(KB_SCHEMA)
+            self.pages = PageStore(shared)
+        self._lru = OrderedDict()  # bot_id -> {url: entry}
+        self._indexes = {}  # bot_id -> BM25Index, evicted together with the pages
+        self._versions = {}  # bot_id -> content version, bumped whenever a page's text changes
+        self._revisions = {}  # bot_id -> shared store revision of the in-memory copy
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self._refreshing = set()
+        self._ready_pid = None  # Process that last checked the schema version
+
+    def _path(self, bot_id):
+        return os.path.join(self.directory, f"{bot_id}.content.json")
+
+    def _index_path(self, bot_id):
+        return os.path.join(self.directory, f"{bot_id}.index.json")
+
+    # --- In-memory LRU ---
+    def _remember(self, bot_id, pages):
+        if self.pages is not None:
+            # Only references are kept per bot; the texts are shared
+            pages = {url: self._reference(entry) for url, entry in pages.items()}
+        size = sum(len(entry["text"]) if entry.get("text") is not None else PAGE_REFERENCE_BYTES
+                   for entry in pages.values())
+        with self._lock:
+            if bot_id in self._lru:
+                self._total_bytes -= self._sizes.pop(bot_id, 0)
+                del self._lru[bot_id]
+            self._lru[bot_id] = pages
+            self._sizes[bot_id] = size
+            self._total_bytes += size
+            # Evict least recently used bots, but never the one just stored
+            while self._total_bytes > self.max_bytes and len(self._lru) > 1:
+                old_id, _ = self._lru.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(old_id, 0)
+                self._indexes.pop(old_id, None)
+        return pages
+
+    def _reference(self, entry):
+        if entry.get("text") is None:
+            return entry
+        reference = {field: entry.get(field) for field in SHARED_PAGE_FIELDS}
+        reference["hash"] = reference["hash"] or text_hash(entry["text"])
+        reference["size"] = len(entry["text"])
+        return reference
+
+    def _text(self, entry):
+        if entry.get("text") is not None:
+            return entry["text"]
+        if self.pages is not None and entry.get("hash"):
+            return self.pages.text(entry["hash"])
+        return None
+
+    def _lookup(self, bot_id):
+        with self._lock:
+            pages = self._lru.get(bot_id)
+        if pages is not None and (self.shared is None or self._shared_revision(bot_id) == self._revisions.get(bot_id)):
+            with self._lock:
+                if bot_id in self._lru:
+                    self._lru.move_to_end(bot_id)
+            return pages
+
+        data = self._read_file(bot_id) if self.shared is None else self._read_shared(bot_id)
+        if data is None:
+            return None
+        self._versions[bot_id] = data.get("version", 1)
+        return self._remember(bot_id, data.get("pages", {}))
+
+    # --- Disk persistence ---
+    def _read_file(self, bot_id):
+        path = self._path(bot_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to read knowledge base %s: %s", path, e)
+            return None
+
+    def _write_json(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _save(self, bot_id, pages):
+        if self.shared is not None:
+            self._save_shared(bot_id, pages)
+            return
+        data = {"id": bot_id, "version": self._versions.get(bot_id, 1), "pages": pages}
+        self._write_json(self._path(bot_id), data)
+
+    # --- Shared SQLite persistence ---
+    def _connect(self):
+        conn = self.shared.connect()
+        if self._ready_pid != os.getpid():
+            with self._lock:
+                if self._ready_pid != os.getpid():
+                    self._migrate_shared()
+                    self._ready_pid = os.getpid()
+        return conn
+
+    def _schema_version(self, conn):
+        row = conn.execute("SELECT value FROM kb_meta WHERE key = 'schema_version'").fetchone()
+        return int(row[0]) if row else 1
+
+    def _migrate_shared(self):
+        if self._schema_version(self.shared.connect()) >= KB_SCHEMA_VERSION:
+            return
+        with self.shared.transaction() as conn:
+            # Another worker may have migrated it meanwhile
+            current = self._schema_version(conn)
+            for version in range(current + 1, KB_SCHEMA_VERSION + 1):
+                for statement in KB_MIGRATIONS.get(version, []):
+                    conn.execute(statement)
+            if current < KB_SCHEMA_VERSION:
+                conn.execute("INSERT OR REPLACE INTO kb_meta (key, value) VALUES ('schema_version', ?)",
+                             (str(KB_SCHEMA_VERSION),))
+
+    def _shared_revision(self, bot_id):
+        row = self._connect().execute("SELECT revision FROM kb_bots WHERE bot_id = ?", (bot_id,)).fetchone()
+        return row[0] if row else None
+
+    def _read_shared(self, bot_id):
+        conn = self._connect()
+        # A consistent snapshot of the bot's row and its pages
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT version, revision FROM kb_bots WHERE bot_id = ?", (bot_id,)).fetchone()
+            rows = conn.execute(
+                "SELECT r.url, p.hash, p.etag, p.last_modified, p.fetched_at, b.size FROM kb_bot_pages r "
+                "JOIN pages p ON p.url = r.page_url JOIN page_blobs b ON b.hash = p.hash WHERE r.bot_id = ?",
+                (bot_id,),
+            ).fetchall() if row else []
+            legacy = conn.execute(
+                "SELECT url, text, hash, etag, last_modified, fetched_at FROM kb_pages WHERE bot_id = ?", (bot_id,)
+            ).fetchall() if row and not rows else []
+        finally:
+            conn.execute("COMMIT")
+        if row is None:
+            # Knowledge bases written before the shared store are moved into it once
+            data = self._read_file(bot_id)
+            if data is not None:
+                self._versions[bot_id] = data.get("version", 1)
+                self._save_shared(bot_id, data.get("pages", {}))
+            return data
+        if legacy:
+            # So are pages stored per bot before the page store
+            self._versions[bot_id] = row[0]
+            pages = {url: dict(zip(LEGACY_PAGE_FIELDS, fields)) for url, *fields in legacy}
+            self._save_shared(bot_id, pages)
+            return {"id": bot_id, "version": row[0], "pages": pages}
+        self._revisions[bot_id] = row[1]
+        pages = {url: dict(zip(SHARED_PAGE_FIELDS, fields)) for url, *fields in rows}
+        return {"id": bot_id, "version": row[0], "pages": pages}
+
+    def _save_shared(self, bot_id, pages):
+        self._connect()
+        with self.shared.transaction() as conn:
+            refs = []
+            changed = set()
+            for url, entry in pages.items():
+                page_url, page_changed = self.pages.write(conn, url, entry)
+                refs.append((bot_id, url, page_url))
+                if page_changed:
+                    changed.add(page_url)
+            conn.execute(
+                "INSERT INTO kb_bots (bot_id, version) VALUES (?, ?) "
+                "ON CONFLICT (bot_id) DO UPDATE SET version = excluded.version, revision = revision + 1",
+                (bot_id, self._versions.get(bot_id, 1)),
+            )
+            conn.execute("DELETE FROM kb_bot_pages WHERE bot_id = ?", (bot_id,))
+            conn.executemany("INSERT OR REPLACE INTO kb_bot_pages (bot_id, url, page_url) VALUES (?, ?, ?)", refs)
+            conn.execute("DELETE FROM kb_pages WHERE bot_id = ?", (bot_id,))
+            # Other bots showing a page whose text just changed reload it
+            for page_url in changed:
+                conn.execute(
+                    "UPDATE kb_bots SET version = version + 1, revision = revision + 1 WHERE bot_id IN "
+                    "(SELECT bot_id FROM kb_bot_pages WHERE page_url = ? AND bot_id != ?)",
+                    (page_url, bot_id),
+                )
+            revision = conn.execute("SELECT revision FROM kb_bots WHERE bot_id = ?", (bot_id,)).fetchone()[0]
+        self._revisions[bot_id] = revision
+
+    def _save_index(self, bot_id, index):
+        if self.shared is None:
+            self._write_json(self._index_path(bot_id), index.to_dict())
+            return
+        conn = self._connect()
+        # Workers that rebuilt the same index don't each write it again
+        row = conn.execute("SELECT version FROM kb_indexes WHERE bot_id = ?", (bot_id,)).fetchone()
+        if row is not None and row[0] == index.version:
+            return
+        codec, data = compress(json.dumps(index.to_dict(with_terms=True)))
+        conn.execute(
+            "INSERT INTO kb_indexes (bot_id, version, codec, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (bot_id) DO UPDATE SET version = excluded.version, codec = excluded.codec, "
+            "data = excluded.data",
+            (bot_id, index.version, codec, data),
+        )
+
+    def _bump_version(self, bot_id):
+        with self._lock:
+            self._versions[bot_id] = self._versions.get(bot_id, 0) + 1
+            return self._versions[bot_id]
+
+    def version(self, bot_id):
+        self._lookup(bot_id)
+        return self._versions.get(bot_id, 0)
+
+    # --- Public API ---
+    def put_pages(self, bot_id, pages):
+        # pages maps url -> text (freshly scraped)
+        now = time.time()
+        entries = {
+            url: {"text": text, "hash": text_hash(text), "etag": None, "last_modified": None, "fetched_at": now}
+            for url, text in pages.items()
+        }
+        if self.pages is not None:
+            # A page identical to the stored copy keeps its validators and age
+            for url, stored in self.pages.lookup(list(entries)).items():
+                if stored["hash"] == entries[url]["hash"]:
+                    entries[url].update(etag=stored["etag"], last_modified=stored["last_modified"],
+                                        fetched_at=stored["fetched_at"])
+        if self._lookup(bot_id) is not None:
+            self._bump_version(bot_id)
+        else:
+            self._versions[bot_id] = 1
+        self._remember(bot_id, entries)
+        self._save(bot_id, entries)
+        # Build the retrieval index up front so the first visitor doesn't pay for it
+        self.get_index(bot_id, list(entries))
+
+    def put_content(self, bot_id, content):
+        # Accepts the combined text produced by scrape_multiple_urls
+        self.put_pages(bot_id, dict(split_combined_content(content)))
+
+    def invalidate(self, bot_id):
+        with self._lock:
+            self._indexes.pop(bot_id, None)
+            if bot_id in self._lru:
+                self._total_bytes -= self._sizes.pop(bot_id, 0)
+                del self._lru[bot_id]
+
+    def get_index(self, bot_id, urls):
+        urls = [url.strip() for url in urls if url and url.strip()]
+        pages = self._pages_for(bot_id, urls)
+        wanted = OrderedDict()
+        for url in urls:
+            entry = pages.get(url)
+            if not entry:
+                continue
+            if entry.get("text") is not None and not entry.get("hash"):
+                entry["hash"] = text_hash(entry["text"])
+            if entry.get("hash"):
+                # The text is only read if the index doesn't have the page yet
+                wanted[url] = (entry["hash"], lambda entry=entry: self._text(entry))
+
+        wanted_version = index_version({url: page_hash for url, (page_hash, _) in wanted.items()})
+        with self._lock:
+            index = self._indexes.get(bot_id)
+        if index is None or index.version != wanted_version:
+            # The stored index may already cover the current pages (built by
+            # another worker); otherwise only the changed pages are indexed
+            stored = self._load_index(bot_id)
+            if index is None or stored.version == wanted_version:
+                index = stored
+        new_index = index.updated(wanted)
+        if new_index is not index:
+            try:
+                self._save_index(bot_id, new_index)
+            except (OSError, sqlite3.Error) as e:
+                logger.error("Failed to save retrieval index for bot %s: %s", bot_id, e)
+        with self._lock:
+            self._indexes[bot_id] = new_index
+        return new_index
+
+    def _load_index(self, bot_id):
+        if self.shared is not None:
+            row = self._connect().execute("SELECT codec, data FROM kb_indexes WHERE bot_id = ?",
+                                          (bot_id,)).fetchone()
+            if row is not None:
+                try:
+                    return BM25Index.from_dict(json.loads(decompress(row[0], row[1])))
+                except (ValueError, KeyError, TypeError, zlib.error) as e:
+                    logger.error("Failed to read retrieval index of bot %s: %s", bot_id, e)
+            return BM25Index()
+        path = self._index_path(bot_id)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return BM25Index.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error("Failed to read retrieval index %s: %s", path, e)
+        return BM25Index()
+
+    def _pages_for(self, bot_id, urls):
+        pages = self._lookup(bot_id)
+        if pages is None:
+            pages = {}
+
+        # Bots created before the cache existed have nothing stored yet;
+        # fetch those pages once and keep them from then on. Pages another bot
+        # already fetched are taken from the page store instead.
+        missing = [url for url in urls if url not in pages]
+        if missing and self.pages is not None:
+            known = self.pages.lookup(missing)
+            if known:
+                pages = self._add_entries(bot_id, known)
+                missing = [url for url in missing if url not in known]
+        if missing and self.fetch:
+            pages = self.store_results(bot_id, self._fetch_all(missing, lambda url: self.fetch(url)))
+
+        now = time.time()
+        if any(now - pages[url].get("fetched_at", 0) > self.ttl for url in urls if url in pages):
+            self._refresh_in_background(bot_id, urls)
+        return pages
+
+    def missing_urls(self, bot_id, urls):
+        # URLs that have to be fetched before the bot can answer
+        pages = self._lookup(bot_id) or {}
+        missing = [url.strip() for url in urls if url and url.strip() and url.strip() not in pages]
+        if missing and self.pages is not None:
+            known = self.pages.lookup(missing)
+            missing = [url for url in missing if url not in known]
+        return missing
+
+    def known_pages(self, urls):
+        # Texts of the given URLs that some bot fetched within the TTL, so a
+        # new bot doesn't fetch them again; {} without a shared store
+        if self.pages is None:
+            return {}
+        found = {}
+        for url, entry in self.pages.lookup(urls, max_age=self.ttl).items():
+            text = self.pages.text(entry["hash"])
+            if text is not None:
+                found[url] = text
+        return found
+
+    def _add_entries(self, bot_id, entries):
+        pages = dict(self._lookup(bot_id) or {})
+        pages.update(entries)
+        if entries:
+            self._bump_version(bot_id)
+        self._save(bot_id, pages)
+        return self._remember(bot_id, pages)
+
+    def store_results(self, bot_id, results):
+        # Stores fetch results (as returned by fetch_page) obtained elsewhere,
+        # e.g. by the async API fetching cold pages itself
+        entries = {result["url"]: self._entry_from_result(result) for result in results
+                   if result.get("text") is not None}
+        return self._add_entries(bot_id, entries)
+
+    def get_content(self, bot_id, urls):
+        urls = [url.strip() for url in urls if url and url.strip()]
+        pages = self._pages_for(bot_id, urls)
+        combined = combine_pages([(url, text) for url, text in
+                                  ((url, self._text(pages[url])) for url in urls if url in pages)
+                                  if text is not None])
+        if not combined:
+            return "[ERROR] Failed to fetch content from any of the provided URLs"
+        return combined
+
+    # --- Revalidation ---
+    def _entry_from_result(self, result, previous=None):
+        entry = dict(previous or {})
+        if result.get("text") is not None:
+            entry["text"] = result["text"]
+            entry["hash"] = text_hash(result["text"])
+        entry["etag"] = result.get("etag") or entry.get("etag")
+        entry["last_modified"] = result.get("last_modified") or entry.get("last_modified")
+        entry["fetched_at"] = time.time()
+        return entry
+
+    def _fetch_all(self, urls, fetch):
+        if self.fetch_many:
+            return self.fetch_many(urls, fetch=fetch)
+        return [dict(fetch(url), url=url) for url in urls]
+
+    def revalidate(self, bot_id, urls, max_age=None):
+        # Conditionally re-fetches pages older than max_age (default: the TTL)
+        # and returns the URLs whose extracted text actually changed
+        max_age = self.ttl if max_age is None else max_age
+        pages = dict(self._lookup(bot_id) or {})
+        now = time.time()
+        stale = [url for url in urls if url not in pages or now - pages[url].get("fetched_at", 0) > max_age]
+
+        def conditional_fetch(url):
+            entry = pages.get(url) or {}
+            return self.fetch(url, etag=entry.get("etag"), last_modified=entry.get("last_modified"))
+
+        touched = False
+        changed_urls = []
+        if stale and self.pages is not None:
+            # Shared pages another bot revalidated recently aren't fetched again
+            fresh = self.pages.lookup(stale, max_age=max_age)
+            for url, entry in fresh.items():
+                if (pages.get(url) or {}).get("hash") != entry["hash"]:
+                    changed_urls.append(url)
+                pages[url] = entry
+                touched = True
+            stale = [url for url in stale if url not in fresh]
+        for result in self._fetch_all(stale, conditional_fetch):
+            url = result["url"]
+            entry = pages.get(url)
+            if result.get("status") == 304:
+                pages[url] = self._entry_from_result({}, entry)
+            elif result.get("text") is not None:
+                pages[url] = self._entry_from_result(result, entry)
+                # A 200 with the same text (no validators, or a new ETag only) is not a change
+                if not entry or entry.get("hash") != pages[url]["hash"]:
+                    changed_urls.append(url)
+            else:
+                # Keep serving the stale copy if the site is unreachable
+                logger.error("Revalidation failed for %s: %s", url, result.get("error"))
+                continue
+            touched = True
+        if changed_urls:
+            self._bump_version(bot_id)
+        if touched:
+            self._remember(bot_id, pages)
+            self._save(bot_id, pages)
+        return changed_urls
+
+    def collect_garbage(self):
+        # Drops shared pages no bot refers to any more; returns (pages, texts)
+        # removed, or None without a shared store
+        if self.pages is None:
+            return None
+        return self.pages.collect_garbage("SELECT page_url FROM kb_bot_pages")
+
+    def _refresh_in_background(self, bot_id, urls):
+        if not self.fetch:
+            return
+        with self._lock:
+            if bot_id in self._refreshing:
+                return
+            self._refreshing.add(bot_id)
+        # Other workers see the same stale pages; only one of them refreshes
+        lease = f"refresh:{bot_id}"
+        if self.shared is not None and not self.shared.try_lease(lease, REFRESH_LEASE_SECONDS):
+            with self._lock:
+                self._refreshing.discard(bot_id)
+            return
+
+        def run():
+            try:
+                self.revalidate(bot_id, urls)
+            except Exception as e:
+                logger.error("Background refresh failed for bot %s: %s", bot_id, e)
+            finally:
+                if self.shared is not None:
+                    self.shared.release_lease(lease)
+                with self._lock:
+                    self._refreshing.discard(bot_id)
+
+        threading.Thread(target=run, daemon=True).start()
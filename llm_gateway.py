@@ -0,0 +1,529 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from telemetry import describe, get_logger, inc, observe
+
+logger = get_logger("llm")
+describe("sarthi_llm_coalesced_total", "counter", "Callers served by another caller's in-flight LLM call")
+
+# === LLM gateway settings ===
+MAX_CONCURRENT_CALLS = 32  # Upstream calls in flight per process (per event loop for async)
+MAX_PENDING_CALLS = 256  # In flight plus queued; beyond this callers are turned away
+MAX_PENDING_PER_TENANT = 64  # The same, for one bot
+QUEUE_TIMEOUT = 10  # Seconds a call may wait for a free upstream slot
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5  # Seconds; doubled on every retry, with full jitter
+BACKOFF_MAX = 8
+FAILURE_THRESHOLD = 5  # Consecutive upstream failures that open the circuit
+COOLDOWN = 30  # Seconds the circuit stays open before a probe call is let through
+REQUEST_TIMEOUT = 60
+
+
+class LLMUnavailableError(Exception):
+    # Raised without calling upstream: the gateway is saturated or the circuit is open
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _openai():
+    # The SDK takes about a second to import; processes that never call the
+    # model (the dashboard before its first chat, CLI tools) don't pay for it
+    import openai
+    return openai
+
+def prompt_key(model, messages):
+    # Identical prompts (same bot instructions, context, history and question)
+    # share one key, and so one upstream call
+    payload = json.dumps([model, messages], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def is_retryable(error):
+    if isinstance(error, _openai().APIConnectionError):  # Includes timeouts
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+def backoff_delay(attempt, error=None, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    # Honours Retry-After when the provider sends one, else full jitter
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def error_kind(error):
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status is not None:
+        return "server_error" if status >= 500 else "client_error"
+    if isinstance(error, _openai().APIConnectionError):
+        return "connection"
+    return "error"
+
+def _chunk_text(chunk):
+    if chunk.choices and chunk.choices[0].delta:
+        return chunk.choices[0].delta.content  # None on role-only and final chunks
+    return None
+
+
+# === Circuit breaker ===
+# Opens after FAILURE_THRESHOLD consecutive retryable failures; while open,
+# calls fail fast. Once the cooldown has passed one probe call is let through
+# (and the cooldown restarts); its success closes the circuit again.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def check(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            wait = self.cooldown - (now - self.opened_at)
+            if wait > 0:
+                raise LLMUnavailableError("LLM service is temporarily unavailable", wait)
+            self.opened_at = now  # This caller is the probe
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+# === Weighted fair queue for upstream call slots ===
+# When every slot is busy, calls wait per tenant (bot) and a freed slot goes
+# to the call with the smallest virtual finish time: a tenant with weight w
+# gets w shares of the slots while it has calls waiting, so a bot with a
+# few questions is served next to a bot with a thousand queued instead of
+# behind them. Works for threads and for tasks of one event loop: wake() is
+# how a waiter is told it got the slot.
+class FairQueue:
+    def __init__(self, slots):
+        self.slots = slots
+        self.busy = 0
+        self._heap = []  # (finish tag, sequence, waiter)
+        self._finish = {}  # tenant -> finish tag of its last queued call
+        self._queued = Counter()  # tenant -> calls waiting
+        self._vtime = 0.0  # Finish tag of the call that got the last slot
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, tenant, weight, wake):
+        # Returns None when a slot is free right away, else the waiter
+        with self._lock:
+            if self.busy < self.slots:
+                self.busy += 1
+                return None
+            finish = max(self._vtime, self._finish.get(tenant, 0.0)) + 1.0 / max(weight, 0.01)
+            self._finish[tenant] = finish
+            self._queued[tenant] += 1
+            waiter = {"tenant": tenant, "wake": wake, "granted": False, "cancelled": False}
+            heapq.heappush(self._heap, (finish, next(self._sequence), waiter))
+            return waiter
+
+    def _forget(self, tenant):
+        # Called with the lock held when one of tenant's calls stops waiting;
+        # a tenant with nothing left waiting starts afresh next time
+        self._queued[tenant] -= 1
+        if self._queued[tenant] <= 0:
+            del self._queued[tenant]
+            self._finish.pop(tenant, None)
+
+    def _cancel(self, waiter):
+        # Returns True if the waiter got the slot after all
+        with self._lock:
+            if waiter["granted"]:
+                return True
+            waiter["cancelled"] = True
+            self._forget(waiter["tenant"])
+            return False
+
+    def release(self):
+        # The slot goes straight to the next waiter, if there is one
+        wake = None
+        with self._lock:
+            while self._heap:
+                finish, _, waiter = heapq.heappop(self._heap)
+                if waiter["cancelled"]:
+                    continue
+                self._vtime = finish
+                waiter["granted"] = True
+                self._forget(waiter["tenant"])
+                wake = waiter["wake"]
+                break
+            else:
+                self.busy -= 1
+        if wake is not None:
+            wake()
+
+    def acquire(self, tenant, weight=1.0, timeout=None):
+        event = threading.Event()
+        waiter = self._enqueue(tenant, weight, event.set)
+        if waiter is None or event.wait(timeout) or self._cancel(waiter):
+            return
+        raise LLMUnavailableError("LLM gateway is busy", 5)
+
+    async def aacquire(self, tenant, weight=1.0, timeout=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        waiter = self._enqueue(tenant, weight, wake)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if not self._cancel(waiter):
+                raise LLMUnavailableError("LLM gateway is busy", 5)
+        except asyncio.CancelledError:
+            if self._cancel(waiter):
+                self.release()
+            raise
+
+    def queued(self, tenant=None):
+        with self._lock:
+            return self._queued.get(tenant, 0) if tenant is not None else sum(self._queued.values())
+
+
+# One upstream call and everyone waiting on it. Tokens are kept so a caller
+# that joins late replays what it missed.
+class _Flight:
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.cancelled = False
+        self.tenant = None
+        self.task = None  # asyncio only
+        self.changed = None  # threading.Condition, or asyncio.Event replaced on every change
+
+
+# === Gateway to the OpenAI-compatible chat API ===
+# Every chat completion goes through here. Upstream calls run on their own
+# thread (or task) and stream into a shared flight, so identical prompts in
+# flight at the same time cost one call, and a caller that disconnects does
+# not cut off the others. A flight nobody listens to any more is cancelled.
+class LLMGateway:
+    def __init__(self, api_key, base_url, model, max_concurrent=MAX_CONCURRENT_CALLS,
+                 max_pending=MAX_PENDING_CALLS, max_pending_per_tenant=MAX_PENDING_PER_TENANT,
+                 queue_timeout=QUEUE_TIMEOUT, max_retries=MAX_RETRIES,
+                 failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, timeout=REQUEST_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.max_pending_per_tenant = max_pending_per_tenant
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self._client = None
+        self._queue = FairQueue(max_concurrent)
+        self._flights = {}  # prompt key -> _Flight
+        self._pending = 0
+        self._tenant_pending = Counter()  # tenant -> calls in flight or queued
+        self._lock = threading.Lock()
+        self._loops = {}  # event loop -> async client, slot queue and flights of that loop
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failures = 0
+
+    def preload(self):
+        # Servers call this before forking so the workers share the SDK's
+        # pages instead of each importing it on their first request
+        _openai()
+
+    def overloaded(self, tenant=None):
+        # Why a new call for tenant would be turned away right now ("circuit",
+        # "busy" or "tenant_busy", with a retry delay in seconds), or None
+        if self.breaker.state == "open":
+            return "circuit", self.breaker.cooldown - (time.monotonic() - (self.breaker.opened_at or 0))
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return "busy", 5
+            if tenant is not None and self._tenant_pending[tenant] >= self.max_pending_per_tenant:
+                return "tenant_busy", 2
+        return None
+
+    # --- Shared helpers ---
+    def _join(self, flights, key, start, tenant=None):
+        # Returns the flight for key, starting a new one if needed
+        with self._lock:
+            flight = flights.get(key)
+            if flight is not None and not flight.cancelled:
+                self.coalesced += 1
+                inc("sarthi_llm_coalesced_total")
+            else:
+                if self._pending >= self.max_pending:
+                    raise LLMUnavailableError("LLM gateway is busy", 5)
+                if tenant is not None and self._tenant_pending[tenant] >= self.max_pending_per_tenant:
+                    raise LLMUnavailableError("Too many questions for this bot right now", 2)
+                self.breaker.check()
+                flight = start()
+                flight.tenant = tenant
+                flights[key] = flight
+                self._pending += 1
+                self._tenant_pending[tenant] += 1
+                self.calls += 1
+            flight.followers += 1
+            return flight
+
+    def _leave(self, flight):
+        with self._lock:
+            flight.followers -= 1
+            if flight.followers == 0 and not flight.done:
+                flight.cancelled = True
+                return True
+        return False
+
+    def _finish(self, flights, key, flight):
+        with self._lock:
+            self._pending -= 1
+            self._tenant_pending[flight.tenant] -= 1
+            if self._tenant_pending[flight.tenant] <= 0:
+                del self._tenant_pending[flight.tenant]
+            if flights.get(key) is flight:
+                del flights[key]
+
+    def _failed(self, error, started, attempt):
+        # Returns the backoff delay before the next attempt, or raises
+        retryable = is_retryable(error)
+        inc("sarthi_llm_calls_total", outcome=error_kind(error))
+        if retryable:
+            self.breaker.record_failure()
+        elif getattr(error, "status_code", None) is not None:
+            self.breaker.record_success()  # A 4xx still means upstream is up
+        # Tokens already streamed cannot be taken back, so only a call that
+        # produced nothing is retried
+        if started or not retryable or attempt >= self.max_retries:
+            self.failures += 1
+            raise error
+        self.retries += 1
+        delay = backoff_delay(attempt, error)
+        logger.warning("LLM call failed (%s), retrying in %.1fs", error, delay)
+        return delay
+
+    # --- Blocking API ---
+    def _sync_client(self):
+        if self._client is None:
+            self._client = _openai().OpenAI(api_key=self.api_key, base_url=self.base_url,
+                                           max_retries=0, timeout=self.timeout)
+        return self._client
+
+    def _publish(self, flight, token):
+        with flight.changed:
+            flight.tokens.append(token)
+            flight.changed.notify_all()
+
+    def _succeeded(self, call_started):
+        self.breaker.record_success()
+        inc("sarthi_llm_calls_total", outcome="ok")
+        observe("sarthi_llm_upstream_seconds", time.perf_counter() - call_started, phase="total")
+
+    def _first_token(self, call_started):
+        observe("sarthi_llm_upstream_seconds", time.perf_counter() - call_started, phase="ttft")
+
+    def _call(self, messages, flight):
+        for attempt in range(self.max_retries + 1):
+            # Everyone stopped listening while the call was queued or backing off
+            if flight.cancelled:
+                return
+            if attempt:
+                self.breaker.check()
+            started = False
+            call_started = time.perf_counter()
+            try:
+                response = self._sync_client().chat.completions.create(
+                    model=self.model, messages=messages, stream=True
+                )
+                for chunk in response:
+                    if flight.cancelled:
+                        response.close()
+                        return
+                    token = _chunk_text(chunk)
+                    if token:
+                        if not started:
+                            started = True
+                            self._first_token(call_started)
+                        self._publish(flight, token)
+                self._succeeded(call_started)
+                return
+            except Exception as e:
+                time.sleep(self._failed(e, started, attempt))
+
+    def _run(self, key, flight, messages, tenant, weight):
+        try:
+            self._queue.acquire(tenant, weight, self.queue_timeout)
+            try:
+                self._call(messages, flight)
+            finally:
+                self._queue.release()
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._finish(self._flights, key, flight)
+            with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    def _start_flight(self, key, messages, tenant, weight):
+        flight = _Flight()
+        flight.changed = threading.Condition()
+        threading.Thread(target=self._run, args=(key, flight, messages, tenant, weight), name="llm-call",
+                         daemon=True).start()
+        return flight
+
+    def stream(self, messages, tenant=None, weight=1.0):
+        # Yields the answer's text deltas; raises on upstream errors. Calls
+        # are queued fairly per tenant when all upstream slots are busy.
+        key = prompt_key(self.model, messages)
+        flight = self._join(self._flights, key, lambda: self._start_flight(key, messages, tenant, weight), tenant)
+        try:
+            seen = 0
+            while True:
+                with flight.changed:
+                    while seen >= len(flight.tokens) and not flight.done:
+                        flight.changed.wait()
+                    new_tokens = flight.tokens[seen:]
+                    done = flight.done
+                seen += len(new_tokens)
+                yield from new_tokens
+                if done:
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            self._leave(flight)
+
+    # --- Async API (one client, slot pool and flight table per event loop) ---
+    def _loop_state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = {
+                "client": _openai().AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                                max_retries=0, timeout=self.timeout),
+                "queue": FairQueue(self.max_concurrent),
+                "flights": {},
+            }
+            self._loops[loop] = state
+        return state
+
+    def _apublish(self, flight, token=None):
+        if token is not None:
+            flight.tokens.append(token)
+        changed, flight.changed = flight.changed, asyncio.Event()
+        changed.set()
+
+    async def _acall(self, client, messages, flight):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.breaker.check()
+            started = False
+            call_started = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(
+                    model=self.model, messages=messages, stream=True
+                )
+                async for chunk in response:
+                    token = _chunk_text(chunk)
+                    if token:
+                        if not started:
+                            started = True
+                            self._first_token(call_started)
+                        self._apublish(flight, token)
+                self._succeeded(call_started)
+                return
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, started, attempt))
+
+    async def _arun(self, state, key, flight, messages, tenant, weight):
+        try:
+            await state["queue"].aacquire(tenant, weight, self.queue_timeout)
+            try:
+                await self._acall(state["client"], messages, flight)
+            finally:
+                state["queue"].release()
+        except asyncio.CancelledError:
+            flight.error = LLMUnavailableError("LLM call cancelled")
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._finish(state["flights"], key, flight)
+            flight.done = True
+            self._apublish(flight)
+
+    async def astream(self, messages, tenant=None, weight=1.0):
+        state = self._loop_state()
+        key = prompt_key(self.model, messages)
+
+        def start():
+            flight = _Flight()
+            flight.changed = asyncio.Event()
+            flight.task = asyncio.ensure_future(self._arun(state, key, flight, messages, tenant, weight))
+            return flight
+
+        flight = self._join(state["flights"], key, start, tenant)
+        try:
+            seen = 0
+            while True:
+                changed = flight.changed
+                if seen < len(flight.tokens):
+                    new_tokens = flight.tokens[seen:]
+                    seen += len(new_tokens)
+                    for token in new_tokens:
+                        yield token
+                    continue
+                if flight.done:
+                    break
+                await changed.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            if self._leave(flight):
+                flight.task.cancel()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "failures": self.failures,
+            "pending": self._pending,
+            "queued": self._queue.queued() + sum(state["queue"].queued() for state in list(self._loops.values())),
+            "circuit": self.breaker.state,
+        }
@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    import zstandard  # Optional: smaller and faster than zlib
+except ImportError:
+    zstandard = None
+
+from retrieval import text_hash
+from telemetry import get_logger
+
+logger = get_logger("page_store")
+
+# === Page store settings ===
+TEXT_CACHE_BYTES = int(os.environ.get("SARTHI_PAGE_CACHE_BYTES", str(32 * 1024 * 1024)))  # Decompressed texts in memory
+CODEC = "zstd" if zstandard is not None else "zlib"  # Used for new pages; stored per page, so both stay readable
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+PAGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL
+);
+CREATE INDEX IF NOT EXISTS pages_by_hash ON pages (hash);
+"""
+PAGE_FIELDS = ("hash", "etag", "last_modified", "fetched_at", "size")
+
+_zstd_local = threading.local()  # zstandard contexts aren't thread-safe
+
+def page_key(url):
+    # Pages are shared by normalized URL, so "https://Example.com/docs/" and
+    # "https://example.com/docs" are one page
+    from crawler import normalize_url  # Imported late: crawler -> scraper -> kb_store -> here
+    return normalize_url(url)
+
+def compress(text):
+    data = text.encode("utf-8")
+    if CODEC == "zstd":
+        if not hasattr(_zstd_local, "compressor"):
+            _zstd_local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return "zstd", _zstd_local.compressor.compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+def decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("page was stored with zstd, which is not installed")
+        if not hasattr(_zstd_local, "decompressor"):
+            _zstd_local.decompressor = zstandard.ZstdDecompressor()
+        return _zstd_local.decompressor.decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+# === Content-addressed page store shared by all bots ===
+# Every page is kept once, however many bots point at it: the pages table
+# maps a normalized URL to the hash of its current text (plus the
+# validators used to revalidate it), and page_blobs holds each distinct
+# text once, compressed. Bots only keep references (see kb_store), so a page
+# fetched for one bot is reused by every other bot that lists the same URL.
+# Recently used texts are kept decompressed in a small LRU.
+class PageStore:
+    def __init__(self, shared, text_cache_bytes=TEXT_CACHE_BYTES):
+        self.shared = shared
+        self.text_cache_bytes = text_cache_bytes
+        shared.add_schema(PAGES_SCHEMA)
+        self._texts = OrderedDict()  # hash -> text, least recently used first
+        self._text_bytes = 0
+        self._lock = threading.Lock()
+        self.text_hits = 0
+        self.text_misses = 0
+
+    # --- Decompressed texts ---
+    def _remember_text(self, page_hash, text):
+        with self._lock:
+            if page_hash in self._texts:
+                self._texts.move_to_end(page_hash)
+                return
+            self._texts[page_hash] = text
+            self._text_bytes += len(text)
+            while self._text_bytes > self.text_cache_bytes and len(self._texts) > 1:
+                _, old = self._texts.popitem(last=False)
+                self._text_bytes -= len(old)
+
+    def text(self, page_hash):
+        # None if the text is gone (replaced and collected since it was read)
+        with self._lock:
+            text = self._texts.get(page_hash)
+            if text is not None:
+                self._texts.move_to_end(page_hash)
+                self.text_hits += 1
+                return text
+            self.text_misses += 1
+        row = self.shared.connect().execute(
+            "SELECT codec, data FROM page_blobs WHERE hash = ?", (page_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            text = decompress(row[0], row[1])
+        except (ValueError, zlib.error) as e:
+            logger.error("Failed to read stored page %s: %s", page_hash, e)
+            return None
+        self._remember_text(page_hash, text)
+        return text
+
+    # --- Pages ---
+    def lookup(self, urls, max_age=None):
+        # Returns {url: entry} for the URLs some bot has already fetched
+        # (no older than max_age seconds, if given); entries carry no text
+        keys = {}
+        for url in urls:
+            keys.setdefault(page_key(url), []).append(url)
+        found = {}
+        conn = self.shared.connect()
+        page_urls = list(keys)
+        for start in range(0, len(page_urls), 500):  # Stays under SQLite's variable limit
+            batch = page_urls[start:start + 500]
+            rows = conn.execute(
+                "SELECT p.url, p.hash, p.etag, p.last_modified, p.fetched_at, b.size FROM pages p "
+                f"JOIN page_blobs b ON b.hash = p.hash WHERE p.url IN ({', '.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for page_url, *fields in rows:
+                entry = dict(zip(PAGE_FIELDS, fields))
+                if max_age is not None and time.time() - (entry["fetched_at"] or 0) > max_age:
+                    continue
+                for url in keys[page_url]:
+                    found[url] = dict(entry)
+        return found
+
+    def write(self, conn, url, entry):
+        # Stores one bot's view of a page inside the caller's transaction.
+        # Returns (page_url, changed): changed is True when the page's text
+        # differs from what other bots were shown. An entry older than the
+        # stored page (another bot refreshed it since) leaves it alone.
+        page_url = page_key(url)
+        text = entry.get("text")
+        page_hash = entry.get("hash") or (text_hash(text) if text is not None else None)
+        if page_hash is None:
+            return page_url, False
+        row = conn.execute("SELECT hash, fetched_at FROM pages WHERE url = ?", (page_url,)).fetchone()
+        if row is not None and (row[1] or 0) > (entry.get("fetched_at") or 0):
+            return page_url, False
+        if text is not None:
+            if not conn.execute("SELECT 1 FROM page_blobs WHERE hash = ?", (page_hash,)).fetchone():
+                codec, data = compress(text)
+                conn.execute("INSERT INTO page_blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+                             (page_hash, codec, len(text), data))
+            self._remember_text(page_hash, text)
+        elif row is None or row[0] != page_hash:
+            # A reference to text that isn't stored (e.g. collected meanwhile)
+            if not conn.execute("SELECT 1 FROM page_blobs WHERE hash = ?", (page_hash,)).fetchone():
+                return page_url, False
+        conn.execute(
+            "INSERT INTO pages (url, hash, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (url) DO UPDATE SET hash = excluded.hash, etag = excluded.etag, "
+            "last_modified = excluded.last_modified, fetched_at = excluded.fetched_at",
+            (page_url, page_hash, entry.get("etag"), entry.get("last_modified"), entry.get("fetched_at")),
+        )
+        return page_url, row is not None and row[0] != page_hash
+
+    def collect_garbage(self, referenced_sql):
+        # Drops pages no bot refers to any more (referenced_sql selects the
+        # page URLs still in use), then texts no page points at
+        with self.shared.transaction() as conn:
+            pages = conn.execute(f"DELETE FROM pages WHERE url NOT IN ({referenced_sql})").rowcount
+            blobs = conn.execute("DELETE FROM page_blobs WHERE hash NOT IN (SELECT hash FROM pages)").rowcount
+        return pages, blobs
+
+    def stats(self):
+        row = self.shared.connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM page_blobs"
+        ).fetchone()
+        with self._lock:
+            return {
+                "texts": row[0],
+                "text_bytes": row[1],
+                "stored_bytes": row[2],
+                "cached_bytes": self._text_bytes,
+                "cache_hits": self.text_hits,
+                "cache_misses": self.text_misses,
+            }
@@ -0,0 +1,115 @@
+import gc
+import os
+import signal
+import socket
+import tempfile
+import time
+
+import telemetry
+from telemetry import get_logger
+
+# === Pre-fork launcher settings ===
+RESTART_DELAY = 1.0  # Seconds before a crashed worker is replaced
+GRACEFUL_TIMEOUT = 10  # Seconds workers get to finish after SIGTERM
+LISTEN_BACKLOG = 2048
+
+logger = get_logger("prefork")
+
+
+def bind_socket(host, port, backlog=LISTEN_BACKLOG):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def use_shared_metrics_dir(port):
+    # Workers add up each other's metrics on /metrics, see telemetry.flush_metrics
+    if telemetry.METRICS_DIR:
+        return
+    metrics_dir = os.path.join(tempfile.gettempdir(), f"sarthi-metrics-{port}")
+    if os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+    telemetry.METRICS_DIR = metrics_dir
+    os.environ["SARTHI_METRICS_DIR"] = metrics_dir
+
+
+# === Pre-fork worker launcher ===
+# The parent imports the app once, binds the listening socket and forks the
+# workers, which all accept on that socket. Code and data loaded before the
+# fork (gradio, the app modules, bot configs) are shared copy-on-write
+# instead of being loaded again by every worker. Pages, answers and sessions
+# live in the shared SQLite store; each worker holds the retrieval indexes
+# of the bots it serves, loaded from the store into its share of
+# SARTHI_KB_MEMORY_BYTES (the servers split it between the workers), so the
+# indexes in memory stay within that budget however many workers run.
+# Crashed workers are replaced; SIGTERM or SIGINT stops them all.
+def run_prefork(serve, host, port, workers):
+    # serve(sock) runs one worker's server on the listening socket until it is stopped
+    sock = bind_socket(host, port)
+    if workers <= 1 or not hasattr(os, "fork"):
+        serve(sock)
+        return
+
+    use_shared_metrics_dir(port)
+    # Objects created so far are never collected, so the collector doesn't
+    # write to (and un-share) their pages in every worker
+    gc.collect()
+    gc.freeze()
+
+    children = {}  # pid -> worker slot
+    stopping = []
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            code = 0
+            try:
+                serve(sock)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                logger.exception("Worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+        logger.info("Started worker %s (pid %s)", slot, pid)
+
+    def stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic() + GRACEFUL_TIMEOUT)
+            for pid in list(children):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(workers):
+        spawn(slot)
+
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping and time.monotonic() > stopping[0]:
+                for pid in list(children):
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+            time.sleep(0.2)
+            continue
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        logger.warning("Worker %s (pid %s) exited with status %s, restarting", slot, pid, status)
+        time.sleep(RESTART_DELAY)
+        if not stopping:
+            spawn(slot)
+    sock.close()
@@ -0,0 +1,108 @@
+import os
+from functools import lru_cache
+
+from retrieval import CHARS_PER_TOKEN, CONTEXT_TOKEN_BUDGET, estimate_tokens
+from telemetry import get_logger
+
+logger = get_logger("prompt_budget")
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# === Prompt budget settings ===
+PROMPT_TOKEN_BUDGET = int(os.environ.get("SARTHI_PROMPT_TOKENS", "4000"))  # Whole prompt, all messages
+MAX_CONTEXT_TOKENS = CONTEXT_TOKEN_BUDGET  # Retrieved website content
+MIN_CONTEXT_TOKENS = 300  # History is trimmed before context drops below this
+HISTORY_TOKEN_BUDGET = 1200  # Conversation summary plus recent messages
+MAX_QUESTION_TOKENS = 500
+MAX_PREFIX_TOKENS = 1500  # Bot instructions longer than this are clipped
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators of each chat message
+
+DEFAULT_SYSTEM_PREFIX = "You are an AI assistant that answers questions based on this website's content:\n\n"
+
+# === Token counting ===
+# Uses tiktoken when it is installed (cl100k is close enough to Gemini's
+# tokenizer for budgeting), otherwise the character-based estimator.
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:  # The encoding file could not be downloaded
+                logger.error("tiktoken unavailable, estimating tokens instead: %s", e)
+    return _encoding
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+def clip_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    # Estimator: shrink by characters until it fits
+    clipped = text[:max_tokens * CHARS_PER_TOKEN]
+    while clipped and count_tokens(clipped) > max_tokens:
+        clipped = clipped[:int(len(clipped) * 0.9)]
+    return clipped
+
+# === Static per-bot system prefix ===
+# The bot's instructions come first and are byte-for-byte identical on every
+# request, so providers that cache prompt prefixes can reuse them; only the
+# retrieved context and conversation summary after it change per question.
+@lru_cache(maxsize=1024)
+def system_prefix(custom_prompt):
+    # Returns (text, tokens)
+    if custom_prompt:
+        prefix = f"{clip_to_tokens(custom_prompt, MAX_PREFIX_TOKENS)}\n\nWebsite content:\n"
+    else:
+        prefix = DEFAULT_SYSTEM_PREFIX
+    return prefix, count_tokens(prefix)
+
+# === Fitting a prompt into the budget ===
+def fit_history(summary, messages, budget):
+    # Keeps the newest messages that fit, then the summary if there is room.
+    # Returns (summary, messages, tokens used)
+    kept = []
+    used = 0
+    for msg in reversed(messages):
+        cost = count_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        kept.append(msg)
+        used += cost
+    kept.reverse()
+    summary_cost = count_tokens(summary)
+    if summary and used + summary_cost <= budget:
+        used += summary_cost
+    else:
+        summary = ""
+    return summary, kept, used
+
+def plan_prompt(prefix_tokens, question, summary, messages, budget=PROMPT_TOKEN_BUDGET):
+    # Splits the budget between the parts of the prompt: the prefix and the
+    # question are fixed, history gets what it needs up to its own cap, and
+    # retrieved context gets the rest, up to MAX_CONTEXT_TOKENS
+    question = clip_to_tokens(question, MAX_QUESTION_TOKENS)
+    available = budget - prefix_tokens - count_tokens(question) - 2 * MESSAGE_OVERHEAD_TOKENS
+    history_budget = min(HISTORY_TOKEN_BUDGET, max(0, available - MIN_CONTEXT_TOKENS))
+    summary, messages, history_tokens = fit_history(summary, messages, history_budget)
+    return {
+        "question": question,
+        "summary": summary,
+        "messages": messages,
+        "context_tokens": max(0, min(MAX_CONTEXT_TOKENS, available - history_tokens)),
+    }
@@ -0,0 +1,262 @@
+import argparse
+import csv
+import hmac
+import io
+import json
+import os
+import queue
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# === Batch provisioning settings ===
+BATCH_CONCURRENCY = int(os.environ.get("SARTHI_BATCH_CONCURRENCY", "4"))  # Bots scraped at the same time
+MAX_BATCH_BOTS = 1000  # Per API request; the CLI has no limit
+MAX_BATCH_CONCURRENCY = 32
+ADMIN_TOKEN = os.environ.get("SARTHI_ADMIN_TOKEN")  # The batch API is disabled without it
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+BOT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+LIST_SEPARATORS = re.compile(r"\s*\|\s*|\s*\n\s*")  # Between URLs or questions in a CSV cell
+TRUE_VALUES = ("1", "true", "yes", "y")
+
+
+# === Manifest parsing ===
+# A manifest lists one bot per JSONL line or CSV row (or a JSON list, or
+# {"bots": [...]}) with these fields:
+#   name (required), urls (required), description, custom_prompt,
+#   crawl, max_pages, warm_questions, faq, faq_rebuild, id
+# faq builds the bot's FAQ once; faq_rebuild also rebuilds it whenever the
+# site's content changes, which costs LLM calls on every change.
+# In CSV, urls and warm_questions hold several values separated by "|" or
+# newlines (URLs may also be separated by spaces).
+def _split_list(value, urls=False):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        items = value
+    else:
+        items = (re.split(r"[\s|]+", value) if urls else LIST_SEPARATORS.split(value))
+    return [str(item).strip() for item in items if str(item).strip()]
+
+def normalize_spec(raw, line):
+    # Returns the spec with an "error" key when the entry can't be provisioned
+    spec = {"line": line}
+    if not isinstance(raw, dict):
+        spec["error"] = "entry is not an object"
+        return spec
+    spec["name"] = str(raw.get("name") or "").strip()
+    spec["description"] = str(raw.get("description") or "").strip()
+    spec["custom_prompt"] = str(raw.get("custom_prompt") or "").strip()
+    spec["urls"] = _split_list(raw.get("urls") or raw.get("url"), urls=True)
+    crawl = raw.get("crawl")
+    spec["crawl"] = crawl if isinstance(crawl, bool) else str(crawl or "").strip().lower() in TRUE_VALUES
+    for flag in ("faq", "faq_rebuild"):
+        value = raw.get(flag)
+        spec[flag] = value if isinstance(value, bool) else str(value or "").strip().lower() in TRUE_VALUES
+    spec["warm_questions"] = _split_list(raw.get("warm_questions"))
+    spec["id"] = str(raw.get("id") or "").strip() or None
+    try:
+        spec["max_pages"] = int(raw["max_pages"]) if str(raw.get("max_pages") or "").strip() else None
+    except ValueError:
+        spec["error"] = f"max_pages is not a number: {raw.get('max_pages')!r}"
+        return spec
+
+    bad_urls = [url for url in spec["urls"] if not url.lower().startswith(("http://", "https://"))]
+    if not spec["name"]:
+        spec["error"] = "name is required"
+    elif not spec["urls"]:
+        spec["error"] = "at least one URL is required"
+    elif bad_urls:
+        spec["error"] = f"not an http(s) URL: {bad_urls[0]}"
+    elif spec["id"] and not BOT_ID_RE.match(spec["id"]):
+        spec["error"] = "id may only contain letters, digits, '-' and '_' (at most 64)"
+    return spec
+
+def detect_format(text, filename=None, content_type=None):
+    hint = f"{filename or ''} {content_type or ''}".lower()
+    for fmt in ("jsonl", "ndjson", "csv", "json"):
+        if fmt in hint:
+            return "jsonl" if fmt == "ndjson" else fmt
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        return "json"
+    if stripped.startswith("{"):
+        # {"bots": [...]} (on one line or several) is a JSON document; any
+        # other object on the first line starts a JSONL manifest
+        try:
+            data = json.loads(stripped)
+            return "json" if isinstance(data, dict) and "bots" in data else "jsonl"
+        except ValueError:
+            pass
+        try:
+            json.loads(stripped.split("\n", 1)[0])
+            return "jsonl"
+        except ValueError:
+            return "json"
+    return "csv"
+
+def parse_manifest(text, fmt=None):
+    # Returns a list of specs; entries that can't be used carry an "error"
+    fmt = fmt or detect_format(text)
+    specs = []
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        for row in reader:
+            row = {(key or "").strip().lower(): value for key, value in row.items()}
+            if any((value or "").strip() for value in row.values() if isinstance(value, str)):
+                specs.append(normalize_spec(row, reader.line_num))
+    elif fmt == "json":
+        data = json.loads(text)
+        entries = data.get("bots", []) if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            raise ValueError('expected a list of bots or {"bots": [...]}')
+        specs = [normalize_spec(entry, i + 1) for i, entry in enumerate(entries)]
+    else:
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                specs.append(normalize_spec(json.loads(line), number))
+            except ValueError as e:
+                specs.append({"line": number, "error": f"invalid JSON: {e}"})
+
+    # Two entries with one id would race to create the same bot
+    first_lines = {}
+    for spec in specs:
+        if spec.get("error") or not spec.get("id"):
+            continue
+        if spec["id"] in first_lines:
+            spec["error"] = f"duplicate id {spec['id']} (already used on line {first_lines[spec['id']]})"
+        else:
+            first_lines[spec["id"]] = spec["line"]
+    return specs
+
+
+# === Batch runner ===
+# Provisions the bots of a manifest with a bounded pool and yields progress
+# events as they happen:
+#   {"event": "start", "total": N, "concurrency": C}
+#   {"event": "bot", "line", "name", "status": "started"}
+#   {"event": "bot", "line", "name", "status": "created" | "exists" | "failed", ...}
+#   {"event": "done", "total", "created", "exists", "failed", "seconds"}
+# provision(spec) does the work for one bot and returns a dict with at least
+# "status". Closing the generator early (e.g. the client went away) cancels
+# the bots that have not started yet.
+def provision_batch(specs, provision, concurrency=BATCH_CONCURRENCY):
+    started = time.monotonic()
+    events = queue.Queue()
+    counts = Counter()
+
+    def run(spec):
+        events.put({"event": "bot", "line": spec["line"], "name": spec["name"], "status": "started"})
+        bot_started = time.monotonic()
+        try:
+            result = provision(spec)
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)}
+        events.put({"event": "bot", "line": spec["line"], "name": spec["name"], **result,
+                    "seconds": round(time.monotonic() - bot_started, 2)})
+
+    yield {"event": "start", "total": len(specs), "concurrency": concurrency}
+    runnable = []
+    for spec in specs:
+        if spec.get("error"):
+            counts["failed"] += 1
+            yield {"event": "bot", "line": spec["line"], "name": spec.get("name"), "status": "failed",
+                   "error": spec["error"]}
+        else:
+            runnable.append(spec)
+
+    if runnable:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(runnable))))
+        try:
+            for spec in runnable:
+                executor.submit(run, spec)
+            finished = 0
+            while finished < len(runnable):
+                event = events.get()
+                if event["status"] != "started":
+                    finished += 1
+                    counts[event["status"]] += 1
+                yield event
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    yield {"event": "done", "total": len(specs), "created": counts["created"], "exists": counts["exists"],
+           "failed": counts["failed"], "seconds": round(time.monotonic() - started, 2)}
+
+def parse_batch_request(body, content_type=None, fmt=None, concurrency=None):
+    # Shared by the Flask and FastAPI routes; returns (specs, concurrency)
+    # and raises ValueError for a malformed manifest or parameter
+    specs = parse_manifest(body, fmt or detect_format(body, content_type=content_type))
+    concurrency = max(1, min(int(concurrency), MAX_BATCH_CONCURRENCY)) if concurrency else BATCH_CONCURRENCY
+    return specs, concurrency
+
+def ndjson_lines(events):
+    for event in events:
+        yield json.dumps(event) + "\n"
+
+def is_authorized(authorization):
+    # Authorization: Bearer <SARTHI_ADMIN_TOKEN>
+    if not ADMIN_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip(), ADMIN_TOKEN)
+
+
+# === Command line ===
+# python provisioning.py bots.jsonl [--concurrency 8] [--report report.jsonl]
+# Provisions into the local chatbots store (the same one the servers read).
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and pre-warm many bots from a JSONL or CSV manifest")
+    parser.add_argument("manifest", help="JSONL, CSV or JSON file; '-' reads stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv", "json"], help="default: from the file name or content")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="bots provisioned at the same time")
+    parser.add_argument("--report", help="also write every progress event to this JSONL file")
+    args = parser.parse_args(argv)
+
+    if args.manifest == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.manifest, "r", encoding="utf-8-sig") as f:
+            text = f.read()
+    try:
+        specs = parse_manifest(text, args.format or detect_format(text, filename=args.manifest))
+    except ValueError as e:
+        print(f"[ERROR] Could not read manifest: {e}")
+        return 2
+
+    from engine import provision_bot  # Imported late: loads the stores and the LLM gateway
+
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+    summary = {}
+    try:
+        for event in provision_batch(specs, provision_bot, args.concurrency):
+            if report:
+                report.write(json.dumps(event) + "\n")
+                report.flush()
+            if event["event"] == "done":
+                summary = event
+            elif event["event"] == "bot" and event["status"] != "started":
+                detail = event.get("bot_id") or event.get("error") or ""
+                extra = f", {event['pages']} page(s)" if event.get("pages") else ""
+                if event.get("failed_urls"):
+                    extra += f", {len(event['failed_urls'])} URL(s) failed"
+                if event.get("faq") is not None:
+                    extra += f", {event['faq']} FAQ answer(s)"
+                if event.get("warmed") is not None:
+                    extra += f", {event['warmed']} answer(s) pre-warmed"
+                print(f"[{event['status'].upper()}] line {event['line']} {event.get('name') or ''}: {detail}{extra}")
+    finally:
+        if report:
+            report.close()
+    print(f"[INFO] {summary.get('created', 0)} created, {summary.get('exists', 0)} already existed, "
+          f"{summary.get('failed', 0)} failed in {summary.get('seconds', 0)}s")
+    return 1 if summary.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every process refreshes
+    fcntl = None
+
+from telemetry import get_logger
+
+logger = get_logger("refresher")
+
+# === Refresher settings ===
+REFRESH_INTERVAL = 6 * 60 * 60  # How often each bot's pages are revisited
+TICK_SECONDS = 60  # How often the scheduler wakes up
+MAX_BOTS_PER_TICK = 20  # Spreads the work of many bots over several ticks
+GC_INTERVAL = 60 * 60  # How often shared pages no bot uses any more are dropped
+
+
+# === Background knowledge base refresher ===
+# Revisits every bot's URLs on a schedule with conditional GETs. Only pages
+# whose extracted text changed are re-chunked and re-indexed, and each change
+# bumps the bot's content version, so visitors never wait on a refresh.
+class KnowledgeBaseRefresher:
+    def __init__(self, kb_store, registry, interval=REFRESH_INTERVAL, tick=TICK_SECONDS,
+                 max_bots_per_tick=MAX_BOTS_PER_TICK):
+        self.kb_store = kb_store
+        self.registry = registry
+        self.interval = interval
+        self.tick = tick
+        self.max_bots_per_tick = max_bots_per_tick
+        self._last_gc = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+
+    def _acquire_host_lock(self):
+        # Only one process per host refreshes, however many workers are running
+        if fcntl is None:
+            return True
+        os.makedirs(self.kb_store.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.kb_store.directory, ".refresher.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def refresh_bot(self, config):
+        bot_id = config["id"]
+        urls = config.get("urls", [])
+        changed_urls = self.kb_store.revalidate(bot_id, urls, max_age=self.interval)
+        if changed_urls:
+            # Re-indexes just the changed pages; unchanged chunks are reused
+            self.kb_store.get_index(bot_id, urls)
+            logger.info("Refreshed bot %s: %d page(s) changed, now at version %s", bot_id, len(changed_urls),
+                        self.kb_store.version(bot_id))
+        self.registry.mark_refreshed(bot_id, time.time())
+        return changed_urls
+
+    def run_once(self):
+        # Only the ids of due bots are read; each config is loaded when its turn comes
+        now = time.time()
+        due = self.registry.due_for_refresh(now - self.interval, self.max_bots_per_tick)
+        for bot_id in due:
+            if self._stop.is_set():
+                break
+            try:
+                config = self.registry.get(bot_id)
+                if config is not None:
+                    self.refresh_bot(config)
+            except Exception as e:
+                logger.error("Refresh failed for bot %s: %s", bot_id, e)
+        if now - self._last_gc >= GC_INTERVAL:
+            self._last_gc = now
+            self.collect_garbage()
+        return len(due)
+
+    def collect_garbage(self):
+        try:
+            removed = self.kb_store.collect_garbage()
+        except Exception as e:
+            logger.error("Page store cleanup failed: %s", e)
+            return
+        if removed and any(removed):
+            logger.info("Dropped %d unused page(s) and %d stored text(s)", removed[0], removed[1])
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.tick)
+
+    def start(self):
+        if self._thread is not None:
+            return True
+        if not self._acquire_host_lock():
+            logger.info("Knowledge base refresher already running in another process")
+            return False
+        self._thread = threading.Thread(target=self._run, name="kb-refresher", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
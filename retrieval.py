@@ -0,0 +1,247 @@
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+# === Retrieval settings ===
+CHUNK_CHARS = 1000  # Target chunk size
+CHUNK_OVERLAP_LINES = 1  # Lines repeated between neighbouring chunks
+CONTEXT_TOKEN_BUDGET = 1500  # Tokens of website content sent per question
+TOP_K = 8
+CHARS_PER_TOKEN = 4  # English and other ASCII text
+NON_ASCII_TOKENS_PER_CHAR = 0.6  # Devanagari and most other scripts tokenize far denser
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its me my of on or our
+please so tell than that the their them there these they this to us was we what when where which
+who why will with you your
+""".split())
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+def estimate_tokens(text):
+    non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+    return (len(text) - non_ascii) // CHARS_PER_TOKEN + int(non_ascii * NON_ASCII_TOKENS_PER_CHAR) + 1
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# === Chunking ===
+def chunk_text(text, chunk_chars=CHUNK_CHARS, overlap_lines=CHUNK_OVERLAP_LINES):
+    lines = [line for line in text.split("\n") if line.strip()]
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        # Very long lines (minified pages, one-paragraph sites) are split hard
+        while len(line) > chunk_chars:
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(line[:chunk_chars])
+            line = line[chunk_chars:]
+        if size + len(line) > chunk_chars and current:
+            chunks.append("\n".join(current))
+            current = current[-overlap_lines:] if overlap_lines else []
+            size = sum(len(item) + 1 for item in current)
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# === Chunks shared between indexes ===
+# Bots that list the same page (same URL and text) share its chunk objects
+# instead of each tokenizing and holding a copy.
+_shared_chunks = OrderedDict()  # (url, hash) -> [chunk], least recently used first
+_shared_chunks_lock = threading.Lock()
+MAX_SHARED_PAGES = 4096
+
+def _make_chunk(url, position, text, terms=None):
+    terms = Counter(terms) if terms is not None else Counter(tokenize(text))
+    return {"url": url, "position": position, "text": text, "terms": terms, "length": sum(terms.values())}
+
+def _shared_page_chunks(url, page_hash, make_chunks):
+    key = (url, page_hash)
+    with _shared_chunks_lock:
+        chunks = _shared_chunks.get(key)
+        if chunks is not None:
+            _shared_chunks.move_to_end(key)
+            return chunks
+    chunks = make_chunks()
+    with _shared_chunks_lock:
+        chunks = _shared_chunks.setdefault(key, chunks)
+        while len(_shared_chunks) > MAX_SHARED_PAGES:
+            _shared_chunks.popitem(last=False)
+    return chunks
+
+def page_chunks(url, page_hash, text):
+    return _shared_page_chunks(
+        url, page_hash, lambda: [_make_chunk(url, i, chunk) for i, chunk in enumerate(chunk_text(text))]
+    )
+
+def index_version(pages):
+    # Fingerprint of an index over pages, an ordered url -> hash mapping
+    return text_hash("\n".join(f"{url} {page_hash}" for url, page_hash in pages.items()))[:16]
+
+
+# === BM25 index over the chunks of one bot ===
+# Chunks are indexed per page, so a refresh only re-indexes the pages whose
+# text actually changed.
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.pages = OrderedDict()  # url -> {"hash": str, "chunks": [chunk]}
+        self.df = Counter()
+        self.chunk_count = 0
+        self.total_length = 0
+        self._version = None
+
+    @property
+    def version(self):
+        # Fingerprint of the indexed pages; changes whenever any page changes
+        if self._version is None:
+            self._version = index_version({url: page["hash"] for url, page in self.pages.items()})
+        return self._version
+
+    def _add_chunks(self, url, page_hash, chunks):
+        self._version = None
+        self.pages[url] = {"hash": page_hash, "chunks": chunks}
+        for chunk in chunks:
+            self.df.update(chunk["terms"].keys())
+            self.chunk_count += 1
+            self.total_length += chunk["length"]
+
+    def add_page(self, url, text, page_hash=None):
+        page_hash = page_hash or text_hash(text)
+        self._add_chunks(url, page_hash, page_chunks(url, page_hash, text))
+
+    def updated(self, pages):
+        # pages maps url -> (hash, text), where text may be a function that
+        # reads it (only called for pages that need indexing; a page whose
+        # text can't be read is left out). Returns self when nothing changed,
+        # otherwise a new index that reuses the chunks of unchanged pages, so
+        # readers of the old index are never disturbed mid-search.
+        if list(self.pages) == list(pages) and all(
+            self.pages[url]["hash"] == page_hash for url, (page_hash, _) in pages.items()
+        ):
+            return self
+        index = BM25Index(self.k1, self.b)
+        for url, (page_hash, text) in pages.items():
+            page = self.pages.get(url)
+            if page and page["hash"] == page_hash:
+                index._add_chunks(url, page_hash, page["chunks"])
+                continue
+            if callable(text):
+                text = text()
+            if text is not None:
+                index.add_page(url, text, page_hash)
+        return index
+
+    def search(self, query, top_k=TOP_K):
+        query_terms = set(tokenize(query))
+        if not query_terms or not self.chunk_count:
+            return []
+        average_length = self.total_length / self.chunk_count or 1
+        idf = {
+            term: math.log(1 + (self.chunk_count - self.df[term] + 0.5) / (self.df[term] + 0.5))
+            for term in query_terms if self.df.get(term)
+        }
+        if not idf:
+            return []
+        scored = []
+        for page in self.pages.values():
+            for chunk in page["chunks"]:
+                score = 0.0
+                for term, weight in idf.items():
+                    freq = chunk["terms"].get(term)
+                    if freq:
+                        norm = self.k1 * (1 - self.b + self.b * chunk["length"] / average_length)
+                        score += weight * freq * (self.k1 + 1) / (freq + norm)
+                if score > 0:
+                    scored.append((score, chunk))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:top_k]
+
+    def select_pages(self, query, budget_tokens=CONTEXT_TOKEN_BUDGET, top_k=TOP_K, count_tokens=estimate_tokens):
+        # Returns (url, text) pairs ready for combine_pages
+        hits = [chunk for _, chunk in self.search(query, top_k)]
+        if not hits:
+            # Nothing matched the question, fall back to the start of the site
+            hits = [chunk for page in self.pages.values() for chunk in page["chunks"]][:top_k]
+
+        selected = []
+        used = 0
+        for chunk in hits:
+            cost = count_tokens(chunk["text"])
+            if used + cost > budget_tokens:
+                continue
+            selected.append(chunk)
+            used += cost
+
+        # Present the chunks in site order so neighbouring text reads naturally
+        page_order = {url: i for i, url in enumerate(self.pages)}
+        selected.sort(key=lambda chunk: (page_order[chunk["url"]], chunk["position"]))
+        grouped = OrderedDict()
+        for chunk in selected:
+            grouped.setdefault(chunk["url"], []).append(chunk["text"])
+        return [(url, "\n...\n".join(texts)) for url, texts in grouped.items()]
+
+    # --- Persistence ---
+    def to_dict(self, with_terms=False):
+        # with_terms also stores each chunk's term counts, so loading the
+        # index skips tokenizing; chunks are then [text, {term: count}]
+        return {
+            "pages": {
+                url: {"hash": page["hash"], "chunks": [
+                    [chunk["text"], dict(chunk["terms"])] if with_terms else chunk["text"]
+                    for chunk in page["chunks"]
+                ]}
+                for url, page in self.pages.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        for url, page in data.get("pages", {}).items():
+            def make_chunks(url=url, stored=page["chunks"]):
+                return [
+                    _make_chunk(url, i, chunk) if isinstance(chunk, str) else _make_chunk(url, i, *chunk)
+                    for i, chunk in enumerate(stored)
+                ]
+            # Pages already indexed for another bot of this process share their chunks
+            index._add_chunks(url, page["hash"], _shared_page_chunks(url, page["hash"], make_chunks))
+        return index
+
+
+# === Index for ad-hoc content (Gradio test chat) ===
+# Keyed by a hash of the page texts so the same knowledge base is only
+# indexed once no matter how many test questions are asked.
+_text_indexes = OrderedDict()
+_text_indexes_lock = threading.Lock()
+MAX_TEXT_INDEXES = 16
+
+def index_for_pages(pages):
+    # pages is a list of (url, text) pairs
+    key = text_hash("\0".join(f"{url}\0{text}" for url, text in pages))
+    with _text_indexes_lock:
+        index = _text_indexes.get(key)
+        if index is not None:
+            _text_indexes.move_to_end(key)
+            return index
+
+    index = BM25Index()
+    for url, text in pages:
+        index.add_page(url, text)
+
+    with _text_indexes_lock:
+        _text_indexes[key] = index
+        while len(_text_indexes) > MAX_TEXT_INDEXES:
+            _text_indexes.popitem(last=False)
+    return index
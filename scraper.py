@@ -0,0 +1,379 @@
+import asyncio
+import codecs
+import contextvars
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from extractor import extract, extract_text
+from kb_store import combine_pages
+from telemetry import current_trace, get_logger, inc, observe
+
+logger = get_logger("scraper")
+
+# === Scraper settings ===
+DEFAULT_TIMEOUT = 10  # Per-URL timeout in seconds
+DEFAULT_DEADLINE = 60  # Overall budget for one scrape_multiple_urls call
+PAGE_DEADLINE = 20  # Wall-clock budget for downloading one page
+MAX_PAGE_BYTES = 2 * 1024 * 1024  # Bodies are truncated after this many bytes
+CHUNK_SIZE = 64 * 1024
+ALLOWED_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+MAX_WORKERS = 16
+PER_HOST_LIMIT = 4
+USER_AGENT = "MySarthiBot/1.0 (+https://github.com/Pushpendra1001/MySarthi)"
+
+# === Shared HTTP session (keep-alive connection pool) ===
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=64, pool_maxsize=MAX_WORKERS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = USER_AGENT
+                _session = session
+    return _session
+
+# === Per-host concurrency caps ===
+# One cap per host, shared by every caller in the process (the first caller's
+# per_host sets it). Kept for the most recently used hosts only: a host is
+# forgotten once nobody holds or waits for its slots, so a long-running
+# server that crawls many sites stays bounded.
+MAX_TRACKED_HOSTS = 1024
+_host_limits = OrderedDict()  # host -> _HostLimit, least recently used first
+_host_limits_lock = threading.Lock()
+
+class _HostLimit:
+    def __init__(self, per_host):
+        self.semaphore = threading.BoundedSemaphore(per_host)
+        self.users = 0  # Callers holding or waiting for a slot; only unused hosts are evicted
+
+def _evict_hosts(keep):
+    # Hosts in use are skipped, in at most one pass from the least recently used
+    excess = len(_host_limits) - MAX_TRACKED_HOSTS
+    unused = []
+    for host, limit in _host_limits.items():
+        if len(unused) >= excess:
+            break
+        if host != keep and not limit.users:
+            unused.append(host)
+    for host in unused:
+        del _host_limits[host]
+
+@contextmanager
+def _host_slot(url, per_host, timeout=None):
+    # Holds one of the host's slots for the block; yields False if none came
+    # free within timeout seconds
+    host = urlparse(url).netloc.lower()
+    with _host_limits_lock:
+        limit = _host_limits.get(host)
+        if limit is None:
+            limit = _host_limits[host] = _HostLimit(per_host)
+            _evict_hosts(keep=host)
+        else:
+            _host_limits.move_to_end(host)
+        limit.users += 1
+    acquired = False
+    try:
+        acquired = limit.semaphore.acquire(timeout=timeout) if timeout is not None else limit.semaphore.acquire()
+        yield acquired
+    finally:
+        if acquired:
+            limit.semaphore.release()
+        with _host_limits_lock:
+            limit.users -= 1
+
+def _conditional_headers(etag=None, last_modified=None):
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+# === Bounded, incrementally decoded page bodies ===
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+def check_page_headers(headers, max_bytes=MAX_PAGE_BYTES):
+    # Rejects PDFs, images, archives and oversized bodies before reading them
+    content_type = (headers.get("Content-Type") or "text/html").split(";")[0].strip().lower()
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise ValueError(f"unsupported content type: {content_type}")
+    length = headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes * 4:
+        # Far beyond what would be kept, not worth truncating
+        raise ValueError(f"page too large: {length} bytes")
+
+def _header_charset(headers):
+    match = re.search(r"charset=[\"']?([\w-]+)", headers.get("Content-Type") or "", re.IGNORECASE)
+    return match.group(1) if match else None
+
+class PageBody:
+    # Decodes the body chunk by chunk as it arrives, so the raw bytes are
+    # never held twice; stops accepting data once max_bytes is reached.
+    def __init__(self, headers, max_bytes=MAX_PAGE_BYTES, deadline=PAGE_DEADLINE):
+        self.charset = _header_charset(headers)
+        self.max_bytes = max_bytes
+        self.expires = time.monotonic() + deadline
+        self.bytes = 0
+        self.truncated = False
+        self._decoder = None
+        self._parts = []
+
+    def _start(self, chunk):
+        # No charset header: look for a <meta charset> in the first chunk
+        charset = self.charset
+        if charset is None:
+            match = _META_CHARSET.search(chunk[:4096])
+            charset = match.group(1).decode("ascii") if match else "utf-8"
+        try:
+            self._decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def feed(self, chunk):
+        # Returns False once no more data should be read
+        if time.monotonic() > self.expires:
+            raise TimeoutError("page download deadline exceeded")
+        if not chunk:
+            return True
+        if self._decoder is None:
+            self._start(chunk)
+        room = self.max_bytes - self.bytes
+        if len(chunk) > room:
+            chunk = chunk[:room]
+            self.truncated = True
+        self.bytes += len(chunk)
+        self._parts.append(self._decoder.decode(chunk))
+        return not self.truncated
+
+    def text(self):
+        if self._decoder is not None:
+            self._parts.append(self._decoder.decode(b"", final=True))
+            self._decoder = None
+        return "".join(self._parts)
+
+def _iter_chunks(response):
+    raw = response.raw
+    if hasattr(raw, "read1"):
+        # urllib3 2.x: read1 returns as soon as any data has arrived, so the
+        # deadline is checked even while a server drips bytes slowly
+        while True:
+            chunk = raw.read1(CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from response.iter_content(chunk_size=CHUNK_SIZE)
+
+def _record_fetch(result, seconds):
+    # Metrics for every fetch, plus a line in the current request's trace
+    outcome = "error" if result.get("error") else str(result.get("status"))
+    observe("sarthi_fetch_seconds", seconds, outcome=outcome)
+    inc("sarthi_fetch_bytes_total", result.get("bytes") or 0)
+    trace = current_trace()
+    if trace is not None:
+        trace.record_fetch(result["url"], seconds, outcome)
+    if result.get("error"):
+        logger.info("Fetch failed for %s after %.2fs: %s", result["url"], seconds, result["error"])
+    else:
+        logger.debug("Fetched %s in %.2fs (%s)", result["url"], seconds, outcome)
+
+# === Function to fetch a page, with optional conditional GET ===
+# The body is streamed: non-HTML content types are refused up front, the
+# download stops at max_bytes, and the whole request is bounded by
+# `deadline` seconds rather than only per read.
+def fetch_page(url, etag=None, last_modified=None, timeout=DEFAULT_TIMEOUT, with_links=False,
+               max_bytes=MAX_PAGE_BYTES, deadline=PAGE_DEADLINE):
+    started = time.perf_counter()
+    result = _fetch_page(url, etag, last_modified, timeout, with_links, max_bytes, deadline)
+    _record_fetch(result, time.perf_counter() - started)
+    return result
+
+def _fetch_page(url, etag, last_modified, timeout, with_links, max_bytes, deadline):
+    headers = _conditional_headers(etag, last_modified)
+    try:
+        with get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304:
+                return {"url": url, "status": 304, "text": None, "etag": etag, "last_modified": last_modified}
+            response.raise_for_status()
+            check_page_headers(response.headers, max_bytes)
+            body = PageBody(response.headers, max_bytes, deadline)
+            for chunk in _iter_chunks(response):
+                if not body.feed(chunk):
+                    break
+            result = {
+                "url": url,
+                "status": response.status_code,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "bytes": body.bytes,
+                "truncated": body.truncated,
+            }
+            final_url = response.url
+        # Boilerplate-stripped text; links and canonical are read before stripping
+        result.update(extract(body.text(), final_url, with_links=with_links))
+        if with_links:
+            result["final_url"] = final_url
+        return result
+    except Exception as e:
+        return {"url": url, "status": None, "text": None, "error": str(e)}
+
+# === Function to fetch many URLs concurrently ===
+# Returns one result per input URL, in input order. URLs that did not finish
+# before the deadline come back as errors instead of holding up the rest.
+def fetch_many(urls, fetch=None, timeout=DEFAULT_TIMEOUT, deadline=DEFAULT_DEADLINE,
+               max_workers=MAX_WORKERS, per_host=PER_HOST_LIMIT):
+    if fetch is None:
+        fetch = lambda url: fetch_page(url, timeout=timeout)
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return []
+
+    started = time.monotonic()
+
+    def run(url):
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            return {"url": url, "status": None, "text": None, "error": "scrape deadline exceeded"}
+        with _host_slot(url, per_host, timeout=remaining) as acquired:
+            if not acquired:
+                return {"url": url, "status": None, "text": None, "error": "scrape deadline exceeded"}
+            return fetch(url)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(unique_urls)))
+    try:
+        # Each worker runs in a copy of the caller's context, so fetches show
+        # up in the current request's trace
+        futures = {url: executor.submit(contextvars.copy_context().run, run, url) for url in unique_urls}
+        wait(futures.values(), timeout=deadline)
+        results = {}
+        for url, future in futures.items():
+            if future.done() and not future.cancelled():
+                results[url] = future.result()
+            else:
+                future.cancel()
+                results[url] = {"url": url, "status": None, "text": None, "error": "scrape deadline exceeded"}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return [results[url] for url in urls]
+
+# === Async fetching for the async bot API ===
+_async_clients = {}  # One pooled client per event loop
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=MAX_WORKERS),
+            follow_redirects=True,
+        )
+        _async_clients[loop] = client
+    return client
+
+async def _async_download(url, headers, timeout, max_bytes, deadline):
+    async with get_async_client().stream("GET", url, headers=headers, timeout=timeout) as response:
+        if response.status_code == 304:
+            return response, None
+        response.raise_for_status()
+        check_page_headers(response.headers, max_bytes)
+        body = PageBody(response.headers, max_bytes, deadline)
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            if not body.feed(chunk):
+                break
+        return response, body
+
+async def async_fetch_page(url, etag=None, last_modified=None, timeout=DEFAULT_TIMEOUT,
+                           max_bytes=MAX_PAGE_BYTES, deadline=PAGE_DEADLINE):
+    started = time.perf_counter()
+    result = await _async_fetch_page(url, etag, last_modified, timeout, max_bytes, deadline)
+    _record_fetch(result, time.perf_counter() - started)
+    return result
+
+async def _async_fetch_page(url, etag, last_modified, timeout, max_bytes, deadline):
+    try:
+        # wait_for also cuts off a server that drips bytes slower than the deadline
+        response, body = await asyncio.wait_for(
+            _async_download(url, _conditional_headers(etag, last_modified), timeout, max_bytes, deadline),
+            timeout=deadline,
+        )
+        if body is None:
+            return {"url": url, "status": 304, "text": None, "etag": etag, "last_modified": last_modified}
+        # Parsing is CPU bound, keep it off the event loop
+        text = await asyncio.to_thread(extract_text, body.text())
+        return {
+            "url": url,
+            "status": response.status_code,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "bytes": body.bytes,
+            "truncated": body.truncated,
+            "text": text,
+        }
+    except asyncio.TimeoutError:
+        return {"url": url, "status": None, "text": None, "error": "page download deadline exceeded"}
+    except Exception as e:
+        return {"url": url, "status": None, "text": None, "error": str(e)}
+
+async def async_fetch_many(urls, timeout=DEFAULT_TIMEOUT, deadline=DEFAULT_DEADLINE, per_host=PER_HOST_LIMIT):
+    unique_urls = list(dict.fromkeys(urls))
+    host_limits = {}
+
+    async def run(url):
+        host = urlparse(url).netloc.lower()
+        semaphore = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        async with semaphore:
+            return await async_fetch_page(url, timeout=timeout)
+
+    tasks = {url: asyncio.ensure_future(run(url)) for url in unique_urls}
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=deadline)
+    results = {}
+    for url, task in tasks.items():
+        if task.done() and not task.cancelled():
+            results[url] = task.result()
+        else:
+            task.cancel()
+            results[url] = {"url": url, "status": None, "text": None, "error": "scrape deadline exceeded"}
+    return [results[url] for url in urls]
+
+# === Function to scrape website content ===
+def scrape_page(url, timeout=DEFAULT_TIMEOUT):
+    result = fetch_page(url, timeout=timeout)
+    if result.get("text") is None:
+        return f"[ERROR] Failed to fetch page content: {result.get('error')}"
+    return result["text"]
+
+# === Function to scrape multiple URLs ===
+def scrape_multiple_urls(urls, timeout=DEFAULT_TIMEOUT, deadline=DEFAULT_DEADLINE,
+                         max_workers=MAX_WORKERS, per_host=PER_HOST_LIMIT):
+    urls = [url.strip() for url in urls if url.strip()]  # Skip empty URLs
+    results = fetch_many(urls, timeout=timeout, deadline=deadline,
+                         max_workers=max_workers, per_host=per_host)
+
+    pages = []
+    for result in results:
+        if result.get("text") is not None:
+            pages.append((result["url"], result["text"]))
+        else:
+            logger.error("Failed to fetch %s: %s", result["url"], result.get("error"))
+
+    if not pages:
+        return "[ERROR] Failed to fetch content from any of the provided URLs"
+
+    return combine_pages(pages)
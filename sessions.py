@@ -0,0 +1,191 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from telemetry import get_logger
+
+logger = get_logger("sessions")
+
+# === Session settings ===
+MAX_SESSIONS = 10000
+IDLE_TTL = 30 * 60  # Sessions idle for 30 minutes are dropped
+WINDOW_MESSAGES = 6  # Recent messages sent to the model verbatim
+SUMMARY_CHARS = 1200  # Cap on the rolling summary of older messages
+SUMMARY_ITEM_CHARS = 160
+PRUNE_EVERY = 100  # New sessions between sweeps of the shared table
+
+def _clip(text, limit):
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+def summarize_messages(messages, previous_summary=""):
+    # Cheap extractive summary: one clipped line per message that scrolled
+    # out of the window, oldest lines dropped once over SUMMARY_CHARS
+    lines = [line for line in previous_summary.split("\n") if line]
+    for msg in messages:
+        who = "Visitor" if msg.get("role") == "user" else "Assistant"
+        lines.append(f"{who}: {_clip(msg.get('content'), SUMMARY_ITEM_CHARS)}")
+    while lines and sum(len(line) + 1 for line in lines) > SUMMARY_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+def compact_history(messages, summary="", window=WINDOW_MESSAGES):
+    # Returns (summary, recent) with at most `window` recent messages
+    messages = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in messages or []
+        if isinstance(msg, dict) and msg.get("role") in ("user", "assistant") and "content" in msg
+    ]
+    if len(messages) <= window:
+        return summary, messages
+    cut = len(messages) - window
+    return summarize_messages(messages[:cut], summary), messages[cut:]
+
+def history_with_summary(summary, recent):
+    # The summary travels as a system message; build_chat_messages folds it
+    # into the system prompt
+    if not summary:
+        return list(recent)
+    return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}] + list(recent)
+
+
+# === Server-side conversation sessions ===
+# Each session keeps a rolling summary plus a fixed window of recent
+# messages, so the prompt stays the same size however long the chat runs.
+class SessionStore:
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_ttl=IDLE_TTL, window=WINDOW_MESSAGES):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.window = window
+        self._sessions = OrderedDict()  # session_id -> session
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        # Sessions are kept in last-used order, so expired ones are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session["last_seen"] <= self.idle_ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def open(self, bot_id, session_id=None):
+        # Returns the id of an existing session for this bot, or of a new one
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None or session["bot_id"] != bot_id:
+                session_id = uuid.uuid4().hex
+                session = {"bot_id": bot_id, "summary": "", "recent": [], "last_seen": now}
+                self._sessions[session_id] = session
+            session["last_seen"] = now
+            self._sessions.move_to_end(session_id)
+            self._expire(now)
+            return session_id
+
+    def history(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or time.time() - session["last_seen"] > self.idle_ttl:
+                return []
+            return history_with_summary(session["summary"], session["recent"])
+
+    def record_turn(self, session_id, message, answer):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            messages = session["recent"] + [
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": answer},
+            ]
+            session["summary"], session["recent"] = compact_history(messages, session["summary"], self.window)
+            session["last_seen"] = time.time()
+
+    def count(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+# === Sessions shared by the worker processes of one host ===
+# Same behaviour, but the summary and recent window live in the shared
+# SQLite database, so a follow-up that lands on another worker continues
+# the same conversation. Turns are read and written in one transaction, so
+# two workers answering the same session never lose a turn.
+SESSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    bot_id TEXT NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    recent TEXT NOT NULL DEFAULT '[]',
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_last_seen ON sessions (last_seen);
+"""
+
+class SharedSessionStore(SessionStore):
+    def __init__(self, shared, **kwargs):
+        super().__init__(**kwargs)
+        self.shared = shared
+        shared.add_schema(SESSIONS_SCHEMA)
+        self._created = 0
+
+    def _prune(self, conn, now):
+        conn.execute("DELETE FROM sessions WHERE last_seen < ?", (now - self.idle_ttl,))
+        conn.execute(
+            "DELETE FROM sessions WHERE rowid IN ("
+            "SELECT rowid FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        )
+
+    def open(self, bot_id, session_id=None):
+        now = time.time()
+        with self.shared.transaction() as conn:
+            row = conn.execute("SELECT bot_id, last_seen FROM sessions WHERE session_id = ?",
+                               (session_id,)).fetchone() if session_id else None
+            if row is not None and row[0] == bot_id and now - row[1] <= self.idle_ttl:
+                conn.execute("UPDATE sessions SET last_seen = ? WHERE session_id = ?", (now, session_id))
+                return session_id
+            session_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO sessions (session_id, bot_id, last_seen) VALUES (?, ?, ?)",
+                         (session_id, bot_id, now))
+            with self._lock:
+                self._created += 1
+                prune = self._created % PRUNE_EVERY == 0
+            if prune:
+                self._prune(conn, now)
+        return session_id
+
+    def history(self, session_id):
+        row = self.shared.connect().execute(
+            "SELECT summary, recent FROM sessions WHERE session_id = ? AND last_seen >= ?",
+            (session_id, time.time() - self.idle_ttl),
+        ).fetchone()
+        if row is None:
+            return []
+        return history_with_summary(row[0], json.loads(row[1]))
+
+    def record_turn(self, session_id, message, answer):
+        try:
+            with self.shared.transaction() as conn:
+                row = conn.execute("SELECT summary, recent FROM sessions WHERE session_id = ?",
+                                   (session_id,)).fetchone()
+                if row is None:
+                    return
+                messages = json.loads(row[1]) + [
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": answer},
+                ]
+                summary, recent = compact_history(messages, row[0], self.window)
+                conn.execute("UPDATE sessions SET summary = ?, recent = ?, last_seen = ? WHERE session_id = ?",
+                             (summary, json.dumps(recent), time.time(), session_id))
+        except sqlite3.Error as e:
+            logger.error("Failed to record a turn of session %s: %s", session_id, e)
+
+    def count(self):
+        return self.shared.connect().execute(
+            "SELECT COUNT(*) FROM sessions WHERE last_seen >= ?", (time.time() - self.idle_ttl,)
+        ).fetchone()[0]
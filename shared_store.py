@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# === Shared store settings ===
+DB_PATH = os.environ.get("SARTHI_DB_PATH", os.path.join("chatbots", "sarthi.db"))
+BUSY_TIMEOUT_MS = 5000  # How long a writer waits for another process's write lock
+MMAP_BYTES = 256 * 1024 * 1024  # Reads come straight from the OS page cache, shared by all workers
+CACHE_KIB = 2048  # SQLite's private page cache per connection, kept small on purpose
+
+LEASES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+# === SQLite database shared by the worker processes of one host ===
+# WAL mode lets every worker read while one of them writes, and with
+# mmap_size set the database pages are mapped rather than copied into each
+# process, so adding workers does not add copies of the scraped pages.
+# Modules register their tables with add_schema(); connections are opened
+# per thread and per process, so a forked worker never reuses its parent's.
+class SharedStore:
+    def __init__(self, path=DB_PATH, mmap_bytes=MMAP_BYTES, cache_kib=CACHE_KIB):
+        self.path = path
+        self.mmap_bytes = mmap_bytes
+        self.cache_kib = cache_kib
+        self._schemas = [LEASES_SCHEMA]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ready_pid = None  # Process that last created the tables
+
+    def add_schema(self, sql):
+        with self._lock:
+            if sql not in self._schemas:
+                self._schemas.append(sql)
+                self._ready_pid = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; writes that must be atomic go through transaction()
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_bytes}")
+        conn.execute(f"PRAGMA cache_size=-{self.cache_kib}")
+        return conn
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._open()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        if self._ready_pid != os.getpid():
+            with self._lock:
+                if self._ready_pid != os.getpid():
+                    for sql in self._schemas:
+                        conn.executescript(sql)
+                    self._ready_pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers
+        # updating the same rows queue up instead of failing mid-way
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # --- Host-wide leases ---
+    # A lease lets one worker do a job (e.g. refresh a bot's pages) that the
+    # others would otherwise all repeat; it expires if the holder dies.
+    def try_lease(self, name, seconds):
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                         (name, os.getpid(), now + seconds))
+        return True
+
+    def release_lease(self, name):
+        self.connect().execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, os.getpid()))
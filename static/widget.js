@@ -0,0 +1,242 @@
+// Your Sarthi chat widget
+// Served by the bot servers as /widget/sarthi-widget.<hash>.js and loaded by
+// the embed snippet (see widget.py), which passes the bot on its script tag:
+//   data-bot-id    the bot to talk to (required)
+//   data-api       base URL of the bot API (default: where this script came from)
+//   data-bot-name  shown in the header (default: the name from GET /bot/<id>)
+(function() {
+    const script = document.currentScript;
+    if (!script || !script.dataset.botId) return;
+
+    // Bot configuration
+    const botId = script.dataset.botId;
+    const apiUrl = (script.dataset.api || new URL(script.src).origin).replace(/\/+$/, '');
+    const botEndpoint = apiUrl + '/bot/' + encodeURIComponent(botId);
+    let botName = script.dataset.botName || 'Assistant';
+
+    // A busy server (429/503, or a stream error with retry_after before any
+    // answer text) is retried after the delay it asks for
+    const MAX_BUSY_RETRIES = 3;
+
+    // Chat history (shown locally; the server keeps the conversation)
+    let messageHistory = [];
+    let sessionId = null;
+
+    function element(tag, style, parent) {
+        const el = document.createElement(tag);
+        if (style) el.style.cssText = style;
+        if (parent) parent.appendChild(el);
+        return el;
+    }
+
+    function icon(size, path) {
+        return '<svg xmlns="http://www.w3.org/2000/svg" width="' + size + '" height="' + size +
+            '" fill="currentColor" viewBox="0 0 16 16"><path d="' + path + '"/></svg>';
+    }
+
+    // Elements
+    const container = element('div', 'position: fixed; bottom: 20px; right: 20px; z-index: 1000;');
+    const chatButton = element('div', 'background-color: #4a76fd; color: white; border-radius: 50%; width: 60px; height: 60px; ' +
+        'display: flex; justify-content: center; align-items: center; cursor: pointer; box-shadow: 0 4px 8px rgba(0,0,0,0.2);', container);
+    chatButton.innerHTML = icon(30, 'M8 15c4.418 0 8-3.134 8-7s-3.582-7-8-7-8 3.134-8 7c0 1.76.743 3.37 1.97 4.6-.097 1.016-.417 2.13-.771 2.966-.079.186.074.394.273.362 2.256-.37 3.597-.938 4.18-1.234A9.06 9.06 0 0 0 8 15z');
+
+    // Chat Window (hidden by default)
+    const chatWindow = element('div', 'display: none; position: absolute; bottom: 80px; right: 0; width: 350px; height: 450px; ' +
+        'background-color: white; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.2); overflow: hidden; flex-direction: column;', container);
+    const header = element('div', 'background-color: #4a76fd; color: white; padding: 15px; display: flex; justify-content: space-between; align-items: center;', chatWindow);
+    const title = element('div', '', header);
+    title.textContent = botName;
+    const closeChat = element('div', 'cursor: pointer;', header);
+    closeChat.textContent = '✖';
+    const chatMessages = element('div', 'flex-grow: 1; overflow-y: auto; padding: 15px; display: flex; flex-direction: column;', chatWindow);
+    const inputArea = element('div', 'padding: 15px; border-top: 1px solid #e0e0e0; display: flex;', chatWindow);
+    const chatInput = element('input', 'flex-grow: 1; padding: 10px; border: 1px solid #e0e0e0; border-radius: 20px; margin-right: 10px;', inputArea);
+    chatInput.type = 'text';
+    chatInput.placeholder = 'Type your message...';
+    const sendButton = element('button', 'background-color: #4a76fd; color: white; border: none; border-radius: 50%; width: 40px; height: 40px; cursor: pointer;', inputArea);
+    sendButton.innerHTML = icon(16, 'M15.854.146a.5.5 0 0 1 .11.54l-5.819 14.547a.75.75 0 0 1-1.329.124l-3.178-4.995L.643 7.184a.75.75 0 0 1 .124-1.33L15.314.037a.5.5 0 0 1 .54.11v-.001z');
+
+    // Toggle chat window
+    chatButton.addEventListener('click', () => {
+        chatWindow.style.display = 'flex';
+        chatButton.style.display = 'none';
+    });
+
+    closeChat.addEventListener('click', () => {
+        chatWindow.style.display = 'none';
+        chatButton.style.display = 'flex';
+    });
+
+    // Create a message bubble in the chat
+    function createBubble(content, isUser) {
+        const messageDiv = element('div', 'max-width: 70%; margin-bottom: 10px; align-self: ' + (isUser ? 'flex-end' : 'flex-start') + ';', chatMessages);
+        const bubble = element('div', 'padding: 10px 15px; border-radius: 18px; box-shadow: 0 1px 2px rgba(0,0,0,0.1); white-space: pre-wrap; ' +
+            'background-color: ' + (isUser ? '#dcf8c6' : '#f1f0f0') + ';', messageDiv);
+        bubble.textContent = content;
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+        return bubble;
+    }
+
+    // Add a message to the chat
+    function addMessage(content, isUser) {
+        createBubble(content, isUser);
+        messageHistory.push({role: isUser ? 'user' : 'assistant', content: content});
+    }
+
+    // Typing indicator
+    let typing = null;
+
+    function removeTyping() {
+        if (typing) {
+            chatMessages.removeChild(typing.parentNode);
+            typing = null;
+        }
+    }
+
+    function busyError(seconds) {
+        const error = new Error('Server busy');
+        error.busy = true;
+        error.retryAfter = Math.min(Math.max(isNaN(seconds) ? 5 : seconds, 1), 60);
+        return error;
+    }
+
+    // Send message
+    function sendMessage() {
+        const message = chatInput.value.trim();
+        if (!message) return;
+
+        // Add user message
+        addMessage(message, true);
+        chatInput.value = '';
+
+        removeTyping();
+        typing = createBubble('Typing...', false);
+
+        // Stream the answer and render tokens as they arrive
+        let answer = '';
+        let answerBubble = null;
+
+        function handleEvent(raw) {
+            let eventName = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) return;
+            const payload = JSON.parse(data);
+            if (eventName === 'error') {
+                if (payload.retry_after && !answer) throw busyError(parseInt(payload.retry_after, 10));
+                throw new Error(payload.error);
+            }
+            if (eventName === 'session') {
+                sessionId = payload.session_id;
+                return;
+            }
+            if (eventName === 'done') {
+                answer = payload.response;
+            } else if (payload.delta) {
+                answer += payload.delta;
+            }
+            if (!answerBubble) {
+                removeTyping();
+                answerBubble = createBubble('', false);
+            }
+            answerBubble.textContent = answer;
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
+
+        function request() {
+            return fetch(botEndpoint + '/stream', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    message: message,
+                    session_id: sessionId
+                })
+            })
+            .then(response => {
+                if (response.status === 429 || response.status === 503) {
+                    throw busyError(parseInt(response.headers.get('Retry-After'), 10));
+                }
+                if (!response.ok || !response.body) throw new Error('HTTP ' + response.status);
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+
+                function pump() {
+                    return reader.read().then(({done, value}) => {
+                        if (done) return;
+                        buffer += decoder.decode(value, {stream: true});
+                        let boundary;
+                        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                            handleEvent(buffer.slice(0, boundary));
+                            buffer = buffer.slice(boundary + 2);
+                        }
+                        return pump();
+                    });
+                }
+                return pump();
+            });
+        }
+
+        function attempt(number) {
+            return request().catch(error => {
+                if (!error.busy || answer || number >= MAX_BUSY_RETRIES) throw error;
+                if (typing) typing.textContent = 'The assistant is busy, retrying in ' + error.retryAfter + 's...';
+                return new Promise(resolve => setTimeout(resolve, error.retryAfter * 1000)).then(() => {
+                    if (typing) typing.textContent = 'Typing...';
+                    return attempt(number + 1);
+                });
+            });
+        }
+
+        attempt(0)
+        .then(() => {
+            removeTyping();
+            if (!answerBubble) createBubble(answer, false);
+            messageHistory.push({role: 'assistant', content: answer});
+        })
+        .catch(error => {
+            removeTyping();
+            addMessage(error.busy
+                ? 'Sorry, the assistant is busy right now. Please try again in a moment.'
+                : 'Sorry, there was an error connecting to the server. Please try again later.', false);
+            console.error('Error:', error);
+        });
+    }
+
+    // Event listeners
+    sendButton.addEventListener('click', sendMessage);
+    chatInput.addEventListener('keypress', (e) => {
+        if (e.key === 'Enter') sendMessage();
+    });
+
+    function greet() {
+        addMessage("Hello! I'm your " + botName + " assistant. How can I help you today?", false);
+    }
+
+    function mount() {
+        document.body.appendChild(container);
+        if (script.dataset.botName) {
+            setTimeout(greet, 500);
+            return;
+        }
+        // Bot metadata is cached by the browser and revalidated with ETags
+        fetch(botEndpoint)
+            .then(response => response.ok ? response.json() : {})
+            .then(data => {
+                if (data.name) {
+                    botName = data.name;
+                    title.textContent = botName;
+                }
+            })
+            .catch(() => {})
+            .then(greet);
+    }
+
+    if (document.body) mount();
+    else document.addEventListener('DOMContentLoaded', mount);
+})();
@@ -0,0 +1,297 @@
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# === Telemetry settings ===
+LOG_LEVEL = os.environ.get("SARTHI_LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("SARTHI_LOG_SAMPLE_RATE", "1.0"))  # Share of DEBUG/INFO lines kept
+TRACE_SAMPLE_RATE = float(os.environ.get("SARTHI_TRACE_SAMPLE_RATE", "0.1"))  # Share of request traces logged
+SLOW_REQUEST_SECONDS = 10  # Traces slower than this are always logged
+METRICS_DIR = os.environ.get("SARTHI_METRICS_DIR")  # Shared by worker processes, see flush_metrics
+FLUSH_INTERVAL = 5
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# === Leveled, sampled logging ===
+# Warnings and errors are always written; DEBUG and INFO lines are kept at
+# LOG_SAMPLE_RATE so a busy server is not slowed down by its own logs.
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+_logging_configured = False
+
+def configure_logging(level=LOG_LEVEL, sample_rate=LOG_SAMPLE_RATE):
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(SamplingFilter(sample_rate))
+    root = logging.getLogger("sarthi")
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+
+def get_logger(name):
+    configure_logging()
+    return logging.getLogger(f"sarthi.{name}")
+
+logger = get_logger("trace")
+
+
+# === Metrics (Prometheus text format) ===
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [count per bucket..., sum, count]
+_gauges = {}  # name -> (kind, help, callback, merge)
+_help = {}  # name -> (kind, help)
+_metrics_lock = threading.Lock()
+
+def describe(name, kind, help_text):
+    _help[name] = (kind, help_text)
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(labels))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    key = (name, _labels(labels))
+    with _metrics_lock:
+        buckets = _histograms.get(key)
+        if buckets is None:
+            buckets = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+        buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        buckets[-2] += value
+        buckets[-1] += 1
+
+def register_gauge(name, help_text, callback, kind="gauge", merge="sum"):
+    # callback() is read at scrape time; kind="counter" for running totals
+    # kept elsewhere, such as the answer cache's hit count. Values of several
+    # workers are added up; merge="max" for values every worker reads from
+    # the same shared store, which would otherwise be counted once per worker
+    _gauges[name] = (kind, help_text, callback, merge)
+
+def _snapshot():
+    with _metrics_lock:
+        counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, list(labels), list(buckets)] for (name, labels), buckets in _histograms.items()]
+    gauges = []
+    for name, (kind, help_text, callback, merge) in list(_gauges.items()):
+        try:
+            gauges.append([name, [], float(callback())])
+        except Exception as e:
+            logger.warning("Gauge %s failed: %s", name, e)
+    return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+# --- Several worker processes ---
+# With SARTHI_METRICS_DIR set, every process writes its snapshot there
+# every FLUSH_INTERVAL seconds and /metrics adds up all snapshots, so any
+# worker can answer a scrape. Files of exited workers are kept so counters
+# never go backwards; the launcher empties the directory on start.
+def flush_metrics():
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+
+_flusher = None
+
+def start_metrics_flusher():
+    global _flusher
+    if not METRICS_DIR or _flusher is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                flush_metrics()
+            except OSError as e:
+                logger.warning("Could not write metrics snapshot: %s", e)
+
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _flusher = threading.Thread(target=run, name="metrics-flush", daemon=True)
+    _flusher.start()
+
+def _collect():
+    if not METRICS_DIR:
+        return [_snapshot()]
+    flush_metrics()
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def _format_labels(labels, extra=()):
+    pairs = [f'{key}="{value}"' for key, value in list(labels) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def render_metrics():
+    counters, histograms, gauges = {}, {}, {}
+    for snapshot in _collect():
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(buckets))
+            for i, value in enumerate(buckets):
+                merged[i] += value
+        for name, labels, value in snapshot["gauges"]:
+            if name in _gauges and _gauges[name][3] == "max":
+                gauges[name] = max(gauges.get(name, value), value)
+            else:
+                gauges[name] = gauges.get(name, 0) + value
+
+    lines = []
+    described = set()
+
+    def header(name, kind):
+        if name in described:
+            return
+        described.add(name)
+        help_text = _help.get(name, (kind, ""))[1] or (_gauges[name][1] if name in _gauges else "")
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), buckets in sorted(histograms.items()):
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], buckets):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {buckets[-2]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {buckets[-1]}")
+    for name, value in sorted(gauges.items()):
+        header(name, _gauges[name][0] if name in _gauges else "gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+describe("sarthi_requests_total", "counter", "Bot API requests by route and outcome")
+describe("sarthi_request_seconds", "histogram", "Bot API request duration by route")
+describe("sarthi_stage_seconds", "histogram", "Time spent in each stage of a request")
+describe("sarthi_fetch_seconds", "histogram", "Page download and extraction time by outcome")
+describe("sarthi_fetch_bytes_total", "counter", "Bytes of page content downloaded")
+describe("sarthi_llm_upstream_seconds", "histogram", "Upstream LLM call duration (ttft or total)")
+describe("sarthi_llm_calls_total", "counter", "Upstream LLM calls by outcome")
+
+
+# === Per-request tracing ===
+# A trace is bound to the current context, so code deep in the request
+# (fetches, extraction, prompt building, the LLM call) records its stages
+# with stage()/record_stage() without the trace being passed around. Worker
+# threads see it when they are submitted with contextvars.copy_context().
+_current_trace = contextvars.ContextVar("sarthi_trace", default=None)
+
+class Trace:
+    def __init__(self, route, **fields):
+        self.route = route
+        self.fields = fields
+        self.started = time.perf_counter()
+        self.stages = {}  # stage -> seconds, summed over repeats
+        self.fetches = []
+        self.sampled = random.random() < TRACE_SAMPLE_RATE
+        self.finished = False
+        self._lock = threading.Lock()
+        _current_trace.set(self)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        observe("sarthi_stage_seconds", seconds, stage=name)
+
+    def record_fetch(self, url, seconds, status):
+        self.fetches.append({"url": url, "ms": round(seconds * 1000, 1), "status": status})
+
+    def finish(self, status="ok"):
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.started
+        if _current_trace.get() is self:
+            _current_trace.set(None)
+        inc("sarthi_requests_total", route=self.route, status=status)
+        observe("sarthi_request_seconds", total, route=self.route)
+        if self.sampled or status != "ok" or total >= SLOW_REQUEST_SECONDS:
+            logger.info(json.dumps({
+                "trace": self.route,
+                "status": status,
+                "total_ms": round(total * 1000, 1),
+                "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+                "fetches": self.fetches,
+                **self.fields,
+            }))
+
+def current_trace():
+    return _current_trace.get()
+
+def record_stage(name, seconds):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(name, seconds)
+    else:
+        observe("sarthi_stage_seconds", seconds, stage=name)
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def traced_events(trace, events):
+    # Finishes the trace when an SSE stream ends, as an error if it sent one
+    status = "ok"
+    try:
+        for event in events:
+            if event.startswith("event: error"):
+                status = "error"
+            yield event
+    except GeneratorExit:
+        status = "disconnected"
+        raise
+    finally:
+        trace.finish(status)
+
+async def atraced_events(trace, events):
+    status = "ok"
+    try:
+        async for event in events:
+            if event.startswith("event: error"):
+                status = "error"
+            yield event
+    except GeneratorExit:
+        status = "disconnected"
+        raise
+    finally:
+        trace.finish(status)
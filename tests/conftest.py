@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_store import SharedStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sarthi.db")
+
+
+@pytest.fixture
+def shared(db_path):
+    return SharedStore(db_path)
@@ -0,0 +1,104 @@
+import pytest
+
+import admission
+from admission import AdmissionController, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeGateway:
+    def __init__(self):
+        self.state = None
+
+    def overloaded(self, tenant=None):
+        return self.state
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def quota(rate=1, burst=3, max_in_flight=100):
+    return {"id": "bot", "quota": {"rate": rate, "burst": burst, "max_in_flight": max_in_flight}}
+
+
+def test_token_bucket_refills_up_to_burst(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take(clock.now) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(clock.now) == pytest.approx(0.5)
+    clock.now += 10
+    bucket.refill(clock.now)
+    assert bucket.tokens == 3
+
+
+def test_burst_then_rate_limited_with_retry_after(clock):
+    controller = AdmissionController()
+    config = quota(rate=1, burst=3)
+    for _ in range(3):
+        assert controller.admit("bot", config) is None
+        controller.release("bot")
+    rejection = controller.admit("bot", config)
+    assert rejection["status"] == 429 and rejection["retry_after"] == "1"
+    clock.now += 1
+    assert controller.admit("bot", config) is None
+
+
+def test_in_flight_limit_until_release(clock):
+    controller = AdmissionController()
+    config = quota(rate=0, max_in_flight=2)
+    assert controller.admit("bot", config) is None
+    assert controller.admit("bot", config) is None
+    assert controller.admit("bot", config)["status"] == 429
+    controller.release("bot")
+    assert controller.admit("bot", config) is None
+
+
+def test_workers_share_the_quota(clock):
+    controller = AdmissionController()
+    controller.share(3)
+    config = quota(rate=3, burst=3)
+    assert controller.admit("bot", config) is None
+    assert controller.admit("bot", config)["status"] == 429
+
+
+def test_saturated_gateway_gives_503_and_keeps_the_token(clock):
+    gateway = FakeGateway()
+    controller = AdmissionController(gateway)
+    config = quota(rate=1, burst=1)
+    gateway.state = ("busy", 5)
+    rejection = controller.admit("bot", config)
+    assert rejection["status"] == 503 and rejection["retry_after"] == "5"
+    gateway.state = None
+    assert controller.admit("bot", config) is None
+
+
+def test_eviction_skips_busy_bots_and_stays_bounded(clock):
+    controller = AdmissionController(max_tracked=3)
+    config = quota(rate=1, burst=2)
+    assert controller.admit("busy", config) is None  # Held, never released
+    for i in range(20):
+        clock.now += 5  # Earlier bots are back to a full bucket
+        assert controller.admit(f"bot{i}", config) is None
+        controller.release(f"bot{i}")
+    assert controller.stats()["tracked_bots"] == 3
+    assert "busy" in controller._buckets
+
+
+def test_recently_limited_bot_is_not_forgotten(clock):
+    controller = AdmissionController(max_tracked=1)
+    config = quota(rate=0.001, burst=1)
+    assert controller.admit("a", config) is None
+    controller.release("a")
+    assert controller.admit("b", config) is None
+    controller.release("b")
+    # a's bucket is still empty, so it was kept and a stays limited
+    assert controller.admit("a", config)["status"] == 429
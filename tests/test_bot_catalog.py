@@ -0,0 +1,74 @@
+import json
+
+from bot_catalog import BotCatalog
+
+
+def bot(bot_id, name, description="", created_at="2024-01-01T00:00:00"):
+    return {"id": bot_id, "name": name, "description": description, "created_at": created_at}
+
+
+def names(page):
+    configs, _ = page
+    return [config["name"] for config in configs]
+
+
+def test_create_is_first_come(shared, tmp_path):
+    catalog = BotCatalog(shared, str(tmp_path / "chatbots"))
+    assert catalog.create(bot("a", "Alpha"))
+    assert not catalog.create(bot("a", "Impostor"))
+    assert catalog.get("a")["name"] == "Alpha"
+    assert catalog.get("missing") is None
+    assert catalog.count() == 1
+
+
+def test_list_pages_and_sorts(shared, tmp_path):
+    catalog = BotCatalog(shared, str(tmp_path / "chatbots"))
+    for i, name in enumerate(["Charlie", "alpha", "Bravo", "Delta", "echo"]):
+        catalog.create(bot(f"b{i}", name, created_at=f"2024-01-0{i + 1}T00:00:00"))
+
+    configs, total = catalog.list(offset=0, limit=2)
+    assert total == 5
+    assert [config["name"] for config in configs] == ["echo", "Delta"]
+    assert names(catalog.list(offset=4, limit=2)) == ["Charlie"]
+    assert names(catalog.list(limit=10, sort="name", descending=False)) == ["alpha", "Bravo", "Charlie", "Delta", "echo"]
+    assert names(catalog.list(limit=2, descending=False)) == ["Charlie", "alpha"]
+
+
+def test_search_matches_every_word(shared, tmp_path):
+    catalog = BotCatalog(shared, str(tmp_path / "chatbots"))
+    catalog.create(bot("a", "Pizza Palace", "Orders and opening hours"))
+    catalog.create(bot("b", "Pizza Express", "Menu and delivery"))
+    catalog.create(bot("c", "Book Nook", "Opening hours of the library", created_at="2024-02-01T00:00:00"))
+
+    assert sorted(names(catalog.list(query="pizza"))) == ["Pizza Express", "Pizza Palace"]
+    assert names(catalog.list(query="pizza hours")) == ["Pizza Palace"]
+    assert names(catalog.list(query="hours")) == ["Book Nook", "Pizza Palace"]
+    # Terms shorter than a trigram fall back to LIKE
+    assert names(catalog.list(query="of")) == ["Book Nook"]
+    assert catalog.list(query="sushi") == ([], 0)
+
+
+def test_json_configs_are_imported_once(shared, tmp_path):
+    directory = tmp_path / "chatbots"
+    directory.mkdir()
+    (directory / "old.json").write_text(json.dumps(bot("old", "Old Bot")), encoding="utf-8")
+    (directory / "old.content.json").write_text("{}", encoding="utf-8")
+
+    catalog = BotCatalog(shared, str(directory))
+    assert [config["id"] for config in catalog.all()] == ["old"]
+
+    # Files added after the import are not picked up again
+    catalog.delete("old")
+    (directory / "late.json").write_text(json.dumps(bot("late", "Late Bot")), encoding="utf-8")
+    assert BotCatalog(shared, str(directory)).count() == 0
+
+
+def test_refresh_order(shared, tmp_path):
+    catalog = BotCatalog(shared, str(tmp_path / "chatbots"))
+    for bot_id in ("a", "b", "c"):
+        catalog.create(bot(bot_id, bot_id))
+    catalog.mark_refreshed("a", 100)
+    assert catalog.due_for_refresh(before=50, limit=10) == ["b", "c"]
+    assert catalog.due_for_refresh(before=200, limit=2) == ["b", "c"]
+    catalog.mark_refreshed("b", 10)
+    assert catalog.due_for_refresh(before=200, limit=10) == ["c", "b", "a"]
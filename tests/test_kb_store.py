@@ -0,0 +1,58 @@
+import sqlite3
+
+import retrieval
+from kb_store import KB_SCHEMA_VERSION, KnowledgeBaseStore
+from shared_store import SharedStore
+
+PAGES = {
+    "https://example.com/": "Welcome to Example.\nWe sell handmade pottery.",
+    "https://example.com/hours": "Opening hours\nMonday to Friday, 9am to 5pm.",
+}
+
+
+def schema_version(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return int(conn.execute("SELECT value FROM kb_meta WHERE key = 'schema_version'").fetchone()[0])
+    finally:
+        conn.close()
+
+
+def test_migration_replaces_the_old_index_table_once(tmp_path, db_path):
+    # A database written before schema versions existed
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE kb_indexes (bot_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    conn.execute("INSERT INTO kb_indexes VALUES ('old', '{}')")
+    conn.commit()
+    conn.close()
+
+    store = KnowledgeBaseStore(str(tmp_path), shared=SharedStore(db_path))
+    store.put_pages("bot", PAGES)
+    assert schema_version(db_path) == KB_SCHEMA_VERSION
+    conn = sqlite3.connect(db_path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(kb_indexes)")]
+    assert columns == ["bot_id", "version", "codec", "data"]
+    assert [row[0] for row in conn.execute("SELECT bot_id FROM kb_indexes")] == ["bot"]
+    conn.close()
+
+    # Opening the database again leaves the stored indexes alone
+    KnowledgeBaseStore(str(tmp_path), shared=SharedStore(db_path)).version("bot")
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM kb_indexes").fetchone()[0] == 1
+    conn.close()
+
+
+def test_workers_load_the_shared_index(tmp_path, db_path, monkeypatch):
+    first = KnowledgeBaseStore(str(tmp_path), shared=SharedStore(db_path))
+    first.put_pages("bot", PAGES)
+    built = first.get_index("bot", list(PAGES))
+
+    # A second worker neither re-chunks nor tokenizes the pages
+    retrieval._shared_chunks.clear()
+    monkeypatch.setattr(retrieval, "chunk_text", None)
+    monkeypatch.setattr(retrieval, "tokenize", None)
+    second = KnowledgeBaseStore(str(tmp_path), shared=SharedStore(db_path))
+    loaded = second.get_index("bot", list(PAGES))
+    assert loaded.version == built.version
+    assert loaded.chunk_count == built.chunk_count
+    assert loaded.df == built.df
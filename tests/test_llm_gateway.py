@@ -0,0 +1,49 @@
+import threading
+import time
+
+from llm_gateway import LLMGateway, prompt_key
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.prompts = []
+        self.release = threading.Event()
+
+    def create(self, model, messages, stream):
+        self.prompts.append(messages[-1]["content"])
+        self.release.wait(5)
+        return iter([])
+
+
+class FakeClient:
+    def __init__(self):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = FakeCompletions()
+
+
+def test_cancelled_queued_call_never_reaches_upstream():
+    gateway = LLMGateway(api_key="key", base_url="http://llm.invalid", model="m", max_concurrent=1)
+    client = FakeClient()
+    gateway._sync_client = lambda: client
+
+    first = gateway.stream([{"role": "user", "content": "first"}], "bot")
+    first_done = threading.Thread(target=lambda: list(first))
+    first_done.start()
+    while not client.chat.completions.prompts:
+        time.sleep(0.01)
+
+    # The second call waits for the only slot; its only listener goes away meanwhile
+    messages = [{"role": "user", "content": "second"}]
+    key = prompt_key(gateway.model, messages)
+    flight = gateway._join(gateway._flights, key, lambda: gateway._start_flight(key, messages, "bot", 1.0), "bot")
+    while not gateway.stats()["queued"]:
+        time.sleep(0.01)
+    gateway._leave(flight)
+    client.chat.completions.release.set()
+    first_done.join(5)
+
+    deadline = time.monotonic() + 5
+    while gateway.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert gateway.stats()["pending"] == 0
+    assert client.chat.completions.prompts == ["first"]
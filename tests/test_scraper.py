@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+import scraper
+
+
+@pytest.fixture(autouse=True)
+def host_limits(monkeypatch):
+    monkeypatch.setattr(scraper, "_host_limits", scraper.OrderedDict())
+    monkeypatch.setattr(scraper, "MAX_TRACKED_HOSTS", 4)
+
+
+def test_host_table_is_bounded():
+    for i in range(50):
+        with scraper._host_slot(f"https://site{i}.example/page", 2) as acquired:
+            assert acquired
+    assert len(scraper._host_limits) == 4
+    assert list(scraper._host_limits)[-1] == "site49.example"
+
+
+def test_hosts_in_use_are_not_evicted():
+    with scraper._host_slot("https://busy.example/", 1):
+        for i in range(20):
+            with scraper._host_slot(f"https://site{i}.example/", 1):
+                pass
+        assert "busy.example" in scraper._host_limits
+        # The cap still holds for the busy host
+        with scraper._host_slot("https://busy.example/other", 1, timeout=0.01) as acquired:
+            assert not acquired
+    # Once released it ages out like any other host
+    for i in range(4):
+        with scraper._host_slot(f"https://later{i}.example/", 1):
+            pass
+    assert list(scraper._host_limits) == [f"later{i}.example" for i in range(4)]
+
+
+def test_one_cap_per_host_whatever_per_host_callers_pass():
+    with scraper._host_slot("https://Example.com/a", 1):
+        with scraper._host_slot("https://example.com/b", 4, timeout=0.01) as acquired:
+            assert not acquired
+
+
+def test_cap_limits_concurrent_fetches():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fetch(url):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        threading.Event().wait(0.02)
+        with lock:
+            active[0] -= 1
+        return {"url": url, "status": 200, "text": "ok", "error": None}
+
+    urls = [f"https://example.com/{i}" for i in range(12)]
+    results = scraper.fetch_many(urls, fetch=fetch, per_host=3, max_workers=12)
+    assert len(results) == 12 and peak[0] == 3
+    assert scraper._host_limits["example.com"].users == 0
+
+
+def test_body_that_exactly_fills_the_limit_is_not_truncated():
+    body = scraper.PageBody({"Content-Type": "text/html; charset=utf-8"}, max_bytes=10)
+    assert body.feed(b"12345") and body.feed(b"67890")
+    assert not body.truncated and body.text() == "1234567890"
+    assert not body.feed(b"!")
+    assert body.truncated and body.text() == "1234567890"
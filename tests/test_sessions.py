@@ -0,0 +1,115 @@
+import pytest
+
+import sessions
+from shared_store import SharedStore
+from sessions import SessionStore, SharedSessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, "time", clock)
+    return clock
+
+
+def chat(store, session_id, turns):
+    for i in range(turns):
+        store.record_turn(session_id, f"question {i}", f"answer {i}")
+
+
+def test_workers_share_sessions(db_path):
+    # Two stores on one database stand in for two worker processes
+    first = SharedSessionStore(SharedStore(db_path))
+    second = SharedSessionStore(SharedStore(db_path))
+
+    session_id = first.open("bot")
+    first.record_turn(session_id, "What are your hours?", "9 to 5.")
+    assert second.open("bot", session_id) == session_id
+    assert second.history(session_id) == [
+        {"role": "user", "content": "What are your hours?"},
+        {"role": "assistant", "content": "9 to 5."},
+    ]
+
+    second.record_turn(session_id, "And on Sunday?", "Closed.")
+    assert [msg["content"] for msg in first.history(session_id)][-2:] == ["And on Sunday?", "Closed."]
+    assert first.count() == second.count() == 1
+
+
+def test_shared_session_is_per_bot(shared):
+    store = SharedSessionStore(shared)
+    session_id = store.open("bot")
+    assert store.open("other", session_id) != session_id
+
+
+def test_in_memory_store_keeps_working():
+    store = SessionStore()
+    session_id = store.open("bot")
+    store.record_turn(session_id, "Hi", "Hello!")
+    assert store.open("bot", session_id) == session_id
+    assert len(store.history(session_id)) == 2
+
+
+@pytest.mark.parametrize("shared_mode", [False, True])
+def test_idle_sessions_expire(clock, shared, shared_mode):
+    store = SharedSessionStore(shared, idle_ttl=60) if shared_mode else SessionStore(idle_ttl=60)
+    session_id = store.open("bot")
+    store.record_turn(session_id, "Hi", "Hello!")
+
+    clock.now += 59
+    assert store.open("bot", session_id) == session_id  # Still live, and kept alive
+    clock.now += 61
+    assert store.history(session_id) == []
+    assert store.open("bot", session_id) != session_id
+    assert store.count() == 1
+
+
+def test_in_memory_store_is_bounded(clock):
+    store = SessionStore(max_sessions=3)
+    ids = []
+    for _ in range(5):
+        clock.now += 1
+        ids.append(store.open("bot"))
+    assert store.count() == 3
+    assert store.open("bot", ids[0]) != ids[0]  # The least recently used went first
+    assert store.open("bot", ids[-1]) == ids[-1]
+
+
+def test_shared_store_is_pruned(clock, shared, monkeypatch):
+    monkeypatch.setattr(sessions, "PRUNE_EVERY", 2)
+    store = SharedSessionStore(shared, max_sessions=3)
+    for _ in range(6):
+        clock.now += 1
+        store.open("bot")
+    assert shared.connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 3
+
+
+@pytest.mark.parametrize("shared_mode", [False, True])
+def test_old_turns_are_compacted_into_the_summary(shared, shared_mode):
+    store = SharedSessionStore(shared) if shared_mode else SessionStore()
+    session_id = store.open("bot")
+    chat(store, session_id, 5)
+
+    summary, *recent = store.history(session_id)
+    assert summary["role"] == "system"
+    assert "Visitor: question 0" in summary["content"] and "Assistant: answer 1" in summary["content"]
+    assert "question 2" not in summary["content"]
+    assert [msg["content"] for msg in recent] == [
+        "question 2", "answer 2", "question 3", "answer 3", "question 4", "answer 4",
+    ]
+
+
+def test_summary_stays_capped():
+    store = SessionStore()
+    session_id = store.open("bot")
+    chat(store, session_id, 200)
+    summary = store.history(session_id)[0]["content"]
+    assert len(summary) < sessions.SUMMARY_CHARS + 100
+    assert "question 196" in summary and "question 0\n" not in summary
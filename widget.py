@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import html
+import json
+import os
+import re
+import threading
+
+try:
+    import brotli  # Optional: smaller downloads for browsers that accept br
+except ImportError:
+    brotli = None
+
+# === Widget settings ===
+WIDGET_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "widget.js")
+WIDGET_PREFIX = "/widget/"
+LOADER_NAME = "sarthi-widget.js"  # Stable URL used by the embed snippet
+BUNDLE_NAME_RE = re.compile(r"^sarthi-widget\.[0-9a-f]+\.js$")
+JS_CONTENT_TYPE = "application/javascript; charset=utf-8"
+JSON_CONTENT_TYPE = "application/json"
+
+# The bundle URL changes with its content, so browsers and CDNs may keep it
+# for a year; the loader decides how quickly pages pick up a new bundle
+BUNDLE_CACHE = "public, max-age=31536000, immutable"
+LOADER_CACHE = "public, max-age=300, stale-while-revalidate=86400"
+METADATA_CACHE = "public, max-age=60"  # Revalidated with its ETag after that
+MIN_COMPRESS_BYTES = 512  # Smaller bodies aren't worth the Content-Encoding
+
+# The loader is tiny: it only adds the hashed bundle, with the same data-*
+# attributes, next to itself
+LOADER_TEMPLATE = (
+    "(function(){var s=document.currentScript;if(!s)return;"
+    "var w=document.createElement('script');w.src=new URL('%s',s.src).href;w.async=true;"
+    "for(var k in s.dataset)w.dataset[k]=s.dataset[k];"
+    "(document.head||document.documentElement).appendChild(w);})();\n"
+)
+
+_assets = None  # file name -> asset, built on first use
+_assets_lock = threading.Lock()
+
+
+# === Conditional GET helpers ===
+def etag_for(body):
+    # Weak: the gzip, br and plain bodies of one asset share the tag
+    return 'W/"' + hashlib.sha256(body).hexdigest()[:20] + '"'
+
+def _opaque_tag(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match uses the weak comparison
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque_tag(etag) in [_opaque_tag(tag) for tag in if_none_match.split(",")]
+
+def accepted_encodings(accept_encoding):
+    # Codings the client accepts, ignoring those sent with q=0
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding.strip():
+            accepted.add(coding.strip())
+    return accepted
+
+
+# === Widget assets ===
+def _asset(body, cache_control, compress=True):
+    encodings = {}
+    if compress and len(body) >= MIN_COMPRESS_BYTES:
+        encodings["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            encodings["br"] = brotli.compress(body, quality=11)
+    return {"body": body, "etag": etag_for(body), "cache_control": cache_control, "encodings": encodings}
+
+def _build_assets():
+    with open(WIDGET_SOURCE, "rb") as f:
+        bundle = f.read()
+    bundle_name = f"sarthi-widget.{hashlib.sha256(bundle).hexdigest()[:12]}.js"
+    loader = (LOADER_TEMPLATE % bundle_name).encode("utf-8")
+    return {
+        "bundle_name": bundle_name,
+        bundle_name: _asset(bundle, BUNDLE_CACHE),
+        LOADER_NAME: _asset(loader, LOADER_CACHE, compress=False),
+        # Pages that still have an older loader get the current bundle,
+        # cached only briefly since it doesn't match their URL
+        "stale": _asset(bundle, LOADER_CACHE),
+    }
+
+def widget_assets():
+    # Compressed once per process; servers call this before forking so the
+    # workers share the result
+    global _assets
+    if _assets is None:
+        with _assets_lock:
+            if _assets is None:
+                _assets = _build_assets()
+    return _assets
+
+def bundle_name():
+    return widget_assets()["bundle_name"]
+
+
+# === Responses ===
+# Framework-neutral: each returns (status, body, headers) for the Flask and
+# FastAPI routes to wrap. request_headers is any case-insensitive mapping.
+def _respond(asset, request_headers, content_type):
+    headers = {"ETag": asset["etag"], "Cache-Control": asset["cache_control"]}
+    if asset["encodings"]:
+        headers["Vary"] = "Accept-Encoding"
+    if etag_matches(request_headers.get("If-None-Match"), asset["etag"]):
+        return 304, b"", headers
+    body = asset["body"]
+    accepted = accepted_encodings(request_headers.get("Accept-Encoding"))
+    for coding in ("br", "gzip"):
+        if coding in asset["encodings"] and coding in accepted:
+            body = asset["encodings"][coding]
+            headers["Content-Encoding"] = coding
+            break
+    headers["Content-Type"] = content_type
+    return 200, body, headers
+
+def widget_response(filename, request_headers):
+    # Returns None for files that aren't part of the widget
+    assets = widget_assets()
+    if filename in (LOADER_NAME, assets["bundle_name"]):
+        return _respond(assets[filename], request_headers, JS_CONTENT_TYPE)
+    if BUNDLE_NAME_RE.match(filename):
+        return _respond(assets["stale"], request_headers, JS_CONTENT_TYPE)
+    return None
+
+def bot_metadata_response(bot_id, config, request_headers):
+    # GET /bot/<bot_id>: repeat views of a page revalidate and get a 304
+    body = json.dumps({
+        "id": bot_id,
+        "name": config.get("name"),
+        "description": config.get("description"),
+    }).encode("utf-8")
+    return _respond(_asset(body, METADATA_CACHE, compress=False), request_headers, JSON_CONTENT_TYPE)
+
+
+# === Embed snippet ===
+def embed_snippet(bot_id, api_url, bot_name=None):
+    # The only markup a customer pastes; the widget itself comes from the
+    # cached loader and bundle
+    comment = ""
+    if bot_name:
+        comment = f"<!-- {html.escape(bot_name).replace('--', '- -')} Chatbot Widget -->\n"
+    src = f"{api_url.rstrip('/')}{WIDGET_PREFIX}{LOADER_NAME}"
+    return f'{comment}<script src="{html.escape(src)}" data-bot-id="{html.escape(bot_id)}" async></script>\n'